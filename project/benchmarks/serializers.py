@@ -0,0 +1,78 @@
+"""
+Micro-benchmark of the regular and the compiled read path of the hot serializers, on the test factories.
+
+Kept out of the test suite, run it from the project folder against a migrated database:
+    python -m benchmarks.serializers
+The rows it creates are rolled back.
+"""
+import os
+import timeit
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+import factory  # noqa: E402
+from django.contrib.auth.models import AnonymousUser  # noqa: E402
+from django.db import transaction  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from order.models import OrderItem  # noqa: E402
+from order.serializers import OrderItemSerializer  # noqa: E402
+from store.models import Product  # noqa: E402
+from store.serializers import ProductListSerializer  # noqa: E402
+from tests.test_order.factories import OrderFactory, OrderItemFactory  # noqa: E402
+from tests.test_store.factories import CategoryFactory, ProductFactory  # noqa: E402
+
+ROWS = 500
+REPEAT = 5
+
+
+def report(name, regular, compiled):
+    regular = min(timeit.repeat(regular, number=1, repeat=REPEAT))
+    compiled = min(timeit.repeat(compiled, number=1, repeat=REPEAT))
+    print(f'{name}: regular {regular * 1000:.1f} ms, compiled {compiled * 1000:.1f} ms, x{regular / compiled:.1f}')
+
+
+def bench_product_list_serializer():
+    category = CategoryFactory()
+    ProductFactory.create_batch(ROWS, category=category, name=factory.Sequence(lambda n: f'Bench product {n}'))
+    request = RequestFactory().get('/')
+    request.user = AnonymousUser()
+    context = {'request': request}
+    queryset = Product.objects.filter(category=category).order_by('id')
+
+    # A list of instances takes the regular path, a queryset the compiled one
+    report(
+        'ProductListSerializer',
+        lambda: ProductListSerializer(list(queryset), many=True, context=context).data,
+        lambda: ProductListSerializer(queryset, many=True, context=context).data,
+    )
+
+
+def bench_order_item_serializer():
+    order = OrderFactory()
+    products = ProductFactory.create_batch(ROWS, name=factory.Sequence(lambda n: f'Bench item product {n}'))
+    OrderItem.objects.bulk_create([
+        OrderItemFactory.build(order=order, product=product, price=product.price, discount_price=product.discount_price)
+        for product in products
+    ])
+    queryset = OrderItem.objects.filter(order=order)
+
+    report(
+        'OrderItemSerializer',
+        lambda: OrderItemSerializer(list(queryset), many=True).data,
+        lambda: OrderItemSerializer(queryset, many=True).data,
+    )
+
+
+def main():
+    with transaction.atomic():
+        bench_product_list_serializer()
+        bench_order_item_serializer()
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in milliseconds of the latency buckets of the metrics, the calls above go in a last bucket
+LATENCY_BUCKETS = (100, 300, 1000, 3000)
+BUCKET_NAMES = (*(f'lt_{bound}ms' for bound in LATENCY_BUCKETS), f'ge_{LATENCY_BUCKETS[-1]}ms')
+METRICS_WINDOW = 60
+METRICS_RETENTION = 60 * 60
+RETRY_STATUSES = (502, 503, 504)
+# The providers of the clients created, whose metrics are reported
+providers = set()
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """The provider failed too often lately, calls are refused until the circuit closes again"""
+
+
+def get_window():
+    return int(time.time()) // METRICS_WINDOW
+
+
+def get_metric_key(provider, window, name):
+    return f'core:http:{provider}:{window}:{name}'
+
+
+def increment(key, timeout, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=timeout)
+        return cache.incr(key, delta)
+
+
+def get_bucket_name(latency_ms):
+    for bound, name in zip(LATENCY_BUCKETS, BUCKET_NAMES):
+        if latency_ms < bound:
+            return name
+    return BUCKET_NAMES[-1]
+
+
+def record_call(provider, latency, error=False):
+    """Count a call of the provider in the current window of the shared metrics"""
+    window = get_window()
+    latency_ms = int(latency * 1000)
+    increment(get_metric_key(provider, window, 'calls'), METRICS_RETENTION)
+    increment(get_metric_key(provider, window, get_bucket_name(latency_ms)), METRICS_RETENTION)
+    increment(get_metric_key(provider, window, 'latency_ms'), METRICS_RETENTION, latency_ms)
+    if error:
+        increment(get_metric_key(provider, window, 'errors'), METRICS_RETENTION)
+
+
+def get_metrics(provider, minutes=15):
+    """Calls, errors, mean latency and latency histogram of the provider over the last minutes"""
+    current = get_window()
+    windows = range(current - max(minutes * 60 // METRICS_WINDOW, 1) + 1, current + 1)
+    names = ['calls', 'errors', 'latency_ms', *BUCKET_NAMES]
+    values = cache.get_many([get_metric_key(provider, window, name) for window in windows for name in names])
+    totals = {name: sum(values.get(get_metric_key(provider, window, name), 0) for window in windows)
+              for name in names}
+    calls = totals['calls']
+    return {
+        'calls': calls,
+        'errors': totals['errors'],
+        'error_rate': round(totals['errors'] / calls, 4) if calls else 0,
+        'mean_latency_ms': round(totals['latency_ms'] / calls) if calls else None,
+        'latency_buckets': {name: totals[name] for name in BUCKET_NAMES},
+        'circuit_open': CircuitBreaker(provider).is_open(),
+    }
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold failures in a row, shared by every process through the cache, and refuses
+    the calls for reset_timeout seconds. Then calls go through again, the next failures open it anew.
+    """
+
+    def __init__(self, provider, failure_threshold=5, reset_timeout=30):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    @property
+    def failures_key(self):
+        return f'core:http:{self.provider}:circuit:failures'
+
+    @property
+    def open_key(self):
+        return f'core:http:{self.provider}:circuit:open'
+
+    def is_open(self):
+        return cache.get(self.open_key) is not None
+
+    def record_success(self):
+        cache.delete(self.failures_key)
+
+    def record_failure(self):
+        if increment(self.failures_key, self.reset_timeout * 10) >= self.failure_threshold:
+            logger.warning(f'Circuit of {self.provider} opened for {self.reset_timeout}s')
+            cache.set(self.open_key, time.time(), timeout=self.reset_timeout)
+            cache.delete(self.failures_key)
+
+
+class IntegrationClient:
+    """
+    HTTP client of a third party provider: a pooled keep-alive session per thread, connect and read timeouts,
+    retries with jittered backoff, a circuit breaker and latency and error metrics in the cache.
+
+    Requests that may have reached the provider are only retried when it is idempotent, failed connections always.
+    """
+
+    def __init__(self, provider, timeout=(3.05, 10), retries=2, backoff=0.5, idempotent=True, pool_size=10,
+                 failure_threshold=5, reset_timeout=30):
+        self.provider = provider
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.idempotent = idempotent
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(provider, failure_threshold, reset_timeout)
+        self._local = threading.local()
+        providers.add(provider)
+
+    @property
+    def session(self):
+        # Sessions are not shared between threads, each keeps its own pool of connections
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._local.session = session
+        return session
+
+    def get_retry_delay(self, attempt):
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    @staticmethod
+    def is_connection_failure(exc):
+        """Whether the connection could not be made, the request never reached the provider"""
+        if isinstance(exc, requests.ConnectTimeout):
+            return True
+        # requests wraps the urllib3 error, in a MaxRetryError when the connection failed
+        reason = exc.args[0] if isinstance(exc, requests.ConnectionError) and exc.args else None
+        return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+    def is_retryable(self, exc=None, response=None):
+        if self.is_connection_failure(exc):
+            return True
+        # A connection dropped once the request was sent may have reached the provider
+        return self.idempotent and (isinstance(exc, (requests.ConnectionError, requests.Timeout)) or (
+            response is not None and response.status_code in RETRY_STATUSES
+        ))
+
+    def send(self, method, url, **kwargs):
+        """One attempt, recorded in the metrics and the circuit breaker"""
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            record_call(self.provider, time.monotonic() - start, error=True)
+            self.breaker.record_failure()
+            raise
+        error = response.status_code >= 500
+        record_call(self.provider, time.monotonic() - start, error=error)
+        if error:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def request(self, method, url, **kwargs):
+        for attempt in range(self.retries + 1):
+            if self.breaker.is_open():
+                raise CircuitOpenError(f'The circuit of {self.provider} is open')
+            is_last = attempt == self.retries
+            try:
+                response = self.send(method, url, **kwargs)
+            except requests.RequestException as exc:
+                if is_last or not self.is_retryable(exc=exc):
+                    raise
+            else:
+                if is_last or not self.is_retryable(response=response):
+                    return response
+            time.sleep(self.get_retry_delay(attempt))
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    async def request_async(self, method, url, **kwargs):
+        """The request run in a worker thread, for async code, with the pooled session of that thread"""
+        return await asyncio.to_thread(self.request, method, url, **kwargs)
+
+    async def post_async(self, url, **kwargs):
+        return await self.request_async('POST', url, **kwargs)
@@ -0,0 +1,188 @@
+import copy
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.db.models.query import ModelIterable
+from rest_framework import relations, serializers
+
+from core.serializers import CompiledListSerializer
+
+
+def query_hints(only=(), select_related=(), prefetch_related=()):
+    """
+    Declare what a SerializerMethodField method reads from the instance besides its primary key: model fields,
+    relations loaded whole and relations to prefetch, relative to the model of the serializer. Each may also be
+    a callable of the request returning them, e.g. for a prefetch filtered by the user.
+    The fields of a model read by a method without hints are left unrestricted.
+    """
+    def decorator(method):
+        method.query_hints = {'only': only, 'select_related': select_related, 'prefetch_related': prefetch_related}
+        return method
+
+    return decorator
+
+
+def join(prefix, name):
+    return f'{prefix}__{name}' if prefix else name
+
+
+class QueryPlan:
+    """The relations and fields a serializer reads, collected per relation path, '' being the model of the queryset"""
+
+    def __init__(self, model, request=None):
+        self.model = model
+        self.request = request
+        self.only = {'': set()}
+        self.unrestricted = set()
+        self.select_related = set()
+        self.prefetch_related = {}
+
+    def resolve(self, hint):
+        return hint(self.request) if callable(hint) else hint
+
+    def add_serializer(self, serializer, model, prefix=''):
+        for field in serializer._readable_fields:
+            if isinstance(field, serializers.SerializerMethodField):
+                self.add_hints(getattr(serializer, field.method_name), model, prefix)
+            elif field.source == '*':
+                if isinstance(field, serializers.BaseSerializer):
+                    self.add_serializer(field, model, prefix)
+                else:
+                    self.unrestricted.add(prefix)
+            else:
+                self.add_source(field.source_attrs, model, prefix, field)
+
+    def add_hints(self, method, model, prefix):
+        hints = getattr(method, 'query_hints', None)
+        if hints is None:
+            self.unrestricted.add(prefix)
+            return
+        for name in self.resolve(hints['only']):
+            self.add_source(name.split('__'), model, prefix)
+        for name in self.resolve(hints['select_related']):
+            self.add_source(name.split('__'), model, prefix)
+        for lookup in self.resolve(hints['prefetch_related']):
+            if isinstance(lookup, Prefetch):
+                if prefix:
+                    lookup = copy.copy(lookup)
+                    lookup.add_prefix(prefix)
+                self.prefetch_related[lookup.prefetch_to] = lookup
+            else:
+                self.prefetch_related.setdefault(join(prefix, lookup), join(prefix, lookup))
+
+    def add_source(self, names, model, prefix, field=None):
+        """
+        Follow the source of a field through the model: single relations are joined, multiple ones prefetched.
+        Without a field, a relation at the end of the source is loaded whole.
+        """
+        for index, name in enumerate(names):
+            try:
+                model_field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # A property or a method, it may read any field
+                self.unrestricted.add(prefix)
+                return
+            path = join(prefix, name)
+            is_last = index == len(names) - 1
+            if not model_field.is_relation:
+                self.only[prefix].add(name)
+                return
+            if model_field.one_to_many or model_field.many_to_many:
+                self.add_prefetch(path, model_field, field if is_last else None)
+                return
+            if model_field.concrete:
+                self.only[prefix].add(name)
+            if is_last and isinstance(field, relations.RelatedField) and field.use_pk_only_optimization():
+                # Only the key is read, it is loaded with the instance
+                return
+            self.select_related.add(path)
+            self.only.setdefault(path, set())
+            if is_last:
+                if isinstance(field, serializers.BaseSerializer):
+                    self.add_serializer(field, model_field.related_model, path)
+                else:
+                    self.unrestricted.add(path)
+                return
+            model, prefix = model_field.related_model, path
+
+    def add_prefetch(self, path, model_field, field):
+        if isinstance(field, CompiledListSerializer):
+            # The compiled read path queries the rows itself
+            return
+        if not isinstance(field, serializers.ListSerializer):
+            self.prefetch_related.setdefault(path, path)
+            return
+        related_model = model_field.related_model
+        # The related objects are matched to the instances by the key pointing back at them
+        extra = (model_field.field.name,) if model_field.one_to_many else ()
+        queryset = plan_queryset(related_model._default_manager.all(), field.child, self.request, extra)
+        self.prefetch_related[path] = Prefetch(path, queryset=queryset)
+
+    def add_select_related(self, select_related, prefix=''):
+        """Keep the relations the queryset already joins, loaded whole"""
+        for name, nested in select_related.items():
+            names = [*prefix.split('__'), name] if prefix else [name]
+            self.add_source(names, self.model, '')
+            self.add_select_related(nested, join(prefix, name))
+
+    def is_restricted(self, path):
+        parts = path.split('__') if path else []
+        return not any('__'.join(parts[:length]) in self.unrestricted for length in range(len(parts) + 1))
+
+    def get_only(self, extra=()):
+        if not self.is_restricted(''):
+            return None
+        only = {*self.only[''], *extra}
+        for path, names in self.only.items():
+            if path and self.is_restricted(path):
+                only.update(join(path, name) for name in names or ('pk',))
+        return sorted(only)
+
+    def apply(self, queryset, extra=()):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related.values())
+        only = self.get_only(extra)
+        if only is not None:
+            queryset = queryset.only(*only)
+        return queryset
+
+
+def can_optimize(queryset):
+    query = queryset.query
+    return (
+        issubclass(queryset._iterable_class, ModelIterable)
+        and query.select_related is not True
+        and query.deferred_loading == (frozenset(), True)
+    )
+
+
+def plan_queryset(queryset, serializer, request=None, extra=()):
+    if not can_optimize(queryset):
+        return queryset
+    plan = QueryPlan(queryset.model, request)
+    if queryset.query.select_related:
+        plan.add_select_related(queryset.query.select_related)
+    plan.add_serializer(serializer, queryset.model)
+    return plan.apply(queryset, extra)
+
+
+def optimize_queryset(queryset, serializer_class, *extra, request=None):
+    """
+    Add the select_related(), prefetch_related() and only() the serializer needs to the queryset,
+    derived from its readable fields, nested serializers and the query hints of its method fields.
+    extra are the model fields the caller reads besides the serializer's.
+    """
+    serializer = serializer_class(context={'request': request})
+    return plan_queryset(queryset, serializer, request, extra)
+
+
+class OptimizedQuerysetMixin:
+    """Optimizes the queryset of a generic view for its serializer"""
+    # Model fields the view reads itself, e.g. in the object permissions
+    query_fields = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return optimize_queryset(queryset, self.get_serializer_class(), *self.query_fields, request=self.request)
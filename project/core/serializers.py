@@ -0,0 +1,220 @@
+from django.db import models
+from rest_framework import relations, serializers
+from rest_framework.settings import api_settings
+
+# Fields whose to_representation returns the value read from the database unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    relations.PrimaryKeyRelatedField,
+)
+
+
+def parse_field_paths(value):
+    """Comma separated dotted paths as a tree, e.g. 'id,options.name' to {'id': {}, 'options': {'name': {}}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in filter(None, (name.strip() for name in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def is_row(value):
+    return isinstance(value, tuple) and hasattr(value, '_fields')
+
+
+def get_file_converter(field, model_field):
+    storage = model_field.storage
+    use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+    request = field.context.get('request')
+
+    def convert(name):
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = storage.url(name)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    return convert
+
+
+def compile_representation(field_names, kinds, positions):
+    """
+    Generate a function building the representation of a row: passthrough values are read by their position
+    in the row, the other fields go through their converter c<index>
+    """
+    items = []
+    converters = []
+    for index, (name, kind, position) in enumerate(zip(field_names, kinds, positions)):
+        value = f'row[{position}]'
+        if kind == 'passthrough':
+            expression = value
+        elif kind == 'convert':
+            expression = f'None if {value} is None else c{index}({value})'
+        elif kind == 'file':
+            expression = f'c{index}({value})'
+        else:
+            expression = f'c{index}(row)'
+        if kind != 'passthrough':
+            converters.append(f'c{index}')
+        items.append(f'        {name!r}: {expression},')
+    source = '\n'.join([
+        f'def make_representation({", ".join(converters)}):',
+        '    def to_representation(row):',
+        '        return {',
+        *items,
+        '        }',
+        '    return to_representation',
+    ])
+    namespace = {}
+    exec(compile(source, '<compiled serializer>', 'exec'), namespace)
+    return namespace['make_representation']
+
+
+class CompiledListSerializer(serializers.ListSerializer):
+    """Serializes querysets and value rows with the compiled read path of the child, model instances as usual"""
+
+    def to_representation(self, data):
+        if isinstance(data, (models.Manager, models.QuerySet)):
+            data = self.child.get_rows(data.all())
+        elif not data or not is_row(data[0]):
+            return super().to_representation(data)
+        self.child.prepare_rows(data)
+        to_representation = self.child.get_row_representation()
+        return [to_representation(row) for row in data]
+
+
+class CompiledSerializerMixin:
+    """
+    Read path for hot ModelSerializers, serializing named rows of queryset.values_list() instead of model instances.
+
+    A to_representation is generated once per class from the readable fields. Model fields are read by index and
+    converted by the bound field's own to_representation, so the output is the same as that of the regular path.
+    A SerializerMethodField needs a get_<name>_from_row(row) method, reading the row fields by attribute;
+    the model fields these methods read besides the serializer's own go in row_fields.
+    """
+    row_fields = ()
+
+    def get_compiled(self):
+        # Compiled once per class and set of fields, which the field selection of the request may trim
+        fields = list(self._readable_fields)
+        names = tuple(field.field_name for field in fields)
+        cls = self.__class__
+        if '_compiled' not in cls.__dict__:
+            cls._compiled = {}
+        if names not in cls._compiled:
+            kinds = [self.get_field_kind(field) for field in fields]
+            sources = [field.source for field, kind in zip(fields, kinds) if kind != 'method']
+            row_names = list(dict.fromkeys([*sources, *self.row_fields]))
+            positions = [None if kind == 'method' else row_names.index(field.source)
+                         for field, kind in zip(fields, kinds)]
+            cls._compiled[names] = (compile_representation(names, kinds, positions), kinds, row_names)
+        return cls._compiled[names]
+
+    @classmethod
+    def get_field_kind(cls, field):
+        if isinstance(field, serializers.SerializerMethodField):
+            return 'method'
+        if '.' in field.source or field.source == '*':
+            raise TypeError(f'{cls.__name__}.{field.field_name}: only model field sources can be compiled')
+        if isinstance(field, serializers.FileField):
+            return 'file'
+        if isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is not None:
+            return 'convert'
+        if isinstance(field, PASSTHROUGH_FIELDS) and not isinstance(field, serializers.ChoiceField):
+            return 'passthrough'
+        return 'convert'
+
+    def get_row_names(self, *extra):
+        row_names = self.get_compiled()[2]
+        return [*row_names, *(name for name in extra if name not in row_names)]
+
+    def get_rows(self, queryset, *extra):
+        """The rows of the queryset to serialize, with the extra fields the caller needs appended"""
+        return list(queryset.prefetch_related(None).values_list(*self.get_row_names(*extra), named=True))
+
+    def prepare_rows(self, rows):
+        """Hook loading whatever the method fields need for the rows at once"""
+
+    def get_row_representation(self):
+        make_representation, kinds, _ = self.get_compiled()
+        converters = []
+        for field, kind in zip(self._readable_fields, kinds):
+            if kind == 'method':
+                converters.append(getattr(self, f'{field.method_name}_from_row'))
+            elif kind == 'file':
+                converters.append(get_file_converter(field, self.Meta.model._meta.get_field(field.source)))
+            elif kind == 'convert':
+                converters.append(field.to_representation)
+        return make_representation(*converters)
+
+    def to_representation(self, instance):
+        if is_row(instance):
+            self.prepare_rows([instance])
+            return self.get_row_representation()(instance)
+        return super().to_representation(instance)
+
+
+class SparseFieldsMixin:
+    """
+    Trims the fields to those named in the fields query param of the request, or drops those named in omit.
+    Fields of nested serializers are named by dotted paths, e.g. fields=id,options.name.
+    The Meta.optional_fields are left out unless named in fields.
+
+    The fields left out are not bound at all, so their method fields are not run and the queryset optimizer
+    does not load what they read.
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+
+    def get_field_path(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            if not isinstance(node.parent, serializers.ListSerializer):
+                path.append(node.field_name)
+            node = node.parent
+        return path[::-1]
+
+    def get_field_selection(self, param):
+        """The tree of paths in the query param below this serializer, None when the param does not reach it"""
+        request = self.context.get('request')
+        if request is None:
+            return None
+        # Serializers are given plain Django requests too
+        value = getattr(request, 'query_params', request.GET).get(param)
+        if value is None:
+            return None
+        tree = parse_field_paths(value)
+        for name in self.get_field_path():
+            if name not in tree:
+                return None
+            tree = tree[name]
+        return tree
+
+    def check_field_names(self, param, names, fields):
+        unknown = [name for name in names if name not in fields]
+        if unknown:
+            raise serializers.ValidationError({param: [f'Unknown field: {name}' for name in unknown]})
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if getattr(self.context.get('view'), 'swagger_fake_view', False):
+            # The schema describes every field
+            return fields
+        include = self.get_field_selection(self.fields_query_param)
+        omit = self.get_field_selection(self.omit_query_param)
+        if include:
+            self.check_field_names(self.fields_query_param, include, fields)
+            names = set(include)
+        else:
+            names = set(fields) - set(getattr(self.Meta, 'optional_fields', ()))
+        if omit:
+            self.check_field_names(self.omit_query_param, omit, fields)
+            names -= {name for name, nested in omit.items() if not nested}
+        return {name: field for name, field in fields.items() if name in names}
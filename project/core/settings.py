@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -89,6 +90,18 @@ DATABASES = {
 # CREATE DATABASE project_db OWNER project_usr;
 # ALTER ROLE project_usr WITH CREATEDB;
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL'),
+    } if os.environ.get('REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -141,11 +154,19 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'core.renderers.ORJSONRenderer',
+        'core.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
+# The browsable API is switched on explicitly, e.g. for development
+if os.environ.get('BROWSABLE_API', 'False') == 'True':
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('rest_framework.renderers.BrowsableAPIRenderer')
 
 # SMTP
 EMAIL_HOST = 'smtp.gmail.com'
@@ -223,6 +244,24 @@ CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL')  # RabbitMQ
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND')  # Redis
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# Image processing is CPU bound, it runs on its own prefork worker so it does not hold up the other tasks
+CELERY_TASK_ROUTES = {
+    'store.tasks.create_image_renditions': {'queue': 'images'},
+}
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-favorites-counts': {
+        'task': 'store.tasks.reconcile_favorites_counts',
+        'schedule': 60 * 60,
+    },
+    'relay-stalled-outbox-messages': {
+        'task': 'order.tasks.relay_stalled_outbox_messages',
+        'schedule': 60,
+    },
+    'apply-stalled-payment-data': {
+        'task': 'order.tasks.apply_stalled_payment_data',
+        'schedule': 60,
+    },
+}
 
 # Telegram setting
 TG_BOT_TOKEN = os.environ.get('TG_BOT_TOKEN')
@@ -232,9 +271,22 @@ TG_CHAT_ID = os.environ.get('TG_CHAT_ID')
 LIQPAY_PUBLIC_KEY = os.environ.get('LIQPAY_PUBLIC_KEY')
 LIQPAY_PRIVATE_KEY = os.environ.get('LIQPAY_PRIVATE_KEY')
 
+# Store
+# Filter products by option values with the in-memory facet index instead of SQL joins
+STORE_FACET_INDEX = os.environ.get('STORE_FACET_INDEX', 'True') == 'True'
+# Fall back to pg_trgm similarity on the product name when the full-text search finds nothing
+STORE_SEARCH_TRIGRAM = os.environ.get('STORE_SEARCH_TRIGRAM', 'True') == 'True'
+
 # https://serveo.net/
 DOMAIN = 'https://reverti.serveo.net'
 
+# Catalog feeds
+STORE_FEED_SHOP_NAME = os.environ.get('STORE_FEED_SHOP_NAME', 'Ecommerce')
+STORE_FEED_PRODUCT_URL = os.environ.get('STORE_FEED_PRODUCT_URL', DOMAIN + '/product/{slug}')
+# Seconds incremental feeds reach back before the start of the previous feed, longer than the slowest transaction
+# writing products: their updated_at is taken before they commit
+STORE_FEED_OVERLAP = int(os.environ.get('STORE_FEED_OVERLAP', 60 * 10))
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Ecommerce API',
     'DESCRIPTION': 'Ecommerce API',
@@ -5,11 +5,14 @@ from django.urls import path, include
 
 from drf_spectacular import views
 
+from core.views import IntegrationMetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('store/', include('store.urls')),
     path('order/', include('order.urls')),
+    path('integrations/metrics', IntegrationMetricsView.as_view()),
     # path('__debug__/', include('debug_toolbar.urls')),
     # drf_spectacular
     path('api/schema/', views.SpectacularAPIView.as_view(), name='schema'),
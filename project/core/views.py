@@ -0,0 +1,29 @@
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from rest_framework import permissions, serializers
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import http
+
+
+class IntegrationMetricsSerializer(serializers.Serializer):
+    minutes = serializers.IntegerField(min_value=1, max_value=http.METRICS_RETENTION // 60, default=15)
+
+
+@extend_schema(
+    summary="Get the latency and error metrics of the third party providers",
+    parameters=[
+        OpenApiParameter(name='minutes', type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                         description='The period covered, in minutes up to an hour, 15 by default'),
+    ],
+    responses={200: OpenApiTypes.OBJECT},
+)
+class IntegrationMetricsView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        serializer = IntegrationMetricsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        minutes = serializer.validated_data['minutes']
+        return Response({provider: http.get_metrics(provider, minutes) for provider in sorted(http.providers)})
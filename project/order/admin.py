@@ -60,13 +60,31 @@ class PrettyJSONWidget(widgets.Textarea):
 
 class PaymentDataInline(admin.StackedInline):
     model = models.PaymentData
-    fields = ('order', 'data')
-    readonly_fields = ('order',)
+    extra = 0
+    fields = ('order', 'status', 'created_at', 'processed_at', 'data')
+    readonly_fields = ('order', 'status', 'created_at', 'processed_at')
 
     formfield_overrides = {
         JSONField: {'widget': PrettyJSONWidget}
     }
 
+    def has_add_permission(self, request, obj=None):
+        # Recorded from the callbacks of LiqPay only
+        return False
+
+
+class OutboxMessageInline(admin.TabularInline):
+    model = models.OutboxMessage
+    extra = 0
+    fields = ('kind', 'status', 'attempts', 'available_at', 'sent_at', 'last_error')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 class OrderItemInline(admin.TabularInline):
     model = models.OrderItem
@@ -93,10 +111,10 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'full_name', 'order_status', 'payment_mode', 'payment_status', 'paid', 'total_cost',
                     'created_at', 'updated_at',)
     readonly_fields = ('created_at', 'updated_at', 'registered')
-    inlines = (OrderItemInline, PaymentDataInline)
+    inlines = (OrderItemInline, PaymentDataInline, OutboxMessageInline)
 
     def registered(self, obj):
-        return bool(obj.customer)
+        return obj.customer_id is not None
 
     registered.boolean = True
 
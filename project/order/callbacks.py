@@ -0,0 +1,52 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from order import models
+
+logger = logging.getLogger(__name__)
+
+
+def record(data):
+    """Persist a verified LiqPay callback, its status is applied to the order once the transaction commits"""
+    from order.tasks import apply_payment_data
+
+    payment_data = models.PaymentData.objects.create(
+        order_id=data['order_id'], status=str(data.get('status') or ''), data=data,
+    )
+    transaction.on_commit(lambda: apply_payment_data.delay(payment_data.pk))
+    return payment_data
+
+
+def apply(payment_data_id):
+    """
+    Apply the status of the callback to its order, once. The callbacks of an order are applied one at a time,
+    and move its payment status forward only, whatever order they arrive in. Returns whether the status changed.
+    """
+    with transaction.atomic():
+        payment_data = models.PaymentData.objects.select_for_update().filter(
+            pk=payment_data_id, processed_at__isnull=True,
+        ).first()
+        if payment_data is None:
+            return False
+        order = models.Order.objects.select_for_update().only(
+            'id', 'customer_id', 'payment_status', 'paid', 'updated_at',
+        ).get(pk=payment_data.order_id)
+        changed = order.can_set_payment_status(payment_data.status)
+        if changed:
+            order.set_payment_status(payment_data.status)
+        else:
+            logger.info(f'{payment_data} left the payment status {order.payment_status} of the order, '
+                        f'callback status {payment_data.status!r}')
+        payment_data.processed_at = timezone.now()
+        payment_data.save(update_fields=('processed_at',))
+    return changed
+
+
+def get_stalled_ids(limit=100):
+    """Callbacks whose task was lost, e.g. while the broker was down"""
+    return list(models.PaymentData.objects.filter(
+        processed_at__isnull=True, created_at__lte=timezone.now() - timedelta(minutes=1),
+    ).order_by('created_at', 'id').values_list('id', flat=True)[:limit])
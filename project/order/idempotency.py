@@ -0,0 +1,128 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+REPLAYED_HEADER = 'Idempotent-Replayed'
+# How long the response of a key is replayed
+IDEMPOTENCY_TTL = 60 * 60 * 24
+# Outlives the slowest request, a crashed worker does not hold its key for longer
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+# How long a duplicate waits for the response of the request in flight
+IDEMPOTENCY_WAIT = 10
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+
+
+class IdempotencyConflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still in progress.'
+    default_code = 'idempotency_conflict'
+    # Sent as Retry-After
+    wait = 1
+
+
+class IdempotencyKeyReused(exceptions.APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was used with a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+def get_scope(request):
+    """Keys are scoped to the user, or to the session of a guest. None for a guest without a session"""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return f'session:{session.session_key}'
+    return None
+
+
+def get_cache_key(request, key):
+    scope = get_scope(request)
+    if scope is None:
+        return None
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'order:idempotency:{request.path}:{scope}:{digest}'
+
+
+def get_lock_key(cache_key):
+    return f'{cache_key}:lock'
+
+
+def get_fingerprint(request):
+    data = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def acquire(cache_key):
+    """
+    The stored response of the key, or None once this request holds its lock. Waits for a duplicate in flight
+    to finish, raises IdempotencyConflict when it takes too long.
+    """
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while True:
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return stored
+        if cache.add(get_lock_key(cache_key), True, IDEMPOTENCY_LOCK_TIMEOUT):
+            # The request in flight may have stored its response and released the lock since the read
+            stored = cache.get(cache_key)
+            if stored is not None:
+                release(cache_key)
+            return stored
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflict()
+        time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+
+def release(cache_key):
+    cache.delete(get_lock_key(cache_key))
+
+
+def replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        raise IdempotencyKeyReused()
+    return Response(stored['data'], status=stored['status'], headers={REPLAYED_HEADER: 'true'})
+
+
+class IdempotentPostMixin:
+    """
+    Posts once per Idempotency-Key header. The response is stored for the key, the retries of the request
+    get it replayed, and the duplicates sent while it is in flight wait for it. Requests without the header
+    are not affected. Guests send the header within a session only, their keys would be shared otherwise.
+
+    The response is stored once the view returns, after its transaction committed. Server errors are not stored,
+    the request may be retried with the same key.
+    """
+
+    def post(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return super().post(request, *args, **kwargs)
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise exceptions.ValidationError(
+                {IDEMPOTENCY_HEADER: [f'Ensure this header has 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters.']}
+            )
+        cache_key = get_cache_key(request, key)
+        if cache_key is None:
+            raise exceptions.ValidationError(
+                {IDEMPOTENCY_HEADER: ['Only authenticated users and guests with a session may send this header.']}
+            )
+        fingerprint = get_fingerprint(request)
+        stored = acquire(cache_key)
+        if stored is not None:
+            return replay(stored, fingerprint)
+        try:
+            response = super().post(request, *args, **kwargs)
+            if response.status_code < 500:
+                cache.set(cache_key, {'fingerprint': fingerprint, 'status': response.status_code,
+                                      'data': response.data}, IDEMPOTENCY_TTL)
+            return response
+        finally:
+            release(cache_key)
@@ -0,0 +1,68 @@
+# Generated by Django 4.1.10 on 2026-10-18 18:42
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_payment_data(apps, schema_editor):
+    # The callbacks recorded so far were applied as they came
+    PaymentData = apps.get_model("order", "PaymentData")
+    PaymentData.objects.update(
+        status=Coalesce(KeyTextTransform("status", "data"), Value("")),
+        processed_at=F("created_at"),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("order", "0004_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="paymentdata",
+            options={
+                "ordering": ("created_at", "id"),
+                "verbose_name": "Payment data",
+                "verbose_name_plural": "Payment data",
+            },
+        ),
+        migrations.AddField(
+            model_name="paymentdata",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="paymentdata",
+            name="processed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="paymentdata",
+            name="status",
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name="paymentdata",
+            name="order",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="payment_data",
+                to="order.order",
+            ),
+        ),
+        migrations.RunPython(fill_payment_data, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="paymentdata",
+            index=models.Index(
+                fields=["processed_at", "created_at"], name="order_paydata_processed_idx"
+            ),
+        ),
+    ]
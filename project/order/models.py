@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
 
@@ -11,6 +12,19 @@ class PaymentStatus(models.TextChoices):
     __empty__ = 'Unknown'
 
 
+# The statuses a payment may move to from each status, so that repeated and late callbacks never move it back.
+# From an unknown status it may move to any.
+PAYMENT_STATUS_TRANSITIONS = {
+    PaymentStatus.PROCESSING: {PaymentStatus.SUCCESS, PaymentStatus.FAILURE, PaymentStatus.ERROR,
+                               PaymentStatus.REVERSED},
+    # A declined payment may be paid again
+    PaymentStatus.FAILURE: {PaymentStatus.PROCESSING, PaymentStatus.SUCCESS},
+    PaymentStatus.ERROR: {PaymentStatus.PROCESSING, PaymentStatus.SUCCESS},
+    PaymentStatus.SUCCESS: {PaymentStatus.REVERSED},
+    PaymentStatus.REVERSED: set(),
+}
+
+
 class OrderStatus(models.TextChoices):
     PENDING = 'pending', 'Pending'
     RETURN = 'return', 'Return'
@@ -26,6 +40,18 @@ class PaymentMode(models.TextChoices):
     CARD = 'card', 'Credit and debit card'
 
 
+class OutboxKind(models.TextChoices):
+    NOTIFICATION = 'notification', 'Telegram notification'
+    # The status of a card payment whose charge got no response, which is checked and never charged again
+    PAYMENT_CHECK = 'payment_check', 'Card payment check'
+
+
+class OutboxStatus(models.TextChoices):
+    PENDING = 'pending', 'Pending'
+    SENT = 'sent', 'Sent'
+    FAILED = 'failed', 'Failed'
+
+
 class Order(models.Model):
     first_name = models.CharField(max_length=150, blank=True)
     last_name = models.CharField(max_length=150, blank=True)
@@ -54,17 +80,26 @@ class Order(models.Model):
     def save(self, *args, **kwargs):
         if self.payment_status == PaymentStatus.SUCCESS:
             self.paid = True
-        if self.customer:
+        update_fields = kwargs.get('update_fields')
+        # The customer is only read when the fields copied from it are saved
+        customer_fields = {'first_name', 'last_name', 'phone_number'}
+        if self.customer_id and (update_fields is None or customer_fields & set(update_fields)):
             self.first_name = self.customer.first_name
             self.last_name = self.customer.last_name
             self.phone_number = self.customer.phone_number
         super().save(*args, **kwargs)
 
+    def can_set_payment_status(self, payment_status):
+        if payment_status is None or payment_status not in PaymentStatus.values:
+            return False
+        allowed = PAYMENT_STATUS_TRANSITIONS.get(self.payment_status)
+        return allowed is None or payment_status in allowed
+
     def set_payment_status(self, payment_status):
         self.payment_status = PaymentStatus.__empty__
         if payment_status in PaymentStatus.values:
             self.payment_status = payment_status
-        self.save()
+        self.save(update_fields=('payment_status', 'paid', 'updated_at'))
         return self
 
 
@@ -98,12 +133,54 @@ class OrderItem(models.Model):
 
 
 class PaymentData(models.Model):
-    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='payment_data')
+    """
+    A LiqPay callback of an order, recorded as received and never changed but for processed_at. Its status is
+    applied to the order by order.tasks.apply_payment_data.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payment_data')
+    # The status of the payment in the callback, as sent by LiqPay
+    status = models.CharField(max_length=50, blank=True)
     data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         verbose_name = 'Payment data'
         verbose_name_plural = 'Payment data'
+        ordering = ('created_at', 'id')
+        indexes = [
+            models.Index(fields=['processed_at', 'created_at'], name='order_paydata_processed_idx'),
+        ]
+
+    def __str__(self):
+        return f'Callback order #{self.order_id}'
+
+
+class OutboxMessage(models.Model):
+    """
+    A side effect of an order on a third party, written in the transaction that makes it necessary and delivered
+    by order.tasks.relay_outbox_message after the commit
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='outbox_messages')
+    kind = models.CharField(max_length=50, choices=OutboxKind.choices)
+    # Never holds card data, cards are charged by the request of the order
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=50, choices=OutboxStatus.choices, default=OutboxStatus.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Before this time the message is either being delivered or waiting for its next attempt
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Deduplicates the side effects, an order triggers each kind once
+            models.UniqueConstraint(fields=('order', 'kind'), name='%(app_label)s_%(class)s_unique_order_kind'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='order_outbox_status_idx'),
+        ]
 
     def __str__(self):
-        return f'Callback order #{self.order.id}'
+        return f'{self.get_kind_display()} of order #{self.order_id}'
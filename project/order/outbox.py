@@ -0,0 +1,108 @@
+import logging
+import random
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from order import callbacks, models, payment
+from order.tgbot import send_message_to_tg
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_MAX_ATTEMPTS = 8
+# How long a claimed message is left to its worker before another may deliver it
+OUTBOX_LEASE = timedelta(minutes=5)
+OUTBOX_RETRY_DELAY = 10
+OUTBOX_RETRY_DELAY_MAX = 60 * 30
+
+
+class DeliveryError(Exception):
+    """A failed delivery, retried with backoff"""
+
+
+class PermanentDeliveryError(DeliveryError):
+    """A delivery that can not succeed, not retried"""
+
+
+def get_retry_delay(attempts):
+    """Exponential backoff with full jitter, in seconds"""
+    return random.uniform(0, min(OUTBOX_RETRY_DELAY * 2 ** attempts, OUTBOX_RETRY_DELAY_MAX))
+
+
+def add_message(order, kind, payload=None):
+    """Record a side effect of the order in its transaction, it is relayed once the transaction commits"""
+    from order.tasks import relay_outbox_message
+
+    message = models.OutboxMessage.objects.create(order=order, kind=kind, payload=payload or {})
+    transaction.on_commit(lambda: relay_outbox_message.delay(message.pk))
+    return message
+
+
+def send_notification(message):
+    order = message.order
+    send_message_to_tg(f'Order #{order.id} number phone client {order.phone_number}')
+
+
+def check_payment(message):
+    """Read the status of the payment from LiqPay, it is applied to the order as a callback"""
+    order = message.order
+    result = payment.LiqPayStatus(order_id=str(order.id)).api()
+    if result is None:
+        raise DeliveryError('No response from LiqPay')
+    if not result.get('status'):
+        raise PermanentDeliveryError(f'No payment status from LiqPay: {result}')
+    # A charge that never reached LiqPay is not found, which is an error status
+    callbacks.record({**result, 'order_id': order.id})
+
+
+HANDLERS = {
+    models.OutboxKind.NOTIFICATION: send_notification,
+    models.OutboxKind.PAYMENT_CHECK: check_payment,
+}
+
+
+def claim(message_id):
+    """
+    Take the message for delivery, None when it was delivered already, waits for its next attempt or is being
+    delivered by another worker. The message is leased rather than locked, no transaction is held while
+    the third party is called.
+    """
+    now = timezone.now()
+    claimed = models.OutboxMessage.objects.filter(
+        pk=message_id, status=models.OutboxStatus.PENDING, available_at__lte=now,
+    ).update(available_at=now + OUTBOX_LEASE, attempts=F('attempts') + 1)
+    if not claimed:
+        return None
+    return models.OutboxMessage.objects.select_related('order').get(pk=message_id)
+
+
+def deliver(message_id):
+    """
+    Deliver the message, returning the delay before its next attempt when it failed and is to be retried,
+    else None
+    """
+    message = claim(message_id)
+    if message is None:
+        return None
+    messages = models.OutboxMessage.objects.filter(pk=message.pk)
+    try:
+        HANDLERS[message.kind](message)
+    except Exception as exc:
+        logger.warning(f'Delivery of {message} failed, attempt {message.attempts}', exc_info=True)
+        if isinstance(exc, PermanentDeliveryError) or message.attempts >= OUTBOX_MAX_ATTEMPTS:
+            messages.update(status=models.OutboxStatus.FAILED, last_error=repr(exc))
+            return None
+        delay = get_retry_delay(message.attempts)
+        messages.update(available_at=timezone.now() + timedelta(seconds=delay), last_error=repr(exc))
+        return delay
+    messages.update(status=models.OutboxStatus.SENT, sent_at=timezone.now(), last_error='')
+    return None
+
+
+def get_stalled_message_ids(limit=100):
+    """Pending messages whose relay task was lost, e.g. while the broker was down"""
+    return list(models.OutboxMessage.objects.filter(
+        status=models.OutboxStatus.PENDING, available_at__lte=timezone.now() - timedelta(minutes=1),
+    ).order_by('available_at').values_list('id', flat=True)[:limit])
@@ -7,9 +7,17 @@ from django.conf import settings
 from liqpay.liqpay3 import LiqPay
 from rest_framework.exceptions import ValidationError
 
+from core.http import IntegrationClient
+
 logger = logging.getLogger(__name__)
 
 
+# A payment may have been made once the request reached LiqPay, only failed connections are retried
+liqpay_client = IntegrationClient('liqpay', timeout=(3.05, 30), idempotent=False)
+# Reads the status of payments, which is safe to retry
+liqpay_status_client = IntegrationClient('liqpay_status', timeout=(3.05, 10))
+
+
 class NotParamsError(Exception):
     pass
 
@@ -36,6 +44,7 @@ class LiqPayBase(ABC):
     request_url = "https://www.liqpay.ua/api/request"
     version = "3"
     server_url = f'{settings.DOMAIN}order/paycallback'
+    client = liqpay_client
 
     @abstractmethod
     def __init__(self):
@@ -55,9 +64,9 @@ class LiqPayBase(ABC):
         signature = LiqPayBase.liqpay.cnb_signature(self.get_params())
         request_data = {"data": data, "signature": signature}
         try:
-            res = requests.post(LiqPayBase.request_url, data=request_data, verify=False)
+            res = self.client.post(LiqPayBase.request_url, data=request_data)
             return json.loads(res.content.decode("utf-8"))
-        except requests.RequestException:
+        except (requests.RequestException, ValueError):
             logger.warning(
                 "Error getting response from liqpay\n " f'data- {data},\n params - '
                 f'{self.get_params()}\n', exc_info=True
@@ -109,6 +118,16 @@ class LiqPayToken(LiqPayBase):
         )
 
 
+class LiqPayStatus(LiqPayBase):
+    client = liqpay_status_client
+
+    def __init__(self, order_id: str):
+        self.params = dict(
+            action='status',
+            order_id=order_id,
+        )
+
+
 class ReceiptLiqPay(LiqPayBase):
     def __init__(self,
                  order_id: str,
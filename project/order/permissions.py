@@ -12,4 +12,5 @@ class IsOrderByCustomer(permissions.BasePermission):
         return request.user.is_authenticated is True
 
     def has_object_permission(self, request, view, obj):
-        return obj.customer == request.user
+        # Compares the keys, loading the customer is not needed
+        return request.user.is_authenticated and obj.customer_id == request.user.pk
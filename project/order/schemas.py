@@ -54,6 +54,8 @@ ORDER_POST_RESPONSES = {
         'properties': {'order_number': {'type': 'integer'}}
     },
     400: OpenApiResponse(description='Bad request (something invalid)'),
+    409: OpenApiResponse(description='An order with this Idempotency-Key is still being created'),
+    422: OpenApiResponse(description='The Idempotency-Key was used for another order'),
 }
 
 ORDER_DETAIL_RESPONSES = {
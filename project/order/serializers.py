@@ -1,13 +1,89 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
+
+from core.serializers import CompiledListSerializer, CompiledSerializerMixin
 from order import models
 from order.validation import CardValidator
+from store.models import Product
+
+
+class OrderItemProductField(serializers.PrimaryKeyRelatedField):
+    """Takes the product from those its list of items loaded at once, when there is one"""
+    default_error_messages = {
+        'unpublished': 'Product "{pk_value}" is not available.',
+    }
+
+    def get_preloaded(self):
+        return getattr(self.parent.parent, 'products', None)
+
+    def to_internal_value(self, data):
+        products = self.get_preloaded()
+        if products is None:
+            product = super().to_internal_value(data)
+        else:
+            try:
+                product = products[Product._meta.pk.to_python(data)]
+            except (DjangoValidationError, TypeError):
+                self.fail('incorrect_type', data_type=type(data).__name__)
+            except KeyError:
+                self.fail('does_not_exist', pk_value=data)
+        if not product.is_published:
+            self.fail('unpublished', pk_value=data)
+        return product
+
+
+class OrderItemListSerializer(CompiledListSerializer):
+    """
+    Validates the items with the products of all of them read in one query, the lines of the same product
+    are merged into one
+    """
+    default_error_messages = {
+        'max_quantity': 'Ensure the quantity of product "{pk_value}" is less than or equal to {max_value}.',
+    }
+
+    def get_product_ids(self, data):
+        ids = set()
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            try:
+                ids.add(Product._meta.pk.to_python(item.get('product')))
+            except (DjangoValidationError, TypeError):
+                continue
+        ids.discard(None)
+        return ids
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            queryset = self.child.fields['product'].get_queryset()
+            self.products = queryset.in_bulk(self.get_product_ids(data))
+        return super().to_internal_value(data)
 
+    def validate(self, attrs):
+        default_quantity = models.OrderItem._meta.get_field('quantity').default
+        # The quantity of each line was validated, their sum is checked against the column again
+        max_quantity = self.child.fields['quantity'].max_value
+        merged = {}
+        for item in attrs:
+            quantity = item.get('quantity', default_quantity)
+            if item['product'].pk in merged:
+                merged[item['product'].pk]['quantity'] += quantity
+            else:
+                merged[item['product'].pk] = {**item, 'quantity': quantity}
+            if max_quantity is not None and merged[item['product'].pk]['quantity'] > max_quantity:
+                self.fail('max_quantity', pk_value=item['product'].pk, max_value=max_quantity)
+        return list(merged.values())
+
+
+class OrderItemSerializer(CompiledSerializerMixin, serializers.ModelSerializer):
+    # Only the prices the order is made of are read
+    product = OrderItemProductField(queryset=Product.objects.only('id', 'price', 'discount_price', 'is_published'))
 
-class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.OrderItem
         fields = ('id', 'product', 'price', 'discount_price', 'quantity', 'cost')
         read_only_fields = ('order', 'price', 'discount_price', 'cost')
+        list_serializer_class = OrderItemListSerializer
 
 
 class OrderListCreateSerializer(serializers.ModelSerializer):
@@ -0,0 +1,33 @@
+from celery import shared_task
+
+from order import callbacks, outbox
+
+
+@shared_task
+def relay_outbox_message(message_id):
+    delay = outbox.deliver(message_id)
+    if delay is not None:
+        # The message is claimable again once the delay is over
+        relay_outbox_message.apply_async((message_id,), countdown=delay + 1)
+    return delay
+
+
+@shared_task
+def relay_stalled_outbox_messages():
+    message_ids = outbox.get_stalled_message_ids()
+    for message_id in message_ids:
+        relay_outbox_message.delay(message_id)
+    return len(message_ids)
+
+
+@shared_task
+def apply_payment_data(payment_data_id):
+    return callbacks.apply(payment_data_id)
+
+
+@shared_task
+def apply_stalled_payment_data():
+    payment_data_ids = callbacks.get_stalled_ids()
+    for payment_data_id in payment_data_ids:
+        apply_payment_data.delay(payment_data_id)
+    return len(payment_data_ids)
@@ -1,8 +1,8 @@
-import logging
-import requests
 from django.conf import settings
 
-logger = logging.getLogger(__name__)
+from core.http import IntegrationClient
+
+telegram_client = IntegrationClient('telegram', timeout=(3.05, 10))
 
 
 def get_tg_url(method: str) -> str:
@@ -11,11 +11,8 @@ def get_tg_url(method: str) -> str:
 
 
 def send_message_to_tg(text: str) -> None:
+    """Raises requests.RequestException when the message was not sent, for the outbox relay to retry"""
     params = {'chat_id': settings.TG_CHAT_ID, 'text': text}
     url = get_tg_url(method='sendMessage')
-
-    try:
-        response = requests.post(url, json=params)
-        response.raise_for_status()
-    except requests.RequestException:
-        logger.error("Error", exc_info=True)
+    response = telegram_client.post(url, json=params)
+    response.raise_for_status()
@@ -1,17 +1,19 @@
 import logging
 
 from django.db import transaction
-from django.db.models import Prefetch
-from drf_spectacular.utils import extend_schema, extend_schema_view
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema, extend_schema_view
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from order import models, schemas
+from core.optimizer import OptimizedQuerysetMixin
+from order import callbacks, models, schemas
+from order.idempotency import IDEMPOTENCY_HEADER, IdempotentPostMixin
+from order import outbox
 from order import payment
 from order import serializers
 from order.permissions import IsOrderByCustomer
-from order.tgbot import send_message_to_tg
 
 logger = logging.getLogger(__name__)
 
@@ -22,21 +24,22 @@ logger = logging.getLogger(__name__)
     ),
     post=extend_schema(
         summary="Creating order",
+        parameters=[
+            OpenApiParameter(name=IDEMPOTENCY_HEADER, type=OpenApiTypes.STR, location=OpenApiParameter.HEADER,
+                             description='A unique key of the order, its retries get the first response. '
+                                         'Sent by authenticated users and guests with a session only'),
+        ],
         responses=schemas.ORDER_POST_RESPONSES,
         examples=schemas.ORDER_POST_EXAMPLES,
     ),
 )
-class OrderListCreateView(generics.ListCreateAPIView):
+class OrderListCreateView(IdempotentPostMixin, OptimizedQuerysetMixin, generics.ListCreateAPIView):
     permission_classes = [IsOrderByCustomer]
     serializer_class = serializers.OrderListCreateSerializer
 
     def get_queryset(self):
-        user = self.request.user
-        return models.Order.objects.select_related('customer').prefetch_related(
-            Prefetch(
-                'items',
-                queryset=models.OrderItem.objects.select_related('product'))
-        ).filter(customer=user)
+        # The items are write-only, the list reads the columns of the orders alone
+        return models.Order.objects.filter(customer=self.request.user)
 
     @staticmethod
     def get_cost(item):
@@ -48,6 +51,8 @@ class OrderListCreateView(generics.ListCreateAPIView):
 
     @staticmethod
     def process_payment(card_data, order_instance, payment_mode):
+        # Charged once the order is committed, no transaction is held while LiqPay is called and the card data
+        # is never stored
         if payment_mode == models.PaymentMode.CARD:
             result_pay = payment.LiqPayCard(
                 order_id=str(order_instance.id),
@@ -55,12 +60,10 @@ class OrderListCreateView(generics.ListCreateAPIView):
                 phone=str(order_instance.phone_number),
                 **card_data
             )
-            result_pay.api()
-
-    @staticmethod
-    def send_order_notification(order_instance):
-        msg_to_tg = f'Order #{order_instance.id} number phone client {order_instance.phone_number}'
-        send_message_to_tg(msg_to_tg)
+            if result_pay.api() is None:
+                # The card may have been charged, its payment is checked rather than charged again
+                logger.error(f'No response from LiqPay to the payment of order #{order_instance.id}')
+                outbox.add_message(order_instance, models.OutboxKind.PAYMENT_CHECK)
 
     def create_order_items(self, items_data, order_instance):
         order_items = [models.OrderItem(
@@ -79,7 +82,6 @@ class OrderListCreateView(generics.ListCreateAPIView):
         order_instance = models.Order.objects.create(**data, total_cost=total_cost)
         return order_instance
 
-    @transaction.atomic
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -91,9 +93,11 @@ class OrderListCreateView(generics.ListCreateAPIView):
         card_data = {k: data.pop(k) for (k, v) in data.copy().items() if 'card' in k}
         total_cost = self.get_total_cost(items_data)
 
-        order_instance = self.create_order_instance(data, total_cost)
-        self.create_order_items(items_data, order_instance)
-        self.send_order_notification(order_instance)
+        with transaction.atomic():
+            order_instance = self.create_order_instance(data, total_cost)
+            self.create_order_items(items_data, order_instance)
+            # Delivered after the commit, the checkout does not wait for Telegram
+            outbox.add_message(order_instance, models.OutboxKind.NOTIFICATION)
         self.process_payment(card_data, order_instance, payment_mode)
 
         return Response({'order_number': order_instance.id},
@@ -107,18 +111,14 @@ class OrderListCreateView(generics.ListCreateAPIView):
         responses=schemas.ORDER_DETAIL_RESPONSES,
     ),
 )
-class OrderDetailView(generics.RetrieveAPIView):
+class OrderDetailView(OptimizedQuerysetMixin, generics.RetrieveAPIView):
     permission_classes = [IsOrderByCustomer]
     serializer_class = serializers.OrderDetailSerializer
+    query_fields = ('customer',)
 
     def get_queryset(self):
-        user = self.request.user
-        return models.Order.objects.select_related('customer').prefetch_related(
-            Prefetch(
-                'items',
-                queryset=models.OrderItem.objects.select_related('product')
-            )
-        ).filter(customer=user)
+        # The items are read as rows by the compiled OrderItemSerializer
+        return models.Order.objects.filter(customer=self.request.user)
 
 
 @extend_schema(exclude=True)
@@ -133,13 +133,13 @@ class PayCallbackView(APIView):
             logger.error(f"server request hasn't parameter data, request_data:\n{request.data}")
 
         res_data = payment.Callback.callback(data, signature)
-        order_id = res_data['order_id']
-        payment_status = res_data['status']
+        # Acknowledged once recorded, the status is applied to the order by a worker
         try:
-            obj = models.Order.objects.get(id=order_id)
-            obj.set_payment_status(payment_status)
-            models.PaymentData.objects.create(order_id=order_id, data=res_data)
-        except models.Order.DoesNotExist:
+            order_exists = models.Order.objects.filter(id=res_data.get('order_id')).exists()
+        except (ValueError, TypeError):
+            order_exists = False
+        if not order_exists:
             logger.error(f"Order not found:\n{res_data}")
             return Response('Order not found', status.HTTP_404_NOT_FOUND)
+        callbacks.record(res_data)
         return Response(status=status.HTTP_204_NO_CONTENT)
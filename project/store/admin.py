@@ -15,7 +15,8 @@ class ProductImageAdminInline(admin.StackedInline):
 
 class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
-    list_display = ('name', 'price', 'discount_price', 'discount_percent', 'is_published',)
+    list_display = ('name', 'price', 'discount_price', 'discount_percent', 'effective_price', 'favorites_count',
+                    'is_published',)
     inlines = (ProductImageAdminInline,)
     fieldsets = (
         (None, {
@@ -59,6 +60,10 @@ admin.site.register(models.Category, CategoryAdmin)
 class ValueAdmin(admin.TabularInline):
     model = models.Value
 
+    def get_queryset(self, request):
+        # Value.__str__ reads the option
+        return super().get_queryset(request).select_related('option')
+
 
 class OptionAdmin(admin.ModelAdmin):
     inlines = [
@@ -71,14 +76,21 @@ admin.site.register(models.Option, OptionAdmin)
 
 class ProductOptionValueAdmin(admin.ModelAdmin):
     list_display = ('product', 'value')
+    list_select_related = ('product', 'option', 'value__option')
     ordering = ('product', 'option')
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'value':
+            kwargs['queryset'] = models.Value.objects.select_related('option')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 
 admin.site.register(models.ProductOptionValue, ProductOptionValueAdmin)
 
 
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('product', 'user')
+    list_select_related = ('product', 'user')
 
 
 admin.site.register(models.Favorite, FavoriteAdmin)
@@ -86,6 +98,7 @@ admin.site.register(models.Favorite, FavoriteAdmin)
 
 class ProductFilterAdmin(admin.ModelAdmin):
     list_display = ('category', 'option', 'position', 'hide')
+    list_select_related = ('category', 'option')
     ordering = ('-category', 'position')
     list_filter = ('category',)
 
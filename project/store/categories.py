@@ -0,0 +1,128 @@
+from dataclasses import dataclass
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from store import models
+from store.versions import bump_version, get_version
+
+CATEGORY_TREE_VERSION_KEY = 'store:category_tree:version'
+CATEGORY_TREE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_category_tree_version():
+    return get_version(CATEGORY_TREE_VERSION_KEY)
+
+
+def bump_category_tree_version():
+    return bump_version(CATEGORY_TREE_VERSION_KEY)
+
+
+def get_category_version_key(category_id):
+    return f'store:category:{category_id}:version'
+
+
+def get_category_versions(category_ids):
+    """The versions of the categories' subtrees, each one changing with the products listed under it"""
+    keys = [get_category_version_key(category_id) for category_id in category_ids]
+    versions = cache.get_many(keys)
+    return [versions[key] if key in versions else get_version(key) for key in keys]
+
+
+def bump_category_versions(category_ids):
+    """Bump the versions of the categories and of their ancestors, which list the categories' products too"""
+    condition = Q()
+    bounds = models.Category.objects.filter(pk__in=category_ids).values_list('tree_id', 'lft', 'rght')
+    for tree_id, lft, rght in bounds:
+        condition |= Q(tree_id=tree_id, lft__lte=lft, rght__gte=rght)
+    if not condition:
+        return
+    for category_id in models.Category.objects.filter(condition).values_list('id', flat=True):
+        bump_version(get_category_version_key(category_id))
+
+
+def build_category_tree():
+    """Nested name/slug/children dicts of the categories, leaving out hidden ones with their descendants"""
+    roots = []
+    # The nodes on the path from the root to the current category, None for a hidden one
+    path = []
+    categories = models.Category.objects.order_by('tree_id', 'lft').values_list('level', 'name', 'slug', 'hide')
+    for level, name, slug, hide in categories:
+        del path[level:]
+        parent = path[-1] if path else None
+        if hide or (level and parent is None):
+            path.append(None)
+            continue
+        node = {'name': name, 'slug': slug, 'children': []}
+        (parent['children'] if level else roots).append(node)
+        path.append(node)
+    return roots
+
+
+def get_rendered_category_tree(renderer):
+    """The category tree encoded by the renderer, cached until the tree changes"""
+    key = f'store:category_tree:{get_category_tree_version()}:{renderer.format}'
+    content = cache.get(key)
+    if content is None:
+        content = renderer.render(build_category_tree())
+        cache.set(key, content, CATEGORY_TREE_CACHE_TIMEOUT)
+    return content
+
+
+@dataclass(frozen=True)
+class CategoryScope:
+    """A category with the ids of the categories its product listings cover, itself included"""
+    id: int
+    tree_id: int
+    lft: int
+    rght: int
+    descendant_ids: tuple
+
+
+class CategoryResolver:
+    """
+    Process-local slug -> CategoryScope mapping of the existing categories, dropped whenever the category tree
+    version changes
+    """
+
+    def __init__(self):
+        self._scopes = {}
+        self._root_ids = None
+        self._version = None
+
+    def ensure_fresh(self):
+        version = get_category_tree_version()
+        if version != self._version:
+            self._scopes = {}
+            self._root_ids = None
+            self._version = version
+
+    def resolve(self, slug):
+        self.ensure_fresh()
+        scope = self._scopes.get(slug)
+        if scope is None:
+            scope = self.load(slug)
+            # Misses are not kept, there are as many unknown slugs as requests make up
+            if scope is not None:
+                self._scopes[slug] = scope
+        return scope
+
+    def get_root_ids(self):
+        """Ids of the root categories, whose subtrees cover the whole catalog"""
+        self.ensure_fresh()
+        if self._root_ids is None:
+            self._root_ids = tuple(models.Category.objects.filter(parent=None).values_list('id', flat=True))
+        return self._root_ids
+
+    @staticmethod
+    def load(slug):
+        category = models.Category.objects.filter(slug=slug).values('id', 'tree_id', 'lft', 'rght').first()
+        if category is None:
+            return None
+        descendant_ids = models.Category.objects.filter(
+            tree_id=category['tree_id'], lft__gte=category['lft'], rght__lte=category['rght']
+        ).values_list('id', flat=True)
+        return CategoryScope(**category, descendant_ids=tuple(descendant_ids))
+
+
+category_resolver = CategoryResolver()
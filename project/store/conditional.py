@@ -0,0 +1,121 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
+from django.utils.http import http_date
+
+from store.categories import category_resolver, get_category_tree_version, get_category_versions
+from store.favorites import get_favorites_ranking_version, get_favorites_version
+from store.versions import bump_version, get_version
+
+CATALOG_VERSION_KEY = 'store:catalog:version'
+
+
+def get_catalog_version():
+    """Version of the catalog data that is not scoped to a category: the category tree, options and values"""
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def get_user_stamp(user):
+    # Responses carry the favorite flag of the user, so they change with the user's favorites too
+    if not user.is_authenticated:
+        return 'anonymous'
+    return f'{user.pk}:{get_favorites_version(user.pk)}'
+
+
+def get_ordering_parts(request):
+    # Lists ordered by the favorite counts change with them, unlike the other lists
+    if 'favorites' in request.query_params.get('o', ''):
+        return ['favorites', get_favorites_ranking_version()]
+    return []
+
+
+class ConditionalGetMixin:
+    """
+    Answers conditional GET requests from version stamps, so that a client holding the current representation
+    gets a 304 before the view runs any of its queries.
+
+    Views return the stamps their response depends on from get_etag_parts(), or None when there are none.
+    The responses of views that are not personalized are the same for every user, shared caches may keep them.
+    """
+
+    def get_etag_parts(self):
+        return None
+
+    def is_personalized(self):
+        """Whether the response depends on the user of the request"""
+        return True
+
+    def get_last_modified(self):
+        return None
+
+    def get_etag(self):
+        parts = self.get_etag_parts()
+        if parts is None:
+            return None
+        request = self.request
+        user_stamp = get_user_stamp(request.user) if self.is_personalized() else 'shared'
+        parts = [request.accepted_renderer.format, request.build_absolute_uri(), user_stamp, *parts]
+        return quote_etag(hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag()
+        if etag is None:
+            return super().get(request, *args, **kwargs)
+        last_modified = self.get_last_modified()
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp:
+                response['Last-Modified'] = http_date(timestamp)
+        if self.is_personalized():
+            patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+        else:
+            # Stored by shared caches even for authenticated requests, and revalidated with the ETag
+            patch_vary_headers(response, ('Accept',))
+            patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+
+class CategoryTreeConditionalMixin(ConditionalGetMixin):
+    def get_etag_parts(self):
+        return ['categories', get_category_tree_version()]
+
+    def is_personalized(self):
+        return False
+
+
+class CategoryConditionalMixin(ConditionalGetMixin):
+    """For the views listing the products of the category resolved by CategoryScopeMixin"""
+
+    def get_etag_parts(self):
+        scope = self.get_category_scope()
+        if scope is None:
+            return None
+        return [get_catalog_version(), *get_category_versions([scope.id]), *get_ordering_parts(self.request)]
+
+
+class CatalogConditionalMixin(ConditionalGetMixin):
+    """For the views listing products of the whole catalog"""
+
+    def get_etag_parts(self):
+        return [
+            get_catalog_version(),
+            *get_category_versions(category_resolver.get_root_ids()),
+            *get_ordering_parts(self.request),
+        ]
+
+
+class FavoriteFlagMixin:
+    """For the views of products, which depend on the user through the favorite flags only"""
+
+    def is_personalized(self):
+        if not hasattr(self, '_is_personalized'):
+            self._is_personalized = 'favorite' in self.get_serializer().fields
+        return self._is_personalized
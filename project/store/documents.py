@@ -0,0 +1,140 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from core.optimizer import optimize_queryset
+from store import models, serializers
+from store.images import format_srcset
+
+
+# Part of the keys, bumped when the content of the documents changes
+PRODUCT_DOCUMENT_VERSION = 3
+# The documents are rebuilt after every change of their products, the timeout bounds how long a lost rebuild
+# leaves one behind where its stamp is not checked
+PRODUCT_DOCUMENT_TIMEOUT = 60 * 60 * 24
+# Products rebuilt by a task, the rebuild of a bulk write is split into tasks of this size
+PRODUCT_DOCUMENTS_CHUNK_SIZE = 500
+
+
+def get_product_document_key(slug):
+    return f'store:product_document:{PRODUCT_DOCUMENT_VERSION}:{slug}'
+
+
+def get_document_products(queryset):
+    """The products of the queryset, loading what their documents are built from"""
+    return optimize_queryset(queryset, serializers.ProductDocumentSerializer, 'slug', 'updated_at')
+
+
+def build_product_document(product):
+    """
+    The user-independent part of the product detail response, with media urls left relative, stamped with
+    the updated_at of the product it was built from
+    """
+    return {
+        'id': product.id,
+        'updated_at': product.updated_at,
+        'data': dict(serializers.ProductDocumentSerializer(product).data),
+    }
+
+
+def save_product_document(product):
+    document = build_product_document(product)
+    cache.set(get_product_document_key(product.slug), document, PRODUCT_DOCUMENT_TIMEOUT)
+    return document
+
+
+def delete_product_document(slug):
+    cache.delete(get_product_document_key(slug))
+
+
+def delete_product_documents(slugs):
+    cache.delete_many([get_product_document_key(slug) for slug in slugs])
+
+
+def get_product_document(slug, updated_at=None):
+    """
+    The stored document of the product, or None for an unknown slug. It is built on the spot when it is missing,
+    or older than updated_at, the stamp of the product: its rebuild is still queued or was lost.
+    """
+    document = cache.get(get_product_document_key(slug))
+    if document is None or (updated_at is not None and document['updated_at'] < updated_at):
+        product = get_document_products(models.Product.objects.filter(slug=slug)).first()
+        if product is None:
+            return None
+        document = save_product_document(product)
+    return document
+
+
+def render_document_fields(document, fields, build_url, favorite_ids):
+    """The fields of the document, with absolute media urls and the favorite flag of the products in favorite_ids"""
+    data = document['data']
+    rendered = {}
+    for field in fields:
+        if field == 'id':
+            value = document['id']
+        elif field == 'favorite':
+            value = document['id'] in favorite_ids
+        elif field == 'image':
+            value = data['image'] and build_url(data['image'])
+        elif field == 'images':
+            value = [build_url(url) for url in data['images']]
+        elif field == 'image_srcset':
+            value = format_srcset(data['image_srcset'], build_url)
+        elif field == 'images_srcset':
+            value = [format_srcset(renditions, build_url) for renditions in data['images_srcset']]
+        else:
+            value = data[field]
+        rendered[field] = value
+    return rendered
+
+
+def render_product_document(document, request):
+    """Merge the per-request parts into the document for the fields the request selects"""
+    fields = serializers.ProductDetailSerializer(context={'request': request}).fields
+    favorite_ids = serializers.get_favorite_ids(request, [document['id']]) if 'favorite' in fields else ()
+    return render_document_fields(document, fields, request.build_absolute_uri, favorite_ids)
+
+
+def get_product_summaries(lookup, values, request):
+    """
+    The list representations of the products whose id or slug is in values, by id or slug.
+
+    Products looked up by slug are rendered from their stored documents when present. The others are read in one
+    query through the compiled read path, and their missing documents are rebuilt for the next time.
+    """
+    serializer = serializers.ProductListSerializer(context={'request': request})
+    documents = {}
+    if lookup == 'slug':
+        stored = cache.get_many([get_product_document_key(slug) for slug in values])
+        documents = {document['data']['slug']: document for document in stored.values()}
+    missing = [value for value in dict.fromkeys(values) if value not in documents]
+
+    summaries = {}
+    if missing:
+        rows = serializer.get_rows(models.Product.objects.filter(**{f'{lookup}__in': missing}), lookup)
+        serializer.prepare_rows(rows)
+        to_representation = serializer.get_row_representation()
+        summaries = {getattr(row, lookup): to_representation(row) for row in rows}
+        if lookup == 'slug':
+            schedule_product_documents_rebuild([row.id for row in rows])
+    if documents:
+        fields = serializer.fields
+        favorite_ids = ()
+        if 'favorite' in fields:
+            favorite_ids = serializers.get_favorite_ids(request, [document['id'] for document in documents.values()])
+        for slug, document in documents.items():
+            summaries[slug] = render_document_fields(document, fields, request.build_absolute_uri, favorite_ids)
+    return summaries
+
+
+def schedule_product_documents_rebuild(product_ids):
+    from store.tasks import rebuild_product_documents
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), PRODUCT_DOCUMENTS_CHUNK_SIZE):
+        chunk = product_ids[start:start + PRODUCT_DOCUMENTS_CHUNK_SIZE]
+        transaction.on_commit(lambda chunk=chunk: rebuild_product_documents.delay(chunk))
+
+
+def schedule_updated_product_documents_rebuild(updated_at):
+    """Rebuild the documents of the products stamped by a bulk update, found once it is committed"""
+    from store.tasks import rebuild_updated_product_documents
+    transaction.on_commit(lambda: rebuild_updated_product_documents.delay(updated_at.isoformat()))
@@ -0,0 +1,149 @@
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from pyroaring import BitMap
+
+from store import models
+from store.versions import bump_version, get_version
+
+FACET_INDEX_VERSION_KEY = 'store:facet_index:version'
+
+
+def is_enabled():
+    return settings.STORE_FACET_INDEX
+
+
+class FacetIndex:
+    """
+    Per-process index mapping every Value id to a compressed bitmap of the ids of products having that value.
+
+    The index is built lazily on first use and kept up to date by the ProductOptionValue signals, once their
+    transaction commits. Changes made by other processes are noticed through a shared version counter, after which
+    the index is rebuilt from the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bitmaps = defaultdict(BitMap)
+        self._value_options = {}
+        self._version = None
+
+    def build(self):
+        with self._lock:
+            version = get_version(FACET_INDEX_VERSION_KEY)
+            bitmaps = defaultdict(BitMap)
+            rows = models.ProductOptionValue.objects.values_list('value_id', 'product_id')
+            for value_id, product_id in rows.iterator(chunk_size=10000):
+                bitmaps[value_id].add(product_id)
+            self._bitmaps = bitmaps
+            self._value_options = dict(models.Value.objects.values_list('id', 'option_id'))
+            self._version = version
+
+    def clear(self):
+        with self._lock:
+            self._bitmaps = defaultdict(BitMap)
+            self._value_options = {}
+            self._version = None
+
+    def ensure_fresh(self):
+        if self._version != get_version(FACET_INDEX_VERSION_KEY):
+            self.build()
+
+    def _apply(self, change):
+        # Before the commit another process would rebuild the rows of the old data under the new version,
+        # and a rollback would leave the change in the local index
+        transaction.on_commit(lambda: self._apply_committed(change))
+
+    def _apply_committed(self, change):
+        with self._lock:
+            version = bump_version(FACET_INDEX_VERSION_KEY)
+            if self._version is not None and version == self._version + 1:
+                change()
+                self._version = version
+            else:
+                # Another process changed the data in the meantime, rebuild on next use
+                self._version = None
+
+    def add(self, value_id, option_id, product_id):
+        def change():
+            self._bitmaps[value_id].add(product_id)
+            self._value_options[value_id] = option_id
+
+        self._apply(change)
+
+    def discard(self, value_id, product_id):
+        def change():
+            self._bitmaps[value_id].discard(product_id)
+
+        self._apply(change)
+
+    def set_value_option(self, value_id, option_id):
+        def change():
+            self._value_options[value_id] = option_id
+
+        self._apply(change)
+
+    def discard_value(self, value_id):
+        def change():
+            self._bitmaps.pop(value_id, None)
+            self._value_options.pop(value_id, None)
+
+        self._apply(change)
+
+    def group_by_option(self, value_ids):
+        """Group the known value ids by their option id"""
+        option_to_values = defaultdict(list)
+        for value_id in value_ids:
+            option_id = self._value_options.get(value_id)
+            if option_id is not None:
+                option_to_values[option_id].append(value_id)
+        return option_to_values
+
+    def _union(self, value_ids):
+        bitmap = BitMap()
+        for value_id in value_ids:
+            bitmap |= self._bitmaps.get(value_id, BitMap())
+        return bitmap
+
+    def match(self, value_ids):
+        """
+        Return a bitmap of products having at least one of the selected values of every selected option
+        (OR within an option, AND across options), or None when none of the values is known.
+        """
+        self.ensure_fresh()
+        with self._lock:
+            result = None
+            for values in self.group_by_option(value_ids).values():
+                bitmap = self._union(values)
+                result = bitmap if result is None else result & bitmap
+            return result
+
+    def count(self, product_ids, value_ids, selected_value_ids):
+        """
+        Return the number of the given products having each value, taking into account the selected values of
+        every option except the value's own option
+        """
+        self.ensure_fresh()
+        with self._lock:
+            selected = {
+                option_id: self._union(values)
+                for option_id, values in self.group_by_option(selected_value_ids).items()
+            }
+            products_by_option = {}
+            counts = {}
+            for value_id in value_ids:
+                option_id = self._value_options.get(value_id)
+                if option_id not in products_by_option:
+                    bitmap = product_ids
+                    for selected_option_id, selected_products in selected.items():
+                        if selected_option_id != option_id:
+                            bitmap = bitmap & selected_products
+                    products_by_option[option_id] = bitmap
+                value_products = self._bitmaps.get(value_id, BitMap())
+                counts[value_id] = products_by_option[option_id].intersection_cardinality(value_products)
+            return counts
+
+
+facet_index = FacetIndex()
@@ -0,0 +1,43 @@
+from django.core.cache import cache
+
+from store import models
+from store.versions import bump_version, get_version
+
+FAVORITES_CACHE_TIMEOUT = 60 * 60 * 24
+# Bumped by every change of the favorite counts, which only the lists ordered by them depend on
+FAVORITES_RANKING_VERSION_KEY = 'store:favorites:ranking:version'
+
+
+def get_favorites_version_key(user_id):
+    return f'store:favorites:{user_id}:version'
+
+
+def get_favorites_version(user_id):
+    return get_version(get_favorites_version_key(user_id))
+
+
+def bump_favorites_version(user_id):
+    return bump_version(get_favorites_version_key(user_id))
+
+
+def get_favorites_ranking_version():
+    return get_version(FAVORITES_RANKING_VERSION_KEY)
+
+
+def bump_favorites_ranking_version():
+    return bump_version(FAVORITES_RANKING_VERSION_KEY)
+
+
+def get_favorite_product_ids(user):
+    """
+    The ids of the products the user has in favorites, cached per version of the favorites:
+    a change of the favorites bumps the version, and the set is rebuilt on the next read
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    key = f'store:favorites:{user.pk}:{get_favorites_version(user.pk)}:product_ids'
+    product_ids = cache.get(key)
+    if product_ids is None:
+        product_ids = frozenset(models.Favorite.objects.filter(user=user).values_list('product_id', flat=True))
+        cache.set(key, product_ids, FAVORITES_CACHE_TIMEOUT)
+    return product_ids
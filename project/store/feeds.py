@@ -0,0 +1,214 @@
+import csv
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from store import models
+
+FEED_CHUNK_SIZE = 500
+FEED_CURRENCY = 'UAH'
+
+
+def get_feed_products(since=None):
+    """
+    The products of the catalog, or those changed since the given time, read through a server-side cursor
+    in chunks with their options and images prefetched per chunk
+    """
+    queryset = models.Product.objects.order_by('id')
+    if since is None:
+        queryset = queryset.filter(is_published=True)
+    else:
+        # Unpublished products are listed too, as unavailable offers
+        queryset = queryset.filter(updated_at__gt=since)
+    return queryset.only(
+        'id', 'category', 'name', 'slug', 'price', 'discount_price', 'description', 'image', 'is_published',
+    ).prefetch_related(
+        Prefetch(
+            'options_values',
+            queryset=models.ProductOptionValue.objects.select_related('option', 'value').only(
+                'product', 'option__name', 'value__name'
+            ).order_by('id'),
+        ),
+        Prefetch('images', queryset=models.ProductImage.objects.only('product', 'image').order_by('id')),
+    ).iterator(chunk_size=FEED_CHUNK_SIZE)
+
+
+def get_last_feed_time(name):
+    return models.FeedExport.objects.filter(feed=name).values_list('exported_at', flat=True).first()
+
+
+def set_last_feed_time(name, time):
+    models.FeedExport.objects.update_or_create(feed=name, defaults={'exported_at': time})
+
+
+def element(tag, value, **attrs):
+    """An XML element with the value escaped, nothing for an empty value"""
+    if value is None or value == '':
+        return ''
+    attributes = ''.join(f' {key}={quoteattr(str(attr))}' for key, attr in attrs.items())
+    return f'<{tag}{attributes}>{escape(str(value))}</{tag}>'
+
+
+class Feed:
+    """
+    A catalog feed rendered product by product, so that it can be streamed with bounded memory.
+    build_url makes the absolute url of a path, since limits the feed to the products changed after that time.
+    Unpublished products are listed as unavailable, deleted products are not listed: they only leave
+    the catalogs that load the feeds incrementally with the next full feed. Incremental feeds overlap,
+    a product may be listed again unchanged.
+    """
+    content_type = None
+    extension = None
+
+    def __init__(self, build_url, since=None):
+        self.build_url = build_url
+        self.since = since
+        self.categories = list(models.Category.objects.filter(hide=False).values_list('id', 'parent_id', 'name'))
+        self.category_names = {category_id: name for category_id, _, name in self.categories}
+
+    def get_product_url(self, product):
+        return settings.STORE_FEED_PRODUCT_URL.format(slug=product.slug)
+
+    def get_image_urls(self, product):
+        names = [product.image.name if product.image else None, *(image.image.name for image in product.images.all())]
+        return [self.build_url(product.image.storage.url(name)) for name in names if name]
+
+    def get_params(self, product):
+        return [(option_value.option.name, option_value.value.name) for option_value in product.options_values.all()]
+
+    def header(self):
+        return ''
+
+    def render_product(self, product):
+        raise NotImplementedError
+
+    def footer(self):
+        return ''
+
+    def stream(self):
+        yield self.header()
+        for product in get_feed_products(self.since):
+            yield self.render_product(product)
+        yield self.footer()
+
+
+class YmlFeed(Feed):
+    """Yandex Market Language"""
+    content_type = 'application/xml; charset=utf-8'
+    extension = 'xml'
+
+    def header(self):
+        date = timezone.localtime().strftime('%Y-%m-%d %H:%M')
+        categories = ''.join(
+            element('category', name, id=category_id, **({'parentId': parent_id} if parent_id else {}))
+            for category_id, parent_id, name in self.categories
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<yml_catalog date={quoteattr(date)}><shop>'
+            f'{element("name", settings.STORE_FEED_SHOP_NAME)}'
+            f'{element("company", settings.STORE_FEED_SHOP_NAME)}'
+            f'{element("url", settings.DOMAIN)}'
+            f'<currencies><currency id="{FEED_CURRENCY}" rate="1"/></currencies>'
+            f'<categories>{categories}</categories>'
+            '<offers>\n'
+        )
+
+    def render_product(self, product):
+        parts = [
+            element('url', self.get_product_url(product)),
+            element('price', product.discount_price or product.price),
+            element('oldprice', product.price if product.discount_price else None),
+            element('currencyId', FEED_CURRENCY),
+            element('categoryId', product.category_id),
+            *(element('picture', url) for url in self.get_image_urls(product)),
+            element('name', product.name),
+            element('description', product.description),
+            *(element('param', value, name=name) for name, value in self.get_params(product)),
+        ]
+        available = 'true' if product.is_published else 'false'
+        return f'<offer id="{product.id}" available="{available}">{"".join(parts)}</offer>\n'
+
+    def footer(self):
+        return '</offers></shop></yml_catalog>\n'
+
+
+class GoogleMerchantFeed(Feed):
+    """Google Merchant Center RSS 2.0 product data"""
+    content_type = 'application/xml; charset=utf-8'
+    extension = 'xml'
+
+    def header(self):
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0"><channel>'
+            f'{element("title", settings.STORE_FEED_SHOP_NAME)}'
+            f'{element("link", settings.DOMAIN)}'
+            f'{element("description", settings.STORE_FEED_SHOP_NAME)}\n'
+        )
+
+    def render_product(self, product):
+        image_urls = self.get_image_urls(product)
+        parts = [
+            element('g:id', product.id),
+            element('g:title', product.name),
+            element('g:description', product.description),
+            element('g:link', self.get_product_url(product)),
+            element('g:image_link', image_urls[0] if image_urls else None),
+            *(element('g:additional_image_link', url) for url in image_urls[1:11]),
+            element('g:availability', 'in_stock' if product.is_published else 'out_of_stock'),
+            element('g:price', f'{product.price} {FEED_CURRENCY}'),
+            element('g:sale_price', product.discount_price and f'{product.discount_price} {FEED_CURRENCY}'),
+            element('g:product_type', self.category_names.get(product.category_id)),
+        ]
+        return f'<item>{"".join(parts)}</item>\n'
+
+    def footer(self):
+        return '</channel></rss>\n'
+
+
+class Echo:
+    """A file-like object returning what is written to it, for csv.writer to render a row at a time"""
+
+    def write(self, value):
+        return value
+
+
+class CsvFeed(Feed):
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+    columns = ('id', 'slug', 'name', 'description', 'price', 'sale_price', 'category', 'link', 'image_link',
+               'additional_image_links', 'available', 'params')
+
+    def __init__(self, build_url, since=None):
+        super().__init__(build_url, since)
+        self.writer = csv.writer(Echo())
+
+    def header(self):
+        return self.writer.writerow(self.columns)
+
+    def render_product(self, product):
+        image_urls = self.get_image_urls(product)
+        return self.writer.writerow([
+            product.id,
+            product.slug,
+            product.name,
+            product.description,
+            product.price,
+            product.discount_price or '',
+            self.category_names.get(product.category_id, ''),
+            self.get_product_url(product),
+            image_urls[0] if image_urls else '',
+            ' '.join(image_urls[1:]),
+            int(product.is_published),
+            '; '.join(f'{name}: {value}' for name, value in self.get_params(product)),
+        ])
+
+
+FEEDS = {
+    'yml': YmlFeed,
+    'google': GoogleMerchantFeed,
+    'csv': CsvFeed,
+}
@@ -1,10 +1,14 @@
 from collections import defaultdict
 
-from django.db.models import Q
-from django.db.models.functions import Coalesce
+from django.contrib.postgres.fields import ArrayField
+from django.db import models
+from django.db.models import Count, Exists, F, Lookup, OuterRef, Q
 from django_filters import rest_framework as filters
+from pyroaring import BitMap
 
-from store.models import Value
+from store import facets
+from store.models import ProductOptionValue, Value
+from store.search import search_products
 
 
 class CustomOrderFilter(filters.OrderingFilter):
@@ -13,20 +17,33 @@ class CustomOrderFilter(filters.OrderingFilter):
         self.extra['choices'] += [
             ('price', 'Price'),
             ('-price', 'Price (descending)'),
+            ('favorites', 'Favorites'),
+            ('-favorites', 'Favorites (descending)'),
         ]
 
     def filter(self, qs, value):
         if value and any(v in ['price', '-price'] for v in value):
             return order_by_price(qs, value)
+        if value and any(v in ['favorites', '-favorites'] for v in value):
+            return order_by_favorites(qs, value)
         return super().filter(qs, value)
 
 
 def order_by_price(queryset, value: list):
-    order_field = Coalesce('discount_price', 'price')
     if '-price' in value:
-        queryset = queryset.order_by(order_field.desc(), '-price')
+        queryset = queryset.order_by('-effective_price')
     if 'price' in value:
-        queryset = queryset.order_by(order_field.asc(), 'price')
+        queryset = queryset.order_by('effective_price')
+    return queryset
+
+
+def order_by_favorites(queryset, value: list):
+    # The cursors seek on the counts, which move between pages: a product whose count changed may be skipped or
+    # listed twice. The ETags of these lists follow the ranking version, which tells clients to start over.
+    if '-favorites' in value:
+        queryset = queryset.order_by('-favorites_count')
+    if 'favorites' in value:
+        queryset = queryset.order_by('favorites_count')
     return queryset
 
 
@@ -34,7 +51,7 @@ class ProductFilter(filters.FilterSet):
     price_min = filters.NumberFilter(field_name='price_min', method='filter_price_min', label='Price min')
     price_max = filters.NumberFilter(field_name='price_max', method='filter_price_max', label='Price max')
     value = filters.CharFilter(field_name='value', method='filter_value', label='Values')
-    s = filters.CharFilter(field_name='name', lookup_expr='icontains')
+    s = filters.CharFilter(field_name='s', method='filter_search', label='Search')
     o = CustomOrderFilter()
 
     def filter_price_min(self, queryset, name, value):
@@ -47,28 +64,110 @@ class ProductFilter(filters.FilterSet):
         queryset = filter_by_values(queryset, value)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        queryset = search_products(queryset, value)
+        if 'search_rank' in queryset.query.annotations and not self.data.get('o'):
+            queryset = queryset.order_by('-search_rank')
+        return queryset
+
 
 def filter_by_price(queryset, price_min=None, price_max=None):
     price_filters = Q()
     if price_max:
-        price_filters &= Q(discount_price__lte=price_max) | Q(price__lte=price_max)
+        price_filters &= Q(effective_price__lte=price_max)
     if price_min:
-        price_filters &= Q(discount_price__gte=price_min) | Q(price__gte=price_min)
+        price_filters &= Q(effective_price__gte=price_min)
     return queryset.filter(price_filters)
 
 
+def parse_value_ids(value):
+    return [int(value_id) for value_id in value.split(',') if value_id.strip().isdecimal()]
+
+
 def filter_by_values(queryset, value):
-    if value:
-        value_ids = value.split(',')
-        option_value_ids = Value.objects.filter(id__in=value_ids).values_list('option__id', 'id')
-        option_id_to_values = defaultdict(list)
-        for option_id, value_id in option_value_ids:
-            option_id_to_values[option_id].append(value_id)
-        for values_ids in option_id_to_values.values():
-            queryset = queryset.filter(options_values__value__in=values_ids)
+    """
+    Filter the products having at least one of the selected values of every selected option,
+    using the in-memory facet index unless it is switched off by settings.STORE_FACET_INDEX
+    """
+    if not value:
+        return queryset
+    value_ids = parse_value_ids(value)
+    if facets.is_enabled():
+        product_ids = facets.facet_index.match(value_ids)
+        if product_ids is None:
+            return queryset
+        return filter_by_ids(queryset, product_ids)
+    return filter_by_values_sql(queryset, value_ids)
+
+
+class EqualsAny(Lookup):
+    """lhs = ANY(rhs), rhs being an array"""
+    lookup_name = 'equals_any'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} = ANY({rhs})', [*lhs_params, *rhs_params]
+
+
+def filter_by_ids(queryset, ids):
+    """The ids go in a single array parameter, however many of them match"""
+    array = models.Value(list(ids), output_field=ArrayField(models.IntegerField()))
+    return queryset.filter(EqualsAny(F('id'), array))
+
+
+def filter_by_values_sql(queryset, value_ids):
+    option_value_ids = Value.objects.filter(id__in=value_ids).values_list('option__id', 'id')
+    option_id_to_values = defaultdict(list)
+    for option_id, value_id in option_value_ids:
+        option_id_to_values[option_id].append(value_id)
+    return filter_by_option_values(queryset, option_id_to_values)
+
+
+def filter_by_option_values(queryset, option_id_to_values):
+    for values_ids in option_id_to_values.values():
+        # EXISTS instead of a JOIN per option, so the products are not duplicated
+        queryset = queryset.filter(Exists(
+            ProductOptionValue.objects.filter(product=OuterRef('pk'), value__in=values_ids)
+        ))
     return queryset
 
 
+def count_values(queryset, value_ids, selected_value_ids):
+    """
+    Return {value_id: count} of the queryset products having each value, honouring the selected values
+    of every option except the value's own one. Takes one facet index lookup, or grouped queries in the SQL mode
+    """
+    if facets.is_enabled():
+        product_ids = BitMap(queryset.values_list('id', flat=True))
+        return facets.facet_index.count(product_ids, value_ids, selected_value_ids)
+    return count_values_sql(queryset, value_ids, selected_value_ids)
+
+
+def count_values_sql(queryset, value_ids, selected_value_ids):
+    value_options = dict(Value.objects.filter(id__in=[*value_ids, *selected_value_ids]).values_list('id', 'option_id'))
+    selected_options = defaultdict(list)
+    for value_id in selected_value_ids:
+        if value_id in value_options:
+            selected_options[value_options[value_id]].append(value_id)
+
+    def count(products, values):
+        rows = ProductOptionValue.objects.filter(
+            product__in=products, value__in=values
+        ).values('value_id').annotate(count=Count('product_id', distinct=True))
+        return {row['value_id']: row['count'] for row in rows}
+
+    # Values of unselected options are counted in one query against the products matching every selection,
+    # values of a selected option against the products matching the selections of the other options
+    unselected_values = [value_id for value_id in value_ids if value_options.get(value_id) not in selected_options]
+    counts = count(filter_by_option_values(queryset, selected_options), unselected_values)
+    for option_id in selected_options:
+        other_options = {other: values for other, values in selected_options.items() if other != option_id}
+        option_values = [value_id for value_id in value_ids if value_options.get(value_id) == option_id]
+        counts.update(count(filter_by_option_values(queryset, other_options), option_values))
+    return {value_id: counts.get(value_id, 0) for value_id in value_ids}
+
+
 def product_filter(queryset, query_params):
     """Custom filter"""
 
@@ -0,0 +1,138 @@
+import posixpath
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+RENDITION_WIDTHS = (320, 640, 1024, 1600)
+RENDITION_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+RENDITIONS_DIR = 'renditions'
+RENDITION_REQUEST_TIMEOUT = 60 * 10
+
+
+def get_renditions_field_name(field_name):
+    return f'{field_name}_renditions'
+
+
+def get_rendition_widths(width):
+    # Never upscale: the largest rendition of a narrower image is the image at its own width
+    widths = [rendition_width for rendition_width in RENDITION_WIDTHS if rendition_width < width]
+    if len(widths) < len(RENDITION_WIDTHS):
+        widths.append(width)
+    return widths
+
+
+def open_source_image(name):
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        # Palette and alpha images are flattened onto white, as JPEG has no transparency
+        if image.mode != 'RGB':
+            background = Image.new('RGB', image.size, 'white')
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        return image
+
+
+def render_variants(name):
+    """
+    Resize the stored image to every rendition width in every format and save the results.
+    The variants are encoded from pixel data only, so EXIF, ICC and other metadata are dropped.
+    """
+    image = open_source_image(name)
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    variants = []
+    for width in get_rendition_widths(image.width):
+        height = max(round(image.height * width / image.width), 1)
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for extension, options in RENDITION_FORMATS.items():
+            content = BytesIO()
+            resized.save(content, **options)
+            variant_name = default_storage.save(
+                posixpath.join(RENDITIONS_DIR, f'{stem}_{width}.{extension}'), ContentFile(content.getvalue())
+            )
+            variants.append({'name': variant_name, 'format': extension, 'width': width, 'height': height})
+    return {'source': name, 'width': image.width, 'height': image.height, 'variants': variants}
+
+
+def delete_variants(renditions):
+    for variant in renditions.get('variants', ()):
+        default_storage.delete(variant['name'])
+
+
+def get_current_renditions(name, renditions):
+    """The recorded renditions of the image file, or None if they are missing or were made from another file"""
+    if name and renditions.get('source') == name:
+        return renditions
+    return None
+
+
+def request_renditions(label, pk, field_name, name):
+    """Enqueue creating the renditions of the image, at most once per image file until the timeout"""
+    from store.tasks import create_image_renditions
+    if not name or not cache.add(f'store:renditions:requested:{name}', 1, RENDITION_REQUEST_TIMEOUT):
+        return
+    transaction.on_commit(lambda: create_image_renditions.delay(label, pk, field_name))
+
+
+def get_image_renditions(label, pk, field_name, name, renditions):
+    """The current renditions of the image, requesting them when they are missing"""
+    current = get_current_renditions(name, renditions)
+    if current is None:
+        request_renditions(label, pk, field_name, name)
+    return current
+
+
+def get_renditions(obj, field_name):
+    image = getattr(obj, field_name)
+    renditions = getattr(obj, get_renditions_field_name(field_name))
+    return get_image_renditions(obj._meta.label, obj.pk, field_name, image.name if image else None, renditions)
+
+
+def get_row_renditions(model, row, field_name):
+    """get_renditions() for a named values_list() row, holding the file name and the renditions of the field"""
+    renditions = getattr(row, get_renditions_field_name(field_name))
+    return get_image_renditions(model._meta.label, row.id, field_name, getattr(row, field_name), renditions)
+
+
+def format_srcset(renditions, build_url):
+    """
+    Turn the recorded renditions into the srcset of each format, e.g.
+    {'width': 1600, 'height': 1200, 'srcset': {'webp': 'a_320.webp 320w, a_640.webp 640w', 'jpeg': ...}}
+    """
+    if not renditions:
+        return None
+    srcset = {}
+    for variant in renditions['variants']:
+        url = build_url(default_storage.url(variant['name']))
+        srcset.setdefault(variant['format'], []).append(f'{url} {variant["width"]}w')
+    return {
+        'width': renditions['width'],
+        'height': renditions['height'],
+        'srcset': {image_format: ', '.join(candidates) for image_format, candidates in srcset.items()},
+    }
+
+
+def create_renditions(label, pk, field_name):
+    """Render the variants of the image currently stored in the field and record them on the object"""
+    model = apps.get_model(label)
+    obj = model.objects.filter(pk=pk).first()
+    if obj is None or not getattr(obj, field_name):
+        return None
+    name = getattr(obj, field_name).name
+    previous = getattr(obj, get_renditions_field_name(field_name))
+    renditions = get_current_renditions(name, previous)
+    if renditions is None:
+        renditions = render_variants(name)
+        # The update bypasses save() and its signals, which would request the renditions again
+        model.objects.filter(pk=pk).update(**{get_renditions_field_name(field_name): renditions})
+        delete_variants(previous)
+    return renditions
@@ -0,0 +1,55 @@
+import gzip
+from argparse import ArgumentTypeError
+from datetime import timedelta
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from store.feeds import FEEDS, get_last_feed_time, set_last_feed_time
+
+
+def parse_since(value):
+    since = parse_datetime(value)
+    if since is None:
+        raise ArgumentTypeError(f'{value!r} is not an ISO 8601 date and time')
+    return timezone.make_aware(since) if timezone.is_naive(since) else since
+
+
+class Command(BaseCommand):
+    help = (
+        'Write a catalog feed to a file, gzipped when its name ends with .gz. Incremental feeds list unpublished '
+        'products as unavailable, deleted products are not listed: write a full feed to drop them. They reach '
+        'back STORE_FEED_OVERLAP seconds before the previous feed, and may repeat the products it listed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('feed', choices=sorted(FEEDS))
+        parser.add_argument('output', help='Path of the file to write')
+        changes = parser.add_mutually_exclusive_group()
+        changes.add_argument(
+            '--incremental', action='store_true',
+            help='Only the products changed since the last feed of this kind was written',
+        )
+        changes.add_argument(
+            '--since', type=parse_since, help='Only the products changed since this ISO 8601 date and time',
+        )
+
+    def handle(self, feed, output, incremental, since, **options):
+        if incremental:
+            since = get_last_feed_time(feed)
+        # Taken before the products are read, changes made while writing go into the next feed. The products
+        # stamped before it by transactions committed after the read are caught by the overlap.
+        started_at = timezone.now()
+        feed_class = FEEDS[feed]
+        open_output = gzip.open if output.endswith('.gz') else open
+        with open_output(output, 'wt', encoding='utf-8', newline='') as file:
+            for chunk in feed_class(lambda path: urljoin(settings.DOMAIN, path), since).stream():
+                file.write(chunk)
+        set_last_feed_time(feed, started_at - timedelta(seconds=settings.STORE_FEED_OVERLAP))
+        if since is None:
+            self.stdout.write(f'Wrote the {feed} feed to {output}')
+        else:
+            self.stdout.write(f'Wrote the {feed} feed of the products changed since {since.isoformat()} to {output}')
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_effective_price(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    Product.objects.update(effective_price=Coalesce("discount_price", "price"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0016_alter_product_discount_price_alter_product_price_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="effective_price",
+            field=models.DecimalField(
+                decimal_places=2, editable=False, max_digits=7, null=True
+            ),
+        ),
+        migrations.RunPython(fill_effective_price, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="product",
+            name="effective_price",
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=7),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "effective_price"], name="store_prod_cat_price_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def fill_search_vector(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    Product.objects.update(
+        search_vector=SearchVector("name", weight="A", config="simple")
+        + SearchVector("description", weight="B", config="simple")
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0017_product_effective_price"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="store_prod_search_vector_idx"
+            ),
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX store_prod_name_trgm_idx ON store_product USING gin (name gin_trgm_ops);",
+            reverse_sql="DROP INDEX store_prod_name_trgm_idx;",
+        ),
+    ]
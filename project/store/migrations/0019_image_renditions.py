@@ -0,0 +1,27 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0018_product_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="image_renditions",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="image_renditions",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="productimage",
+            name="image_renditions",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+    ]
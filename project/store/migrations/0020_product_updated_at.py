@@ -0,0 +1,23 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:39
+
+from django.db import migrations, models
+
+
+def fill_updated_at(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    Product.objects.update(updated_at=models.F("created_at"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0019_image_renditions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.10 on 2026-10-18 18:13
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def delete_duplicate_favorites(apps, schema_editor):
+    # Keeps the earliest favorite of every user and product
+    Favorite = apps.get_model("store", "Favorite")
+    earlier = Favorite.objects.filter(
+        user_id=OuterRef("user_id"), product_id=OuterRef("product_id"), id__lt=OuterRef("id")
+    )
+    Favorite.objects.filter(Exists(earlier)).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0020_product_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_favorites, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="favorite",
+            constraint=models.UniqueConstraint(
+                fields=("user", "product"), name="store_favorite_unique_user_product"
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.10 on 2026-10-18 18:22
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_favorites_count(apps, schema_editor):
+    Favorite = apps.get_model("store", "Favorite")
+    Product = apps.get_model("store", "Product")
+    favorites = Favorite.objects.filter(product=OuterRef("pk")).order_by().values("product")
+    count = favorites.annotate(count=Count("pk")).values("count")
+    Product.objects.update(favorites_count=Coalesce(Subquery(count), 0))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0021_favorite_unique_user_product"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="favorites_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_favorites_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["-favorites_count", "-created_at", "-id"], name="store_prod_favorites_idx"
+            ),
+        ),
+    ]
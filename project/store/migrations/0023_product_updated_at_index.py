@@ -0,0 +1,16 @@
+# Generated by Django 4.1.10 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0022_product_favorites_count"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["updated_at"], name="store_prod_updated_at_idx"),
+        ),
+    ]
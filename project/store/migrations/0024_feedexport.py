@@ -0,0 +1,28 @@
+# Generated by Django 4.1.10 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0023_product_updated_at_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedExport",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("feed", models.CharField(max_length=20, unique=True)),
+                ("exported_at", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,13 +1,19 @@
+from datetime import datetime
 from math import ceil
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import ValidationError
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from django.utils.text import slugify
 from mptt.fields import TreeForeignKey
 from mptt.models import MPTTModel
 from unidecode import unidecode
 
 from accounts.models import User
+from store.search import get_search_vector
 
 
 class Category(MPTTModel):
@@ -16,6 +22,8 @@ class Category(MPTTModel):
                             db_index=True)
     slug = models.SlugField(max_length=100, unique=True)
     image = models.ImageField(blank=True, null=True, upload_to='images/')
+    # Resized variants of the image, recorded by store.images.create_renditions
+    image_renditions = models.JSONField(default=dict, editable=False)
     hide = models.BooleanField(default=False)
 
     def save(self, *args, **kwargs):
@@ -34,18 +42,155 @@ class Category(MPTTModel):
         return self.name
 
 
+def get_price_expression(value):
+    if hasattr(value, 'resolve_expression'):
+        return value
+    return models.Value(value, output_field=models.DecimalField(max_digits=7, decimal_places=2))
+
+
+# The versions are bumped and the documents dropped once the writes are committed, else a concurrent read would
+# cache the old rows under the new versions
+def bump_category_versions(category_ids):
+    from store.categories import bump_category_versions
+    transaction.on_commit(lambda: bump_category_versions(category_ids))
+
+
+def delete_product_documents(slugs):
+    from store.documents import delete_product_documents
+    transaction.on_commit(lambda: delete_product_documents(slugs))
+
+
+def schedule_product_documents_rebuild(product_ids):
+    from store.documents import schedule_product_documents_rebuild
+    schedule_product_documents_rebuild(product_ids)
+
+
+def schedule_updated_product_documents_rebuild(updated_at):
+    from store.documents import schedule_updated_product_documents_rebuild
+    schedule_updated_product_documents_rebuild(updated_at)
+
+
+def bump_favorites_version(user_id):
+    from store.favorites import bump_favorites_version
+    transaction.on_commit(lambda: bump_favorites_version(user_id))
+
+
+def bump_favorites_ranking_version():
+    from store.favorites import bump_favorites_ranking_version
+    transaction.on_commit(bump_favorites_ranking_version)
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Keeps the stored effective price, search vector and updated_at in sync on bulk writes that bypass
+    Product.save(), bumps the versions of the categories whose products were written and rebuilds their documents
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        for obj in objs:
+            obj.set_effective_price()
+            obj.set_search_vector()
+        objs = super().bulk_create(objs, *args, **kwargs)
+        bump_category_versions({obj.category_id for obj in objs})
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        updated_at = timezone.now()
+        for obj in objs:
+            obj.updated_at = updated_at
+        fields = [*fields, 'updated_at']
+        if {'price', 'discount_price'} & set(fields):
+            for obj in objs:
+                obj.set_effective_price()
+            fields = [*fields, 'effective_price']
+        if {'name', 'description'} & set(fields):
+            for obj in objs:
+                obj.set_search_vector()
+            fields = [*fields, 'search_vector']
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        bump_category_versions({obj.category_id for obj in objs})
+        schedule_product_documents_rebuild([obj.pk for obj in objs])
+        return rows
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        if 'price' in kwargs or 'discount_price' in kwargs:
+            kwargs['effective_price'] = Coalesce(
+                get_price_expression(kwargs.get('discount_price', models.F('discount_price'))),
+                get_price_expression(kwargs.get('price', models.F('price'))),
+                output_field=models.DecimalField(max_digits=7, decimal_places=2),
+            )
+        if 'name' in kwargs or 'description' in kwargs:
+            kwargs['search_vector'] = get_search_vector(
+                kwargs.get('name', models.F('name')),
+                kwargs.get('description', models.F('description')),
+            )
+        updated_at = kwargs['updated_at']
+        category_ids = set(self.order_by().values_list('category_id', flat=True).distinct())
+        slugs = list(self.values_list('slug', flat=True)) if 'slug' in kwargs else []
+        # The updated rows are found by their stamp once committed, unless it is an expression
+        product_ids = None if isinstance(updated_at, datetime) else list(self.values_list('id', flat=True))
+        rows = super().update(**kwargs)
+        if 'category' in kwargs or 'category_id' in kwargs:
+            category = kwargs.get('category', kwargs.get('category_id'))
+            category_ids.add(getattr(category, 'pk', category))
+        bump_category_versions(category_ids)
+        if slugs:
+            delete_product_documents(slugs)
+        if product_ids is not None:
+            schedule_product_documents_rebuild(product_ids)
+        elif rows:
+            schedule_updated_product_documents_rebuild(updated_at)
+        return rows
+
+    def touch(self):
+        """Mark the products as changed, after a change of the related rows they are served with"""
+        return self.update(updated_at=timezone.now())
+
+    def update_counters(self, **kwargs):
+        """Update counters that are not served with the products, without marking the products changed"""
+        return super().update(**kwargs)
+
+    def add_favorites_count(self, delta):
+        return self.update_counters(favorites_count=Greatest(models.F('favorites_count') + delta, 0))
+
+    def reconcile_favorites_count(self):
+        """Set the favorite counts that drifted from the favorites, returning the number of products fixed"""
+        favorites = Favorite.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+        favorites_count = Coalesce(models.Subquery(favorites.annotate(count=models.Count('pk')).values('count')), 0)
+        return self.exclude(favorites_count=favorites_count).update_counters(favorites_count=favorites_count)
+
+
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     image = models.ImageField(blank=True, null=True, upload_to='images/')
+    image_renditions = models.JSONField(default=dict, editable=False)
     name = models.CharField(max_length=250, )
     slug = models.SlugField(max_length=100, unique=True)
     price = models.DecimalField(max_digits=7, decimal_places=2)
     discount_price = models.DecimalField(max_digits=7, decimal_places=2, blank=True, null=True, )
+    # The selling price (discount_price or price), stored so price filters and sorting can use an index
+    effective_price = models.DecimalField(max_digits=7, decimal_places=2, editable=False)
     description = models.TextField()
     is_published = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Number of users having the product in favorites, kept by the favorite writes and reconciled by a task
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
+        # The pg_trgm index on name used by the search typo fallback is created in migrations
+        indexes = [
+            models.Index(fields=['category', 'effective_price'], name='store_prod_cat_price_idx'),
+            GinIndex(fields=['search_vector'], name='store_prod_search_vector_idx'),
+            # Matches the keyset ordering of the most wished products, tiebreakers included
+            models.Index(fields=['-favorites_count', '-created_at', '-id'], name='store_prod_favorites_idx'),
+            # The incremental catalog feeds read the products changed since the last one
+            models.Index(fields=['updated_at'], name='store_prod_updated_at_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 name="%(app_label)s_%(class)s_price_not_negative",
@@ -73,10 +218,28 @@ class Product(models.Model):
         if self.discount_price == 0:
             raise ValidationError(f"Discount price can't be 0. Maybe you wanted to leave it empty")
 
+    def set_effective_price(self):
+        self.effective_price = self.discount_price or self.price
+
+    def set_search_vector(self):
+        self.search_vector = get_search_vector(self.name, self.description)
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(unidecode(self.name))
+        self.set_effective_price()
+        self.set_search_vector()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = {*update_fields, 'updated_at'}
+            if {'price', 'discount_price'} & update_fields:
+                update_fields.add('effective_price')
+            if {'name', 'description'} & update_fields:
+                update_fields.add('search_vector')
+            kwargs['update_fields'] = update_fields
         super(Product, self).save(*args, **kwargs)
+        # The vector is computed by the database, it is loaded again on access
+        self.__dict__.pop('search_vector', None)
 
     def __str__(self):
         return self.name
@@ -106,10 +269,80 @@ class ProductOptionValue(models.Model):
         return f'{self.id}: {self.product.name[:15]} : {self.option.name}'
 
 
+class FavoriteQuerySet(models.QuerySet):
+    """
+    Adds and removes the favorites of a user by product slug, each in a single statement, shifting the favorite
+    counts of the products in the same transaction.
+    The statements bypass the model signals, the favorites versions are bumped here instead.
+    """
+
+    def execute(self, sql, params):
+        """Run a statement, returning the first column of its rows"""
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_sql_names(self):
+        quote_name = connections[self.db].ops.quote_name
+        favorite, product = self.model._meta, Product._meta
+        return {
+            'favorite': quote_name(favorite.db_table),
+            'user_id': quote_name(favorite.get_field('user').column),
+            'product_id': quote_name(favorite.get_field('product').column),
+            'product': quote_name(product.db_table),
+            'id': quote_name(product.pk.column),
+            'slug': quote_name(product.get_field('slug').column),
+        }
+
+    def changed(self, user, product_ids, delta):
+        if product_ids:
+            Product.objects.using(self.db).filter(pk__in=product_ids).add_favorites_count(delta)
+            bump_favorites_version(user.pk)
+            bump_favorites_ranking_version()
+        return product_ids
+
+    def add(self, user, slugs):
+        """Add the products with the slugs to the favorites of the user, returning the ids of those not there yet"""
+        if not slugs:
+            return []
+        names = self.get_sql_names()
+        with transaction.atomic(using=self.db):
+            product_ids = self.execute(
+                'INSERT INTO {favorite} ({user_id}, {product_id}) '
+                'SELECT %s, {id} FROM {product} WHERE {slug} = ANY(%s) '
+                'ON CONFLICT ({user_id}, {product_id}) DO NOTHING '
+                'RETURNING {product_id}'.format(**names),
+                [user.pk, list(slugs)],
+            )
+            return self.changed(user, product_ids, 1)
+
+    def remove(self, user, slugs):
+        """Remove the products with the slugs from the favorites of the user, returning the ids of those removed"""
+        if not slugs:
+            return []
+        names = self.get_sql_names()
+        with transaction.atomic(using=self.db):
+            product_ids = self.execute(
+                'DELETE FROM {favorite} USING {product} '
+                'WHERE {favorite}.{product_id} = {product}.{id} '
+                'AND {favorite}.{user_id} = %s AND {product}.{slug} = ANY(%s) '
+                'RETURNING {favorite}.{product_id}'.format(**names),
+                [user.pk, list(slugs)],
+            )
+            return self.changed(user, product_ids, -1)
+
+
 class Favorite(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='favorites')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products_favorites')
 
+    objects = FavoriteQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'product'), name='%(app_label)s_%(class)s_unique_user_product'),
+        ]
+
     def __str__(self):
         return f'{self.user.username} - {self.product.name[:15]}'
 
@@ -117,6 +350,7 @@ class Favorite(models.Model):
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(blank=True, null=True, upload_to='images/', )
+    image_renditions = models.JSONField(default=dict, editable=False)
 
 
 class ProductFilter(models.Model):
@@ -128,3 +362,12 @@ class ProductFilter(models.Model):
     class Meta:
         ordering = ['position']
         unique_together = ['category', 'option']
+
+
+class FeedExport(models.Model):
+    """The time the next incremental feed lists the products changed since: the start of the last, less an overlap"""
+    feed = models.CharField(max_length=20, unique=True)
+    exported_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.feed} - {self.exported_at}'
@@ -0,0 +1,220 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def get_estimated_count(queryset):
+    """Number of rows the planner expects the queryset to return, without counting them"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def encode_position_value(value):
+    # Keeps full precision, as the values are compared for equality when seeking
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f'Object of type {value.__class__.__name__} is not JSON serializable')
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination seeking past the last row of the previous page instead of using OFFSET,
+    so deep pages cost the same as the first one.
+
+    Works with whatever ordering the filters applied to the queryset; created_at and id are appended
+    as tiebreakers so that every position is unique.
+    """
+    page_size = 24
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    default_ordering = ('id',)
+    tiebreakers = ('created_at', 'id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering)
+        position, reverse = self.decode_cursor(request, queryset)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.count = get_estimated_count(queryset)
+
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(position, reverse))
+        if reverse:
+            queryset = queryset.reverse()
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or self.default_ordering)
+        if not all(isinstance(field, str) for field in ordering):
+            raise ImproperlyConfigured(f'{self.__class__.__name__} supports ordering by field names only')
+        descending = ordering[0].startswith('-')
+        names = {field.lstrip('-') for field in ordering}
+        if 'id' not in names and 'pk' not in names:
+            ordering += [f'-{field}' if descending else field for field in self.tiebreakers if field not in names]
+        return ordering
+
+    def get_seek_filter(self, position, reverse):
+        """(k1, k2, ...) > (v1, v2, ...) expanded per key, as the keys may be sorted in different directions"""
+        seek_filter = Q()
+        equal_filter = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            seek_filter |= equal_filter & Q(**{f'{name}__{lookup}': value})
+            equal_filter &= Q(**{name: value})
+        return seek_filter
+
+    def get_position(self, instance):
+        return [getattr(instance, field.lstrip('-')) for field in self.ordering]
+
+    def get_ordering_field(self, queryset, name):
+        """The model field or annotation the queryset is ordered by"""
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        if name == 'pk':
+            return queryset.model._meta.pk
+        return queryset.model._meta.get_field(name)
+
+    def decode_cursor(self, request, queryset):
+        """The position and direction of the cursor, its values converted by the fields they are compared with"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse = cursor['p'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, BinasciiError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                self.get_ordering_field(queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (ValidationError, FieldDoesNotExist, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        # The seek filter can not compare with null
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        cursor = {'p': position, 'r': int(reverse)}
+        encoded = urlsafe_b64encode(json.dumps(cursor, default=encode_position_value).encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'count': self.count,
+            'results': data,
+        })
+
+    def relink(self, data, request):
+        """Point the next and previous links of a paginated response at the url of the given request"""
+        url = request.build_absolute_uri()
+        data = dict(data)
+        for name in ('next', 'previous'):
+            if data[name] is not None:
+                cursor = parse_qs(urlsplit(data[name]).query).get(self.cursor_query_param)
+                if cursor:
+                    data[name] = replace_query_param(url, self.cursor_query_param, cursor[0])
+                else:
+                    data[name] = remove_query_param(url, self.cursor_query_param)
+        return data
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {
+                    'type': 'integer',
+                    'nullable': True,
+                    'description': f'Planner estimate of the total, returned with {self.count_query_param}=approx',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results to return per page, up to {self.max_page_size}',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Pass "approx" to get an estimated total count',
+                'schema': {'type': 'string', 'enum': ['approx']},
+            },
+        ]
@@ -0,0 +1,89 @@
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.utils.http import urlencode
+from rest_framework.response import Response
+
+from store.filters import parse_value_ids
+
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+
+
+def normalize_number(value):
+    try:
+        return format(Decimal(value).normalize(), 'f')
+    except InvalidOperation:
+        # Left for the filter to reject
+        return value
+
+
+def normalize_field_names(value):
+    return ','.join(sorted({name.strip() for name in value.split(',')} - {''}))
+
+
+def canonicalize_query_params(query_params):
+    """
+    The product list query params that change the response, in a canonical form: value ids sorted
+    and deduplicated, numbers normalized, search words lowercased, field names sorted and the params the views
+    do not read dropped. The page size is left to the paginator.
+    """
+    normalizers = {
+        'value': lambda value: ','.join(map(str, sorted(set(parse_value_ids(value))))),
+        'price_min': normalize_number,
+        'price_max': normalize_number,
+        'o': lambda value: ','.join(field.strip() for field in value.split(',')),
+        's': lambda value: ' '.join(value.lower().split()),
+        'cursor': str.strip,
+        'count': str.strip,
+        'fields': normalize_field_names,
+        'omit': normalize_field_names,
+    }
+    params = []
+    for name, normalize in sorted(normalizers.items()):
+        value = query_params.get(name)
+        if value:
+            value = normalize(value)
+        if value:
+            params.append((name, value))
+    return params
+
+
+class SharedResponseCacheMixin:
+    """
+    Caches the response data of a list view for anonymous users, and for every user when the response
+    is not personalized.
+
+    The key holds the canonical query and the version stamps of get_etag_parts(), so that entries are tagged
+    with the category subtree they list: a change of a category's products only leaves the entries of that
+    category and its ancestors behind, to expire.
+    """
+    response_cache_timeout = RESPONSE_CACHE_TIMEOUT
+
+    def get_response_cache_key(self):
+        request = self.request
+        if request.user.is_authenticated and self.is_personalized():
+            return None
+        parts = self.get_etag_parts()
+        if parts is None:
+            return None
+        params = canonicalize_query_params(request.query_params)
+        if self.paginator is not None:
+            # As the paginator reads it, e.g. limit=1e1 is not 10 to it
+            params.append((self.paginator.page_size_query_param, self.paginator.get_page_size(request)))
+        query = urlencode(params)
+        key = '|'.join([request.get_host(), request.path, query, *map(str, parts)])
+        return f'store:responses:{hashlib.md5(key.encode()).hexdigest()}'
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_response_cache_key()
+        if key is None:
+            return super().list(request, *args, **kwargs)
+        data = cache.get(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, self.response_cache_timeout)
+            return response
+        # The cached links may come from a request with other params, they are rebuilt on this request's url
+        return Response(self.paginator.relink(data, request))
@@ -2,7 +2,8 @@ from rest_framework import serializers
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiExample, OpenApiParameter, OpenApiResponse, inline_serializer
 
-from store.serializers import ProductOptionSerializer, ProductCreateSerializer, ProductDetailSerializer
+from store.serializers import ProductFilterSerializer, ProductCreateSerializer, ProductDetailSerializer
+from store.serializers import ProductListSerializer
 
 # EXAMPLES
 
@@ -37,10 +38,10 @@ PRODUCT_LIST_QUERY_PARAM_EXAMPLES = [
         description='Products with a maximum price',
     ),
     OpenApiParameter(
-        name="q",
+        name="s",
         type=OpenApiTypes.STR,
         location=OpenApiParameter.QUERY,
-        description='Search name of product',
+        description='Search products by name and description',
     ),
     OpenApiParameter(
         name="value",
@@ -58,11 +59,40 @@ PRODUCT_LIST_QUERY_PARAM_EXAMPLES = [
         name="o",
         type=OpenApiTypes.STR,
         location=OpenApiParameter.QUERY,
-        many=True, enum=['-price', 'price'],
-        description='Sorting products by increasing or decreasing price',
+        many=True, enum=['-price', 'price', '-favorites', 'favorites'],
+        description='Sorting products by increasing or decreasing price, or by the number of users having them '
+                    'in favorites. The favorite counts change all the time, and the pages of a listing by them '
+                    'may skip or repeat products whose count changed in between. Clients needing an exact '
+                    'listing start again from the first page once its ETag changes.',
     ),
 ]
 
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        name="fields",
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        description='Comma separated fields to return, the fields left out are not computed. '
+                    'Optional fields such as images of the product list are only returned when named here',
+        examples=[
+            OpenApiExample(
+                name="Query Parameter Example",
+                value="id,slug,price,image",
+            ),
+        ],
+    ),
+    OpenApiParameter(
+        name="omit",
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        description='Comma separated fields to leave out of the response',
+    ),
+]
+
+PRODUCT_FILTER_QUERY_PARAM_EXAMPLES = [
+    parameter for parameter in PRODUCT_LIST_QUERY_PARAM_EXAMPLES if parameter.name != 'o'
+]
+
 # RESPONSES
 
 response_404 = OpenApiResponse(description='Not found')
@@ -98,6 +128,28 @@ FAVORITE_DELETE_RESPONSES = {
     404: response_404,
 }
 
+FAVORITE_BULK_RESPONSES = {
+    200: {
+        'properties': {'added': {'type': 'integer'}, 'removed': {'type': 'integer'}},
+        'example': {'added': 2, 'removed': 1}
+    },
+    400: OpenApiResponse(description='Bad request (something invalid)'),
+}
+
+FAVORITE_STATE_RESPONSES = {
+    200: {
+        'properties': {'ids': {'type': 'array', 'items': {'type': 'integer'}}},
+        'example': {'ids': [1, 3]}
+    },
+    400: OpenApiResponse(description='Bad request (something invalid)'),
+}
+
+FEED_RESPONSES = {
+    200: OpenApiResponse(description='The feed document'),
+    400: OpenApiResponse(description='Bad request (something invalid)'),
+    404: response_404,
+}
+
 PRODUCT_CREATE_IMAGES_RESPONSES = {
     201: None,
     404: response_404
@@ -109,7 +161,25 @@ PRODUCT_FILTER_RESPONSES = {
         fields={
             'price_min': serializers.DecimalField(max_digits=7, decimal_places=2, ),
             'price_max': serializers.DecimalField(max_digits=7, decimal_places=2, ),
-            'options': ProductOptionSerializer(many=True)
+            'options': ProductFilterSerializer(many=True)
         },
     )
 }
+
+PRODUCT_BATCH_RESPONSES = {
+    200: inline_serializer(
+        name='ProductBatch',
+        fields={
+            'results': inline_serializer(
+                name='ProductBatchItem',
+                many=True,
+                fields={
+                    'id': serializers.IntegerField(required=False, help_text='The id looked up'),
+                    'slug': serializers.SlugField(required=False, help_text='The slug looked up'),
+                    'product': ProductListSerializer(allow_null=True, help_text='Null when not found'),
+                },
+            ),
+        },
+    ),
+    400: OpenApiResponse(description='Bad request (something invalid)'),
+}
@@ -0,0 +1,51 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import models
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'simple'
+# The ranks are float4, which never compare equal to the double decoded from a keyset cursor: as numeric
+# they go through the cursor exactly
+RANK_FIELD = models.DecimalField(max_digits=12, decimal_places=6)
+
+
+def get_text_expression(value):
+    if hasattr(value, 'resolve_expression'):
+        return value
+    return models.Value(value, output_field=models.TextField())
+
+
+def get_search_vector(name=models.F('name'), description=models.F('description')):
+    """The weighted document products are searched by: the name ranks above the description"""
+    return (
+        SearchVector(get_text_expression(name), weight='A', config=SEARCH_CONFIG) +
+        SearchVector(get_text_expression(description), weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def get_search_query(search_query):
+    # Every word must match, as a prefix so that partial words are found while typing
+    words = re.findall(r'\w+', search_query)
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config=SEARCH_CONFIG)
+
+
+def search_products(queryset, search_query):
+    """
+    Full-text search over the product name and description, annotating search_rank.
+    When nothing matches, falls back to pg_trgm word similarity on the name to tolerate typos.
+    """
+    query = get_search_query(search_query)
+    if query is None:
+        return queryset
+    matches = queryset.filter(search_vector=query).annotate(
+        search_rank=Cast(SearchRank(models.F('search_vector'), query), RANK_FIELD)
+    )
+    if settings.STORE_SEARCH_TRIGRAM and not matches.exists():
+        return queryset.filter(name__trigram_word_similar=search_query).annotate(
+            search_rank=Cast(TrigramWordSimilarity(search_query, 'name'), RANK_FIELD)
+        )
+    return matches
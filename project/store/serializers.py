@@ -1,18 +1,50 @@
+from collections import defaultdict
+
 from django.db.models import Prefetch
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
+from core.optimizer import query_hints
+from core.serializers import CompiledListSerializer, CompiledSerializerMixin, SparseFieldsMixin
 from store import models
+from store.favorites import get_favorite_product_ids
+from store.images import format_srcset, get_renditions, get_row_renditions
+
+
+def get_favorite_ids(request, product_ids):
+    """The ids of the products among product_ids the user of the request has in favorites"""
+    if request is None:
+        return set()
+    return get_favorite_product_ids(request.user) & set(product_ids)
 
 
 class FavoriteMixin:
     @extend_schema_field(OpenApiTypes.BOOL)
+    @query_hints()
     def get_favorite(self, obj):
+        # Read from the cached favorites of the user instead of a query per product
+        return obj.pk in get_favorite_ids(self.context.get('request'), [obj.pk])
+
+
+class ImageSrcsetSerializer(serializers.Serializer):
+    width = serializers.IntegerField()
+    height = serializers.IntegerField()
+    srcset = serializers.DictField(child=serializers.CharField(), help_text='srcset of every format, by format')
+
+
+class ImageSrcsetMixin:
+    def get_build_url(self):
         request = self.context.get('request')
-        if request.user.is_authenticated:
-            return obj.favorites.exists()
-        return False
+        return request.build_absolute_uri if request else str
+
+    def get_srcset(self, obj, field_name='image'):
+        return format_srcset(get_renditions(obj, field_name), self.get_build_url())
+
+    @extend_schema_field(ImageSrcsetSerializer(allow_null=True))
+    @query_hints(only=('image', 'image_renditions'))
+    def get_image_srcset(self, obj):
+        return self.get_srcset(obj)
 
 
 class CategoriesSerializer(serializers.ModelSerializer):
@@ -34,12 +66,46 @@ class ProductCreateSerializer(serializers.ModelSerializer):
         fields = ('name', 'description', 'price', 'discount_price', 'image', 'category')
 
 
-class ProductListSerializer(FavoriteMixin, serializers.ModelSerializer):
+class ProductListSerializer(CompiledSerializerMixin, SparseFieldsMixin, FavoriteMixin, ImageSrcsetMixin,
+                            serializers.ModelSerializer):
     favorite = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
+    row_fields = ('id', 'image', 'image_renditions')
 
     class Meta:
         model = models.Product
-        fields = ('id', 'image', 'name', 'slug', 'price', 'discount_price', 'favorite')
+        fields = ('id', 'image', 'image_srcset', 'name', 'slug', 'price', 'discount_price', 'favorite', 'images')
+        optional_fields = ('images',)
+        list_serializer_class = CompiledListSerializer
+
+    @extend_schema_field(serializers.ListField(child=serializers.URLField()))
+    @query_hints(prefetch_related=('images',))
+    def get_images(self, obj):
+        build_url = self.get_build_url()
+        return [build_url(image.image.url) for image in obj.images.all() if image.image]
+
+    def prepare_rows(self, rows):
+        ids = [row.id for row in rows]
+        self.favorite_ids = set()
+        if 'favorite' in self.fields:
+            self.favorite_ids = get_favorite_ids(self.context.get('request'), ids)
+        self.images = defaultdict(list)
+        if 'images' in self.fields:
+            build_url = self.get_build_url()
+            storage = models.ProductImage._meta.get_field('image').storage
+            images = models.ProductImage.objects.filter(product_id__in=ids).exclude(image='').exclude(image=None)
+            for product_id, name in images.order_by('id').values_list('product_id', 'image'):
+                self.images[product_id].append(build_url(storage.url(name)))
+
+    def get_favorite_from_row(self, row):
+        return row.id in self.favorite_ids
+
+    def get_image_srcset_from_row(self, row):
+        return format_srcset(get_row_renditions(models.Product, row, 'image'), self.get_build_url())
+
+    def get_images_from_row(self, row):
+        return self.images[row.id]
 
 
 class ValueSerializer(serializers.ModelSerializer):
@@ -56,21 +122,27 @@ class ProductOptionSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'values')
 
     @extend_schema_field(ValueSerializer(many=True))
+    @query_hints()
     def get_values(self, obj):
         qs_values = obj.product_values
         return ValueSerializer(qs_values, many=True).data
 
 
-class ProductDetailSerializer(FavoriteMixin, serializers.ModelSerializer):
+class ProductDetailSerializer(SparseFieldsMixin, FavoriteMixin, ImageSrcsetMixin, serializers.ModelSerializer):
     options = serializers.SerializerMethodField()
     favorite = serializers.SerializerMethodField()
     images = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    images_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = models.Product
-        fields = ('name', 'image', 'price', 'description', 'options', 'favorite', 'images')
+        fields = (
+            'name', 'image', 'image_srcset', 'price', 'description', 'options', 'favorite', 'images', 'images_srcset'
+        )
 
     @extend_schema_field(ProductOptionSerializer(many=True))
+    @query_hints()
     def get_options(self, obj):
         qs_options = models.Option.objects.filter(products_options__product=obj).distinct().prefetch_related(
             Prefetch(
@@ -82,6 +154,7 @@ class ProductDetailSerializer(FavoriteMixin, serializers.ModelSerializer):
         return ProductOptionSerializer(qs_options, many=True).data
 
     @extend_schema_field(serializers.ListField())
+    @query_hints(prefetch_related=('images',))
     def get_images(self, obj):
         request = self.context.get('request')
         urls = []
@@ -89,6 +162,32 @@ class ProductDetailSerializer(FavoriteMixin, serializers.ModelSerializer):
             urls.append(request.build_absolute_uri(image.image.url))
         return urls
 
+    @extend_schema_field(ImageSrcsetSerializer(many=True, allow_null=True))
+    @query_hints(prefetch_related=('images',))
+    def get_images_srcset(self, obj):
+        return [self.get_srcset(image) for image in obj.images.all()]
+
+
+class ProductDocumentSerializer(ProductDetailSerializer):
+    """
+    ProductDetailSerializer without the per-user favorite flag, keeping media urls relative
+    and the image renditions unformatted
+    """
+
+    class Meta(ProductDetailSerializer.Meta):
+        # With the fields of the product list, which the batch lookup renders from the documents as well
+        fields = (
+            'name', 'slug', 'image', 'image_srcset', 'price', 'discount_price', 'description', 'options', 'images',
+            'images_srcset'
+        )
+
+    @query_hints(prefetch_related=('images',))
+    def get_images(self, obj):
+        return [image.image.url for image in obj.images.all()]
+
+    def get_srcset(self, obj, field_name='image'):
+        return get_renditions(obj, field_name)
+
 
 class AddProductImagesSerializer(serializers.ModelSerializer):
     images = serializers.ListField(
@@ -105,8 +204,78 @@ class AddProductImagesSerializer(serializers.ModelSerializer):
         product = validated_data['product']
         objs = [models.ProductImage(product=product, image=image) for image in images]
         models.ProductImage.objects.bulk_create(objs)
+        for obj in objs:
+            get_renditions(obj, 'image')
         return product
 
 
+class ValueCountSerializer(ValueSerializer):
+    count = serializers.SerializerMethodField()
+
+    class Meta(ValueSerializer.Meta):
+        fields = ('id', 'name', 'count')
+
+    @extend_schema_field(OpenApiTypes.INT)
+    def get_count(self, obj):
+        return self.context.get('facet_counts', {}).get(obj.id, 0)
+
+
 class ProductFilterSerializer(ProductOptionSerializer):
-    pass
+    @extend_schema_field(ValueCountSerializer(many=True))
+    @query_hints()
+    def get_values(self, obj):
+        qs_values = obj.product_values
+        return ValueCountSerializer(qs_values, many=True, context=self.context).data
+
+
+PRODUCT_BATCH_MAX_SIZE = 300
+
+
+class ProductBatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                max_length=PRODUCT_BATCH_MAX_SIZE)
+    slugs = serializers.ListField(child=serializers.SlugField(max_length=100), required=False,
+                                  max_length=PRODUCT_BATCH_MAX_SIZE)
+
+    def validate(self, attrs):
+        if bool(attrs.get('ids')) == bool(attrs.get('slugs')):
+            raise serializers.ValidationError('Either ids or slugs are required')
+        return attrs
+
+    def get_lookup(self):
+        """The product field to look up and its values, in the order given"""
+        if self.validated_data.get('ids'):
+            return 'id', self.validated_data['ids']
+        return 'slug', self.validated_data['slugs']
+
+
+class FavoriteStateSerializer(serializers.Serializer):
+    ids = serializers.CharField(required=False, help_text='Comma separated product ids, all favorites when left out')
+
+    def validate_ids(self, value):
+        try:
+            ids = {int(product_id) for product_id in value.split(',') if product_id.strip()}
+        except ValueError:
+            raise serializers.ValidationError('Comma separated product ids are expected')
+        if len(ids) > PRODUCT_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(f'At most {PRODUCT_BATCH_MAX_SIZE} ids are accepted')
+        return ids
+
+
+class FeedSerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False, help_text='Only the products changed after this time')
+
+
+class FavoriteBulkSerializer(serializers.Serializer):
+    add = serializers.ListField(child=serializers.SlugField(max_length=100), required=False,
+                                max_length=PRODUCT_BATCH_MAX_SIZE)
+    remove = serializers.ListField(child=serializers.SlugField(max_length=100), required=False,
+                                   max_length=PRODUCT_BATCH_MAX_SIZE)
+
+    def validate(self, attrs):
+        add, remove = attrs.get('add', []), attrs.get('remove', [])
+        if not add and not remove:
+            raise serializers.ValidationError('Either add or remove is required')
+        if set(add) & set(remove):
+            raise serializers.ValidationError('A product can not be both added and removed')
+        return attrs
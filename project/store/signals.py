@@ -0,0 +1,207 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from store import models
+from store.categories import bump_category_tree_version, bump_category_versions
+from store.conditional import bump_catalog_version
+from store.documents import delete_product_document, schedule_product_documents_rebuild
+from store.facets import facet_index
+from store.favorites import bump_favorites_ranking_version, bump_favorites_version
+from store.images import get_renditions
+
+
+class ProductTouches:
+    """
+    The products whose related rows changed in a transaction, touched at once when it commits. Those deleted
+    in it are left out, their related rows go with them.
+    """
+
+    def __init__(self):
+        self.product_ids = set()
+        self.deleted_ids = set()
+        self.committed = False
+
+    def __call__(self):
+        self.committed = True
+        product_ids = self.product_ids - self.deleted_ids
+        if product_ids:
+            models.Product.objects.filter(pk__in=product_ids).touch()
+
+
+def get_product_touches():
+    """The touches of the current transaction, registered to run on its commit the first time"""
+    connection = transaction.get_connection()
+    for callback in connection.run_on_commit:
+        if isinstance(callback[1], ProductTouches) and not callback[1].committed:
+            return callback[1]
+    touches = ProductTouches()
+    transaction.on_commit(touches)
+    return touches
+
+
+def touch_products(product_ids):
+    if not transaction.get_connection().in_atomic_block:
+        models.Product.objects.filter(pk__in=product_ids).touch()
+        return
+    touches = get_product_touches()
+    touches.product_ids.update(product_ids)
+
+
+def discard_from_facet_index(product_id, value_id):
+    # A product may carry the same value through several rows, keep the bit while any of them is left
+    is_left = models.ProductOptionValue.objects.filter(product_id=product_id, value_id=value_id).exists()
+    if not is_left:
+        facet_index.discard(value_id, product_id)
+
+
+@receiver(pre_save, sender=models.ProductOptionValue)
+def remember_previous_product_option_value(sender, instance, **kwargs):
+    instance.previous_facet = None
+    if instance.pk:
+        instance.previous_facet = models.ProductOptionValue.objects.filter(
+            pk=instance.pk
+        ).values_list('product_id', 'value_id').first()
+
+
+@receiver(post_save, sender=models.ProductOptionValue)
+def add_product_option_value_to_facet_index(sender, instance, **kwargs):
+    previous = getattr(instance, 'previous_facet', None)
+    if previous and previous != (instance.product_id, instance.value_id):
+        discard_from_facet_index(*previous)
+    facet_index.add(instance.value_id, instance.value.option_id, instance.product_id)
+
+
+@receiver(post_delete, sender=models.ProductOptionValue)
+def remove_product_option_value_from_facet_index(sender, instance, **kwargs):
+    discard_from_facet_index(instance.product_id, instance.value_id)
+
+
+@receiver(post_save, sender=models.Value)
+def update_value_option_in_facet_index(sender, instance, **kwargs):
+    facet_index.set_value_option(instance.id, instance.option_id)
+
+
+@receiver(post_delete, sender=models.Value)
+def remove_value_from_facet_index(sender, instance, **kwargs):
+    facet_index.discard_value(instance.id)
+
+
+@receiver(post_save, sender=models.Category)
+@receiver(post_delete, sender=models.Category)
+@receiver(node_moved, sender=models.Category)
+def invalidate_category_tree(sender, **kwargs):
+    # After the commit, else the tree rendered from the old rows is cached under the new version
+    transaction.on_commit(bump_category_tree_version)
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(pre_save, sender=models.Product)
+def remember_previous_product(sender, instance, **kwargs):
+    instance.previous_slug = instance.previous_category_id = None
+    if instance.pk:
+        instance.previous_slug, instance.previous_category_id = models.Product.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', 'category_id').first() or (None, None)
+
+
+@receiver(post_save, sender=models.Product)
+def rebuild_product_document(sender, instance, **kwargs):
+    previous_slug = getattr(instance, 'previous_slug', None)
+    if previous_slug and previous_slug != instance.slug:
+        delete_product_document(previous_slug)
+    schedule_product_documents_rebuild([instance.id])
+
+
+@receiver(post_save, sender=models.Product)
+def bump_product_category_versions(sender, instance, **kwargs):
+    category_ids = {instance.category_id, getattr(instance, 'previous_category_id', None)} - {None}
+    transaction.on_commit(lambda: bump_category_versions(category_ids))
+
+
+@receiver(post_delete, sender=models.Product)
+def remove_product_document(sender, instance, **kwargs):
+    slug, category_id = instance.slug, instance.category_id
+
+    def invalidate():
+        delete_product_document(slug)
+        bump_category_versions([category_id])
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_delete, sender=models.Product)
+def skip_deleted_product_touches(sender, instance, **kwargs):
+    # Sent before the cascade deletes the related rows, in the transaction of the deletion
+    get_product_touches().deleted_ids.add(instance.pk)
+
+
+@receiver(post_save, sender=models.ProductOptionValue)
+@receiver(post_delete, sender=models.ProductOptionValue)
+@receiver(post_save, sender=models.ProductImage)
+@receiver(post_delete, sender=models.ProductImage)
+def rebuild_related_product_document(sender, instance, **kwargs):
+    product_ids = {instance.product_id}
+    previous = getattr(instance, 'previous_facet', None)
+    if previous:
+        product_ids.add(previous[0])
+    touch_products(product_ids)
+
+
+def update_products_with_values(product_option_values):
+    touch_products(set(product_option_values.values_list('product_id', flat=True)))
+
+
+@receiver(post_save, sender=models.Value)
+def rebuild_value_product_documents(sender, instance, created, **kwargs):
+    if not created:
+        update_products_with_values(models.ProductOptionValue.objects.filter(value=instance))
+
+
+@receiver(post_save, sender=models.Option)
+def rebuild_option_product_documents(sender, instance, created, **kwargs):
+    if not created:
+        update_products_with_values(models.ProductOptionValue.objects.filter(option=instance))
+
+
+@receiver(post_save, sender=models.Option)
+@receiver(post_delete, sender=models.Option)
+@receiver(post_save, sender=models.Value)
+@receiver(post_delete, sender=models.Value)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=models.ProductFilter)
+@receiver(post_delete, sender=models.ProductFilter)
+def invalidate_product_filter_category(sender, instance, **kwargs):
+    category_id = instance.category_id
+    transaction.on_commit(lambda: bump_category_versions([category_id]))
+
+
+@receiver(post_save, sender=models.Favorite)
+@receiver(post_delete, sender=models.Favorite)
+def invalidate_user_favorites(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: bump_favorites_version(user_id))
+
+
+@receiver(post_save, sender=models.Favorite)
+def count_added_favorite(sender, instance, created, **kwargs):
+    if created:
+        models.Product.objects.filter(pk=instance.product_id).add_favorites_count(1)
+        transaction.on_commit(bump_favorites_ranking_version)
+
+
+@receiver(post_delete, sender=models.Favorite)
+def count_removed_favorite(sender, instance, **kwargs):
+    models.Product.objects.filter(pk=instance.product_id).add_favorites_count(-1)
+    transaction.on_commit(bump_favorites_ranking_version)
+
+
+@receiver(post_save, sender=models.Product)
+@receiver(post_save, sender=models.ProductImage)
+@receiver(post_save, sender=models.Category)
+def request_image_renditions(sender, instance, **kwargs):
+    get_renditions(instance, 'image')
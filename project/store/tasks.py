@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from celery import shared_task
+
+from store import models
+from store.documents import get_document_products, save_product_document, schedule_product_documents_rebuild
+from store.favorites import bump_favorites_ranking_version
+from store.images import create_renditions
+
+
+@shared_task
+def rebuild_product_documents(product_ids):
+    products = get_document_products(models.Product.objects.filter(pk__in=product_ids))
+    for product in products:
+        save_product_document(product)
+    return len(products)
+
+
+@shared_task
+def rebuild_updated_product_documents(updated_at):
+    product_ids = list(models.Product.objects.filter(
+        updated_at=datetime.fromisoformat(updated_at),
+    ).order_by('id').values_list('id', flat=True))
+    schedule_product_documents_rebuild(product_ids)
+    return len(product_ids)
+
+
+@shared_task
+def create_image_renditions(label, pk, field_name):
+    # Recording the renditions of a product updates it, which rebuilds its document
+    renditions = create_renditions(label, pk, field_name)
+    if label == models.ProductImage._meta.label:
+        product_ids = list(models.ProductImage.objects.filter(pk=pk).values_list('product_id', flat=True))
+        models.Product.objects.filter(pk__in=product_ids).touch()
+    return renditions
+
+
+@shared_task
+def reconcile_favorites_counts():
+    # The counts are shifted by every favorite write, this catches those made around them, e.g. raw SQL
+    fixed = models.Product.objects.reconcile_favorites_count()
+    if fixed:
+        bump_favorites_ranking_version()
+    return fixed
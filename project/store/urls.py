@@ -6,8 +6,13 @@ urlpatterns = [
     path('categories', views.CategoriesListView.as_view()),
     path('categories/<slug:slug>/products', views.ProductListView.as_view()),
     path('categories/<slug:slug>/filter', views.ProductFilterListView.as_view()),
+    path('products/search', views.ProductSearchView.as_view()),
+    path('products/batch', views.ProductBatchView.as_view()),
     path('product/create', views.ProductCreateView.as_view()),
     path('product/<slug:slug>', views.ProductDetailView.as_view()),
     path('product/<slug:slug>/add/images', views.AddProductImagesView.as_view()),
     path('product/<slug:slug>/favorite', views.FavoriteProductAddDeleteView.as_view()),
+    path('feeds/<slug:feed>', views.FeedView.as_view()),
+    path('favorites', views.FavoriteProductStateView.as_view()),
+    path('favorites/bulk', views.FavoriteProductBulkView.as_view()),
 ]
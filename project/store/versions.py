@@ -0,0 +1,26 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_initial_version():
+    # Starts from the clock rather than 1, so a counter lost from the cache never repeats an earlier value
+    return time.time_ns() // 1000
+
+
+def get_version(key):
+    """Return the current value of a shared version counter"""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, get_initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Increment a shared version counter so every process notices the change"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, get_initial_version(), timeout=None)
+        return cache.incr(key)
@@ -1,18 +1,25 @@
+from django.db import transaction
 from django.db.models import Prefetch, Max, Min
-from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django_filters import rest_framework as filters
+from django_filters.utils import translate_validation
 from drf_spectacular.utils import extend_schema, extend_schema_view
 from rest_framework import generics, status, permissions
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from core.optimizer import OptimizedQuerysetMixin
 from store import filters as product_filters
 from store import models, schemas, serializers
-
-
-def get_filtered_categories(category_slug):
-    qs_category = models.Category.objects.filter(slug=category_slug)
-    return qs_category.get_descendants(include_self=True)
+from store.categories import build_category_tree, category_resolver, get_rendered_category_tree
+from store.conditional import CatalogConditionalMixin, CategoryConditionalMixin, CategoryTreeConditionalMixin
+from store.conditional import ConditionalGetMixin, FavoriteFlagMixin
+from store.documents import get_product_document, get_product_summaries, render_product_document
+from store.favorites import get_favorite_product_ids
+from store.feeds import FEEDS
+from store.pagination import KeysetPagination
+from store.response_cache import SharedResponseCacheMixin
 
 
 def get_filtered_options(qs_category, qs_categories):
@@ -30,17 +37,50 @@ def get_filtered_options(qs_category, qs_categories):
     )
 
 
+class CategoryScopeMixin:
+    """Resolves the category of the slug url kwarg once per request"""
+
+    def get_category_scope(self):
+        if not hasattr(self, '_category_scope'):
+            self._category_scope = category_resolver.resolve(self.kwargs['slug'])
+        return self._category_scope
+
+    def get_category_ids(self):
+        scope = self.get_category_scope()
+        return list(scope.descendant_ids) if scope else []
+
+
+class CompiledListMixin:
+    """Lists values_list() rows through the compiled read path of the serializer instead of model instances"""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # The rows carry the ordering keys too, the paginator reads the cursor position from them
+        ordering = [field.lstrip('-') for field in self.paginator.get_ordering(queryset)]
+        names = self.get_serializer().get_row_names(*ordering)
+        page = self.paginate_queryset(queryset.prefetch_related(None).values_list(*names, named=True))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
 @extend_schema_view(
     get=extend_schema(
         summary="Get a tree of category lists",
         examples=schemas.CATEGORY_EXAMPLES,
     ),
 )
-class CategoriesListView(generics.ListAPIView):
+class CategoriesListView(CategoryTreeConditionalMixin, generics.ListAPIView):
     serializer_class = serializers.CategoriesSerializer
+    queryset = models.Category.objects.filter(hide=False)
 
-    def get_queryset(self):
-        return models.Category.objects.get_cached_trees()
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if isinstance(renderer, BrowsableAPIRenderer):
+            return Response(build_category_tree())
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        return HttpResponse(get_rendered_category_tree(renderer), content_type=content_type)
 
 
 @extend_schema(
@@ -56,38 +96,101 @@ class ProductCreateView(generics.CreateAPIView):
 @extend_schema_view(
     get=extend_schema(
         summary="Get a list of products by category",
-        parameters=schemas.PRODUCT_LIST_QUERY_PARAM_EXAMPLES,
+        parameters=[*schemas.PRODUCT_LIST_QUERY_PARAM_EXAMPLES, *schemas.SPARSE_FIELDS_PARAMETERS],
     ),
 )
-class ProductListView(generics.ListAPIView):
+class ProductListView(CategoryScopeMixin, FavoriteFlagMixin, CategoryConditionalMixin, SharedResponseCacheMixin,
+                      CompiledListMixin, generics.ListAPIView):
     serializer_class = serializers.ProductListSerializer
     permission_classes = (permissions.AllowAny,)
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = product_filters.ProductFilter
+    pagination_class = KeysetPagination
+
+    def get_products(self):
+        return models.Product.objects.filter(category_id__in=self.get_category_ids())
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):  # drf-yasg comp
             return models.Product.objects.none()
-        qs_categories = get_filtered_categories(self.kwargs['slug'])
-        qs = models.Product.objects.filter(category__in=qs_categories)
-        user = self.request.user
+        # The favorite flags are loaded for the page at once by ProductListSerializer
+        qs = self.get_products().order_by('id')
         # qs = product_filters.product_filter(qs, self.request.query_params)
-        if user.is_authenticated:
-            return qs.prefetch_related(
-                Prefetch('favorites', queryset=models.Favorite.objects.filter(user=self.request.user))
-            )
         return qs
 
 
+@extend_schema_view(
+    get=extend_schema(
+        summary="Search products across the catalog",
+        parameters=[*schemas.PRODUCT_LIST_QUERY_PARAM_EXAMPLES, *schemas.SPARSE_FIELDS_PARAMETERS],
+    ),
+)
+class ProductSearchView(CatalogConditionalMixin, ProductListView):
+    def get_products(self):
+        if not self.request.query_params.get('s'):
+            return models.Product.objects.none()
+        return models.Product.objects.filter(is_published=True)
+
+
 @extend_schema(
     summary="Get product by ID",
+    parameters=schemas.SPARSE_FIELDS_PARAMETERS,
     responses=schemas.PRODUCT_DETAIL_RESPONSES,
 )
-class ProductDetailView(generics.RetrieveAPIView):
+class ProductDetailView(FavoriteFlagMixin, ConditionalGetMixin, generics.RetrieveAPIView):
     serializer_class = serializers.ProductDetailSerializer
     queryset = models.Product.objects.all()
     lookup_field = 'slug'
 
+    def get_document(self):
+        """
+        The document served, rebuilt when it is older than the product. The validators are taken from its stamp,
+        so a client never holds an old body under a new ETag.
+        """
+        if not hasattr(self, '_document'):
+            updated_at = models.Product.objects.filter(
+                slug=self.kwargs['slug']
+            ).values_list('updated_at', flat=True).first()
+            self._document = None if updated_at is None else get_product_document(self.kwargs['slug'], updated_at)
+        return self._document
+
+    def get_etag_parts(self):
+        document = self.get_document()
+        if document is None:
+            return None
+        return [document['id'], document['updated_at']]
+
+    def get_last_modified(self):
+        # The favorite flag of a user changes without the product, the ETag covers it
+        document = self.get_document()
+        if document and not (self.request.user.is_authenticated and self.is_personalized()):
+            return document['updated_at']
+
+    def retrieve(self, request, *args, **kwargs):
+        # Served from the precomputed document, only the favorite flag is looked up per request
+        document = self.get_document()
+        if document is None:
+            raise Http404
+        return Response(render_product_document(document, request))
+
+
+@extend_schema(
+    summary="Get products by ids or slugs",
+    description='The products in the order of the ids or slugs given, with a null product for those not found',
+    request=serializers.ProductBatchSerializer,
+    parameters=schemas.SPARSE_FIELDS_PARAMETERS,
+    responses=schemas.PRODUCT_BATCH_RESPONSES,
+)
+class ProductBatchView(APIView):
+    permission_classes = (permissions.AllowAny,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = serializers.ProductBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lookup, values = serializer.get_lookup()
+        products = get_product_summaries(lookup, values, request)
+        return Response({'results': [{lookup: value, 'product': products.get(value)} for value in values]})
+
 
 @extend_schema_view(
     post=extend_schema(
@@ -107,19 +210,80 @@ class FavoriteProductAddDeleteView(APIView):
 
     def post(self, request, *args, **kwargs):
         product_slug = self.kwargs['slug']
-        product = generics.get_object_or_404(models.Product, slug=product_slug)
-        is_exists = product.favorites.filter(user=request.user).exists()
-        if not is_exists:
-            models.Favorite.objects.create(product=product, user=request.user)
+        if models.Favorite.objects.add(request.user, [product_slug]):
             return Response({'detail': 'User added product'}, status=status.HTTP_200_OK)
+        # Nothing was added, either the product is unknown or it is a favorite already
+        if not models.Product.objects.filter(slug=product_slug).exists():
+            raise Http404
         return Response({'detail': self.bad_request_message}, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, *args, **kwargs):
-        product_slug = self.kwargs['slug']
-        models.Favorite.objects.filter(product__slug=product_slug, user=request.user).delete()
+        models.Favorite.objects.remove(request.user, [self.kwargs['slug']])
         return Response({'detail': 'User deleted product'}, status=status.HTTP_200_OK)
 
 
+@extend_schema(
+    summary="Get which products are favorites of the user",
+    description='Lets clients fill the favorite flags of product lists requested with omit=favorite, '
+                'which are the same for every user and served from the shared cache',
+    parameters=[serializers.FavoriteStateSerializer],
+    responses=schemas.FAVORITE_STATE_RESPONSES,
+)
+class FavoriteProductStateView(ConditionalGetMixin, generics.RetrieveAPIView):
+    serializer_class = serializers.FavoriteStateSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_etag_parts(self):
+        # The user stamp carries the version of the favorites
+        return ['favorites']
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        product_ids = get_favorite_product_ids(request.user)
+        if 'ids' in serializer.validated_data:
+            product_ids = product_ids & serializer.validated_data['ids']
+        return Response({'ids': sorted(product_ids)})
+
+
+@extend_schema(
+    summary="Add and remove favorite products in bulk",
+    request=serializers.FavoriteBulkSerializer,
+    responses=schemas.FAVORITE_BULK_RESPONSES,
+)
+class FavoriteProductBulkView(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        serializer = serializers.FavoriteBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        added = models.Favorite.objects.add(request.user, serializer.validated_data.get('add', []))
+        removed = models.Favorite.objects.remove(request.user, serializer.validated_data.get('remove', []))
+        return Response({'added': len(added), 'removed': len(removed)}, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    summary="Export the catalog feed",
+    description='The catalog as Yandex Market Language (yml), Google Merchant (google) or CSV (csv), streamed',
+    parameters=[serializers.FeedSerializer],
+    responses=schemas.FEED_RESPONSES,
+)
+class FeedView(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        feed_class = FEEDS.get(self.kwargs['feed'])
+        if feed_class is None:
+            raise Http404
+        serializer = serializers.FeedSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        feed = feed_class(request.build_absolute_uri, serializer.validated_data.get('since'))
+        response = StreamingHttpResponse(feed.stream(), content_type=feed_class.content_type)
+        response['Content-Disposition'] = f'attachment; filename="{self.kwargs["feed"]}.{feed_class.extension}"'
+        return response
+
+
 @extend_schema(
     summary="Add images to product",
     responses=schemas.PRODUCT_CREATE_IMAGES_RESPONSES
@@ -132,31 +296,56 @@ class AddProductImagesView(generics.CreateAPIView):
     def perform_create(self, serializer):
         product = generics.get_object_or_404(models.Product, slug=self.kwargs.get('slug'))
         serializer.save(product=product)
+        # The images are created in bulk, without the signals that update the product
+        models.Product.objects.filter(pk=product.pk).touch()
 
 
 @extend_schema_view(
     get=extend_schema(
         summary="Get filter of products by category",
+        parameters=schemas.PRODUCT_FILTER_QUERY_PARAM_EXAMPLES,
         responses=schemas.PRODUCT_FILTER_RESPONSES
     ),
 )
-class ProductFilterListView(generics.ListAPIView):
+class ProductFilterListView(CategoryScopeMixin, CategoryConditionalMixin, OptimizedQuerysetMixin,
+                            generics.ListAPIView):
     serializer_class = serializers.ProductFilterSerializer
+    facet_filter_params = ('price_min', 'price_max', 's')
+
+    def is_personalized(self):
+        return False
 
     def get_queryset(self):
-        qs_category = models.Category.objects.filter(slug=self.kwargs['slug'])
-        qs_categories = qs_category.get_descendants(include_self=True)
-        qs = get_filtered_options(qs_category, qs_categories)
+        scope = self.get_category_scope()
+        qs = get_filtered_options([scope.id] if scope else [], self.get_category_ids())
         return qs
 
+    def get_facet_products(self):
+        """Products of the category matching the price and search parameters of the request"""
+        data = {param: self.request.query_params[param]
+                for param in self.facet_filter_params if param in self.request.query_params}
+        filterset = product_filters.ProductFilter(
+            data=data,
+            queryset=models.Product.objects.filter(category_id__in=self.get_category_ids()),
+            request=self.request,
+        )
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        return filterset.qs
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['facet_counts'] = getattr(self, 'facet_counts', {})
+        return context
+
     def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
-        product_price = Coalesce('discount_price', 'price')
-        qs_categories = get_filtered_categories(self.kwargs['slug'])
-        response_data = models.Product.objects.filter(category__in=qs_categories).aggregate(
-            price_min=Min(product_price),
-            price_max=Max(product_price)
+        options = list(self.filter_queryset(self.get_queryset()))
+        value_ids = [value.id for option in options for value in option.product_values]
+        selected_value_ids = product_filters.parse_value_ids(request.query_params.get('value', ''))
+        self.facet_counts = product_filters.count_values(self.get_facet_products(), value_ids, selected_value_ids)
+        response_data = models.Product.objects.filter(category_id__in=self.get_category_ids()).aggregate(
+            price_min=Min('effective_price'),
+            price_max=Max('effective_price')
         )
-        response_data['options'] = response.data
-        response.data = response_data
-        return response
+        response_data['options'] = self.get_serializer(options, many=True).data
+        return Response(response_data)
@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from rest_framework.test import APIClient
 
 from tests.test_accounts.conftest import *
@@ -9,3 +10,9 @@ pytest_plugins = ("celery.contrib.pytest",)
 @pytest.fixture(scope='session')
 def api_client():
     yield APIClient()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    yield
+    cache.clear()
@@ -0,0 +1,127 @@
+import asyncio
+
+from http.client import RemoteDisconnected
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from core.http import CircuitOpenError, IntegrationClient, get_metrics
+
+
+def refused():
+    return requests.ConnectionError(MaxRetryError(None, '/api', NewConnectionError(None, 'Connection refused')))
+
+
+def aborted():
+    return requests.ConnectionError(ProtocolError('Connection aborted.', RemoteDisconnected('Remote end closed')))
+
+
+def make_response(status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = b'{}'
+    return response
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(mocker):
+    return mocker.patch('core.http.time.sleep')
+
+
+@pytest.fixture
+def send(mocker):
+    return mocker.patch('requests.Session.request')
+
+
+def test_failed_connections_are_retried(send, no_sleep):
+    client = IntegrationClient('test', retries=2, backoff=1, idempotent=False)
+    send.side_effect = [refused(), make_response()]
+
+    assert client.post('https://example.com/api', json={}).status_code == 200
+    assert send.call_count == 2
+    assert send.call_args.kwargs['timeout'] == client.timeout
+    # Jittered below the backoff of the first attempt
+    delay, = no_sleep.call_args.args
+    assert 0 <= delay <= 1
+    metrics = get_metrics('test')
+    assert (metrics['calls'], metrics['errors'], metrics['error_rate']) == (2, 1, 0.5)
+    assert sum(metrics['latency_buckets'].values()) == 2
+
+
+@pytest.mark.parametrize('error', [refused, requests.ConnectTimeout])
+def test_requests_not_sent_are_retried(send, error):
+    client = IntegrationClient('test', retries=2, idempotent=False, failure_threshold=10)
+    send.side_effect = error()
+    with pytest.raises(requests.ConnectionError):
+        client.post('https://example.com/api')
+    assert send.call_count == 3
+
+
+@pytest.mark.parametrize('idempotent, calls', [(False, 1), (True, 3)])
+@pytest.mark.parametrize('error', [requests.ReadTimeout, aborted])
+def test_requests_reaching_the_provider_are_retried_when_idempotent(send, idempotent, calls, error):
+    client = IntegrationClient('test', retries=2, idempotent=idempotent, failure_threshold=10)
+
+    send.side_effect = error()
+    with pytest.raises(requests.RequestException):
+        client.post('https://example.com/api')
+    assert send.call_count == calls
+
+    send.reset_mock(side_effect=True)
+    send.return_value = make_response(503)
+    assert client.post('https://example.com/api').status_code == 503
+    assert send.call_count == calls
+
+
+def test_circuit_breaker(send):
+    client = IntegrationClient('test', retries=0, failure_threshold=2)
+    send.side_effect = requests.ConnectionError
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            client.post('https://example.com/api')
+    assert get_metrics('test')['circuit_open'] is True
+
+    with pytest.raises(CircuitOpenError):
+        client.post('https://example.com/api')
+    assert send.call_count == 2
+
+
+def test_session_is_pooled_per_thread():
+    client = IntegrationClient('test')
+    session = client.session
+    assert client.session is session
+    assert session.get_adapter('https://example.com')._pool_maxsize == client.pool_size
+    assert asyncio.run(asyncio.to_thread(lambda: client.session)) is not session
+
+
+def test_async_request(send):
+    send.return_value = make_response()
+    client = IntegrationClient('test')
+    assert asyncio.run(client.post_async('https://example.com/api')).status_code == 200
+
+
+def test_liqpay_request_is_verified(send):
+    from order.payment import LiqPayCard
+
+    send.return_value = make_response()
+    LiqPayCard(order_id='1', amount='10', phone='+380000000000', card='4242424242424242', card_exp_month='03',
+               card_exp_year='22', card_cvv='111').api()
+    assert 'verify' not in send.call_args.kwargs
+
+
+@pytest.mark.django_db
+def test_integration_metrics_view(api_client_auth_admin, send):
+    send.return_value = make_response()
+    IntegrationClient('test').post('https://example.com/api')
+
+    response = api_client_auth_admin.get('/integrations/metrics', {'minutes': 5})
+    assert response.status_code == 200
+    assert response.data['test']['calls'] == 1
+    assert {'liqpay', 'telegram'} <= set(response.data)
+    assert api_client_auth_admin.get('/integrations/metrics', {'minutes': 0}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_integration_metrics_view_staff_only(api_client_authenticated):
+    assert api_client_authenticated.get('/integrations/metrics').status_code == 403
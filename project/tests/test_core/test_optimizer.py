@@ -0,0 +1,206 @@
+import pytest
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.test import APIRequestFactory
+
+from core.optimizer import optimize_queryset, query_hints
+from core.serializers import SparseFieldsMixin
+from order.models import Order
+from order.serializers import OrderDetailSerializer, OrderListCreateSerializer
+from store.models import Product, ProductImage, Value
+from store.serializers import ProductDetailSerializer, get_favorite_ids
+
+
+class ValueOptionSerializer(serializers.ModelSerializer):
+    option_name = serializers.CharField(source='option.name')
+
+    class Meta:
+        model = Value
+        fields = ('id', 'name', 'option_name')
+
+
+class ImageProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ('id', 'name')
+
+
+class ImageSerializer(serializers.ModelSerializer):
+    product = ImageProductSerializer()
+
+    class Meta:
+        model = ProductImage
+        fields = ('id', 'product')
+
+
+class ProductImagesSerializer(serializers.ModelSerializer):
+    images = ImageSerializer(many=True)
+    label = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ('name', 'images', 'label')
+
+    def get_label(self, obj):
+        return f'{obj.name} {obj.price}'
+
+
+class SparseImageSerializer(SparseFieldsMixin, ImageSerializer):
+    pass
+
+
+class SparseProductImagesSerializer(SparseFieldsMixin, ProductImagesSerializer):
+    images = SparseImageSerializer(many=True)
+
+    class Meta(ProductImagesSerializer.Meta):
+        optional_fields = ('images',)
+
+
+class HintedProductImagesSerializer(ProductImagesSerializer):
+    @query_hints(only=('price',))
+    def get_label(self, obj):
+        return super().get_label(obj)
+
+
+def get_only(queryset):
+    names, defer = queryset.query.deferred_loading
+    assert not defer
+    return names
+
+
+def get_request(user, **params):
+    request = APIRequestFactory().get('/', params)
+    request.user = user
+    return request
+
+
+def test_source_path_is_joined():
+    queryset = optimize_queryset(Value.objects.all(), ValueOptionSerializer)
+
+    assert queryset.query.select_related == {'option': {}}
+    assert get_only(queryset) == {'id', 'name', 'option', 'option__name'}
+
+
+def test_pk_related_field_is_read_from_the_key():
+    queryset = optimize_queryset(Order.objects.all(), OrderListCreateSerializer)
+
+    # The items and the customer are write-only
+    assert queryset.query.select_related is False
+    assert queryset._prefetch_related_lookups == ()
+    assert get_only(queryset) == {'id', 'city', 'address', 'total_cost', 'paid'}
+
+
+def test_compiled_nested_list_is_not_prefetched():
+    queryset = optimize_queryset(Order.objects.all(), OrderDetailSerializer, 'customer')
+
+    assert queryset._prefetch_related_lookups == ()
+    assert 'customer' in get_only(queryset)
+
+
+def test_nested_list_is_prefetched_with_its_own_plan():
+    queryset = optimize_queryset(Product.objects.all(), HintedProductImagesSerializer)
+
+    assert get_only(queryset) == {'name', 'price'}
+    prefetch, = queryset._prefetch_related_lookups
+    assert prefetch.prefetch_to == 'images'
+    assert prefetch.queryset.query.select_related == {'product': {}}
+    # The key back to the product matches the images to the products
+    assert get_only(prefetch.queryset) == {'id', 'product', 'product__id', 'product__name'}
+
+
+def test_method_field_without_hints_leaves_fields_unrestricted():
+    queryset = optimize_queryset(Product.objects.all(), ProductImagesSerializer)
+
+    assert queryset.query.deferred_loading == (frozenset(), True)
+    assert len(queryset._prefetch_related_lookups) == 1
+
+
+def test_existing_select_related_is_kept():
+    queryset = optimize_queryset(Order.objects.select_related('customer'), OrderListCreateSerializer)
+    assert queryset.query.select_related == {'customer': {}}
+    assert {'customer', 'city'} <= get_only(queryset)
+    assert not any(name.startswith('customer__') for name in get_only(queryset))
+
+
+@pytest.mark.django_db
+def test_values_querysets_are_left_alone():
+    queryset = Order.objects.values_list('id')
+    assert optimize_queryset(queryset, OrderListCreateSerializer) is queryset
+
+
+@pytest.mark.django_db
+def test_product_detail_hints(product_factory, product_image_factory, favorite_factory, user_active,
+                              django_assert_num_queries):
+    products = product_factory.create_batch(3)
+    for product in products:
+        product_image_factory.create_batch(2, product=product, image=None)
+    favorite_factory(product=products[1], user=user_active)
+    request = get_request(user_active)
+
+    queryset = optimize_queryset(Product.objects.order_by('id'), ProductDetailSerializer, request=request)
+    assert {'name', 'image', 'image_renditions', 'price', 'description'} == get_only(queryset)
+    prefetch_to = [getattr(lookup, 'prefetch_to', lookup) for lookup in queryset._prefetch_related_lookups]
+    # The favorite flags are read from the cached favorites of the user
+    assert prefetch_to == ['images']
+
+    with django_assert_num_queries(3):
+        products = list(queryset)
+        favorites = [bool(get_favorite_ids(request, [product.pk])) for product in products]
+        images = [len(product.images.all()) for product in products]
+    assert favorites == [False, True, False]
+    assert images == [2, 2, 2]
+
+
+def test_hint_prefetch_is_not_shared():
+    prefetch = Prefetch('images')
+
+    class PrefetchingProductSerializer(ImageProductSerializer):
+        images = serializers.SerializerMethodField()
+
+        class Meta(ImageProductSerializer.Meta):
+            fields = ('id', 'name', 'images')
+
+        @query_hints(prefetch_related=(prefetch,))
+        def get_images(self, obj):
+            return len(obj.images.all())
+
+    class Serializer(ImageSerializer):
+        product = PrefetchingProductSerializer()
+
+    for _ in range(2):
+        queryset = optimize_queryset(ProductImage.objects.all(), Serializer)
+        lookup, = queryset._prefetch_related_lookups
+        assert lookup.prefetch_to == 'product__images'
+    assert prefetch.prefetch_to == 'images'
+
+
+@pytest.mark.parametrize('params, only, prefetch', [
+    ({}, None, None),
+    ({'fields': 'name'}, {'name'}, None),
+    ({'fields': 'name,images'}, {'name'}, {'id', 'product', 'product__id', 'product__name'}),
+    ({'fields': 'name,images.id'}, {'name'}, {'id', 'product'}),
+    ({'fields': 'name,images', 'omit': 'images.product'}, {'name'}, {'id', 'product'}),
+])
+def test_field_selection_drives_the_plan(params, only, prefetch):
+    request = get_request(None, **params)
+    queryset = optimize_queryset(Product.objects.all(), SparseProductImagesSerializer, request=request)
+
+    if only is None:
+        # The label method without hints is selected
+        assert queryset.query.deferred_loading == (frozenset(), True)
+    else:
+        assert get_only(queryset) == only
+    if prefetch is None:
+        assert queryset._prefetch_related_lookups == ()
+    else:
+        lookup, = queryset._prefetch_related_lookups
+        assert get_only(lookup.queryset) == prefetch
+
+
+def test_product_detail_selection():
+    request = get_request(None, fields='price')
+    queryset = optimize_queryset(Product.objects.all(), ProductDetailSerializer, request=request)
+
+    # Neither get_options nor get_images are run
+    assert get_only(queryset) == {'price'}
+    assert queryset._prefetch_related_lookups == ()
@@ -0,0 +1,58 @@
+import datetime
+from decimal import Decimal
+
+import msgpack
+import pytest
+from django.utils.translation import gettext_lazy
+from phonenumber_field.phonenumber import PhoneNumber
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import MessagePackRenderer, ORJSONRenderer
+
+DATA = {
+    'price': Decimal('10.50'),
+    'created_at': datetime.datetime(2023, 8, 7, 16, 23, 1, 5000, tzinfo=datetime.timezone.utc),
+    'date': datetime.date(2023, 8, 7),
+    'phone': PhoneNumber.from_string('+380501234567'),
+    'label': gettext_lazy('Name'),
+    'text': 'Ноутбук\u2028',
+    'ids': {1, 2},
+    3: None,
+    'nested': [{'a': 1.5, 'b': True}],
+}
+
+
+@pytest.mark.parametrize('accepted_media_type', ['application/json', 'application/json; indent=4'])
+def test_orjson_renderer_matches_json_renderer(accepted_media_type):
+    # The stock encoder can not serialize phone numbers at all
+    data = {key: value for key, value in DATA.items() if key != 'phone'}
+    expected = JSONRenderer().render(data, accepted_media_type)
+    rendered = ORJSONRenderer().render(data, accepted_media_type)
+    if 'indent' in accepted_media_type:
+        assert rendered.replace(b' ', b'') == expected.replace(b' ', b'')
+    else:
+        assert rendered == expected
+    assert b'"phone":"+380501234567"' in ORJSONRenderer().render(DATA)
+
+
+def test_msgpack_renderer():
+    data = msgpack.unpackb(MessagePackRenderer().render(DATA), strict_map_key=False)
+    assert data['price'] == 10.5
+    assert data['created_at'] == '2023-08-07T16:23:01.005000Z'
+    assert data['phone'] == '+380501234567'
+    assert data['ids'] == [1, 2]
+    assert data[3] is None
+
+
+@pytest.mark.django_db
+def test_msgpack_negotiation(api_client):
+    response = api_client.get('/store/categories', HTTP_ACCEPT='application/msgpack')
+    assert response['Content-Type'] == 'application/msgpack'
+    assert msgpack.unpackb(response.content) == []
+
+
+@pytest.mark.django_db
+def test_orjson_parser_error(api_client):
+    response = api_client.post('/order/paycallback', data=b'{"data": ', content_type='application/json')
+    assert response.status_code == 400
+    assert response.json()['detail'].startswith('JSON parse error')
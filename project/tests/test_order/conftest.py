@@ -15,9 +15,14 @@ def order():
 
 @pytest.fixture
 def mock_payment(mocker):
-    mocker.patch('order.views.payment.LiqPayCard')
+    return mocker.patch('order.payment.LiqPayCard')
+
+
+@pytest.fixture
+def mock_payment_status(mocker):
+    return mocker.patch('order.payment.LiqPayStatus')
 
 
 @pytest.fixture
 def mock_tgbot(mocker):
-    mocker.patch('order.views.send_message_to_tg')
+    return mocker.patch('order.outbox.send_message_to_tg')
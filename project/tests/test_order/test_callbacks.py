@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from order import callbacks
+from order.models import PaymentData, PaymentStatus
+from order.tasks import apply_stalled_payment_data
+
+pytestmark = pytest.mark.django_db
+
+
+def record(order, payment_status):
+    return PaymentData.objects.create(order=order, status=payment_status, data={'status': payment_status})
+
+
+def test_apply_once(order, django_assert_num_queries):
+    payment_data = record(order, PaymentStatus.SUCCESS)
+    # The callback and the order locked, the order and the callback updated, without reading the customer
+    with django_assert_num_queries(6):
+        assert callbacks.apply(payment_data.pk) is True
+    order.refresh_from_db()
+    assert (order.payment_status, order.paid) == (PaymentStatus.SUCCESS, True)
+
+    payment_data.refresh_from_db()
+    processed_at = payment_data.processed_at
+    assert processed_at is not None
+    assert callbacks.apply(payment_data.pk) is False
+    payment_data.refresh_from_db()
+    assert payment_data.processed_at == processed_at
+
+
+@pytest.mark.parametrize('statuses, expected', [
+    (['processing', 'success'], PaymentStatus.SUCCESS),
+    # Late and unknown callbacks do not move the status back
+    (['success', 'processing', 'failure'], PaymentStatus.SUCCESS),
+    (['success', 'wait_secure'], PaymentStatus.SUCCESS),
+    (['success', 'reversed', 'success'], PaymentStatus.REVERSED),
+    (['failure', 'success'], PaymentStatus.SUCCESS),
+])
+def test_status_moves_forward_only(order, statuses, expected):
+    for payment_status in statuses:
+        callbacks.apply(record(order, payment_status).pk)
+    order.refresh_from_db()
+    assert order.payment_status == expected
+    assert not PaymentData.objects.filter(processed_at__isnull=True).exists()
+
+
+def test_apply_stalled_payment_data(order, celery_eager):
+    payment_data = record(order, PaymentStatus.SUCCESS)
+    assert apply_stalled_payment_data() == 0
+
+    PaymentData.objects.filter(pk=payment_data.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+    assert apply_stalled_payment_data() == 1
+    order.refresh_from_db()
+    assert order.payment_status == PaymentStatus.SUCCESS
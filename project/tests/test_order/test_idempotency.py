@@ -0,0 +1,100 @@
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from order import idempotency
+from order.models import Order, OutboxMessage
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def order_data(products):
+    return {
+        'address': 'address',
+        'city': 'city',
+        'items': [{'product': products[0].id, 'quantity': 2}],
+        'payment_mode': 'cash',
+    }
+
+
+def post_order(client, data, key):
+    return client.post('/order/', data=data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+
+def test_retried_order_is_created_once(api_client_authenticated, order_data):
+    first = post_order(api_client_authenticated, order_data, 'key-1')
+    assert first.status_code == 201
+    assert idempotency.REPLAYED_HEADER not in first
+
+    retry = post_order(api_client_authenticated, order_data, 'key-1')
+    assert retry.status_code == 201
+    assert retry.data == first.data
+    assert retry[idempotency.REPLAYED_HEADER] == 'true'
+    assert Order.objects.count() == 1
+    assert OutboxMessage.objects.count() == 1
+
+    # Another key is another order
+    assert post_order(api_client_authenticated, order_data, 'key-2').data != first.data
+    assert Order.objects.count() == 2
+
+
+def test_keys_are_scoped_to_the_user(api_client_authenticated, order_data):
+    post_order(api_client_authenticated, order_data, 'key')
+    guest_data = {**order_data, 'first_name': 'John', 'last_name': 'Doe', 'phone_number': '+380501234567'}
+    guest = APIClient()
+    guest.session.save()
+    response = post_order(guest, guest_data, 'key')
+    assert response.status_code == 201
+    assert idempotency.REPLAYED_HEADER not in response
+    assert Order.objects.count() == 2
+
+    # Guests are scoped to their session
+    assert post_order(guest, guest_data, 'key')[idempotency.REPLAYED_HEADER] == 'true'
+    other_guest = APIClient()
+    other_guest.session.save()
+    assert idempotency.REPLAYED_HEADER not in post_order(other_guest, guest_data, 'key')
+    assert Order.objects.count() == 3
+
+
+def test_guest_without_session(order_data):
+    guest_data = {**order_data, 'first_name': 'John', 'last_name': 'Doe', 'phone_number': '+380501234567'}
+    response = post_order(APIClient(), guest_data, 'key')
+    assert response.status_code == 400
+    assert idempotency.IDEMPOTENCY_HEADER in response.data
+    assert not Order.objects.exists()
+
+
+def test_key_reused_for_another_order(api_client_authenticated, order_data):
+    post_order(api_client_authenticated, order_data, 'key')
+    response = post_order(api_client_authenticated, {**order_data, 'city': 'another'}, 'key')
+    assert response.status_code == 422
+    assert Order.objects.count() == 1
+
+
+def test_failed_request_is_not_replayed(api_client_authenticated, order_data):
+    assert post_order(api_client_authenticated, {**order_data, 'items': []}, 'key').status_code == 400
+    assert post_order(api_client_authenticated, order_data, 'key').status_code == 201
+    assert post_order(api_client_authenticated, order_data, '').status_code == 400
+
+
+def test_duplicate_in_flight(mocker, api_client_authenticated, user_active, order_data, rf):
+    request = rf.post('/order/')
+    request.user = user_active
+    cache_key = idempotency.get_cache_key(request, 'key')
+    cache.add(idempotency.get_lock_key(cache_key), True)
+
+    mocker.patch.object(idempotency, 'IDEMPOTENCY_WAIT', 0)
+    response = post_order(api_client_authenticated, order_data, 'key')
+    assert response.status_code == 409
+    assert response['Retry-After'] == '1'
+
+    # The duplicate gets the response once the request in flight stored it
+    stored = {'fingerprint': idempotency.get_fingerprint(mocker.Mock(data=order_data)), 'status': 201,
+              'data': {'order_number': 1}}
+    sleep = mocker.patch('order.idempotency.time.sleep', side_effect=lambda _: cache.set(cache_key, stored))
+    mocker.patch.object(idempotency, 'IDEMPOTENCY_WAIT', 10)
+    response = post_order(api_client_authenticated, order_data, 'key')
+    sleep.assert_called_once()
+    assert (response.status_code, response.data) == (201, {'order_number': 1})
+    assert not Order.objects.exists()
@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+import pytest
+import requests
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from order import outbox
+from order.models import Order, OutboxKind, OutboxMessage, OutboxStatus, PaymentStatus
+from order.tasks import relay_stalled_outbox_messages
+
+pytestmark = pytest.mark.django_db
+
+
+def get_order_data(products, payment_mode='card'):
+    data = {
+        'address': 'address',
+        'city': 'city',
+        'items': [{'product': products[0].id, 'quantity': 2}],
+        'payment_mode': payment_mode,
+    }
+    if payment_mode == 'card':
+        data.update({'card': '4242424242424242', 'card_exp_month': '03', 'card_exp_year': '22', 'card_cvv': '111'})
+    return data
+
+
+def make_available(message):
+    OutboxMessage.objects.filter(pk=message.pk).update(available_at=timezone.now())
+
+
+def test_order_side_effects_run_after_commit(api_client_authenticated, products, mock_payment, mock_tgbot,
+                                             celery_eager, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as callbacks:
+        response = api_client_authenticated.post('/order/', data=get_order_data(products), format='json')
+    assert response.status_code == 201
+    # The card is charged by the request once the order is committed, and never stored
+    assert mock_payment.call_args.kwargs['card'] == '4242424242424242'
+    mock_tgbot.assert_not_called()
+    message, = OutboxMessage.objects.filter(order=response.data['order_number'])
+    assert (message.kind, message.payload) == (OutboxKind.NOTIFICATION, {})
+
+    for callback in callbacks:
+        callback()
+    mock_tgbot.assert_called_once()
+    assert set(OutboxMessage.objects.values_list('status', flat=True)) == {OutboxStatus.SENT}
+
+
+def test_unanswered_payment_is_checked(api_client_authenticated, products, mock_payment, mock_payment_status,
+                                       mock_tgbot, celery_eager, django_capture_on_commit_callbacks):
+    mock_payment.return_value.api.return_value = None
+    mock_payment_status.return_value.api.side_effect = [None, {'status': 'success'}]
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client_authenticated.post('/order/', data=get_order_data(products), format='json')
+    assert response.status_code == 201
+    order = Order.objects.get(pk=response.data['order_number'])
+    message = OutboxMessage.objects.get(order=order, kind=OutboxKind.PAYMENT_CHECK)
+    # The status is read again, the card is never charged again
+    make_available(message)
+    with django_capture_on_commit_callbacks(execute=True):
+        assert outbox.deliver(message.pk) is None
+    mock_payment.assert_called_once()
+    mock_payment_status.assert_called_with(order_id=str(order.id))
+    message.refresh_from_db()
+    assert (message.status, message.attempts) == (OutboxStatus.SENT, 2)
+    order.refresh_from_db()
+    assert (order.payment_status, order.paid) == (PaymentStatus.SUCCESS, True)
+
+
+def test_cash_order_notification_only(api_client_authenticated, products):
+    response = api_client_authenticated.post('/order/', data=get_order_data(products, 'cash'), format='json')
+    assert response.status_code == 201
+    assert list(OutboxMessage.objects.values_list('kind', flat=True)) == [OutboxKind.NOTIFICATION]
+
+
+def test_delivery_retried_with_backoff(order, mock_tgbot):
+    message = OutboxMessage.objects.create(order=order, kind=OutboxKind.NOTIFICATION)
+    mock_tgbot.side_effect = requests.ConnectionError
+
+    delay = outbox.deliver(message.pk)
+    assert 0 <= delay <= outbox.OUTBOX_RETRY_DELAY * 2
+    message.refresh_from_db()
+    assert (message.status, message.attempts) == (OutboxStatus.PENDING, 1)
+    assert 'ConnectionError' in message.last_error
+    # Not delivered again before its next attempt
+    assert outbox.deliver(message.pk) is None
+    assert mock_tgbot.call_count == 1
+
+    mock_tgbot.side_effect = None
+    make_available(message)
+    assert outbox.deliver(message.pk) is None
+    message.refresh_from_db()
+    assert (message.status, message.attempts, message.last_error) == (OutboxStatus.SENT, 2, '')
+    # A sent message is never sent again
+    make_available(message)
+    outbox.deliver(message.pk)
+    assert mock_tgbot.call_count == 2
+
+
+def test_delivery_gives_up(order, mock_tgbot, mock_payment_status):
+    message = OutboxMessage.objects.create(order=order, kind=OutboxKind.NOTIFICATION)
+    OutboxMessage.objects.filter(pk=message.pk).update(attempts=outbox.OUTBOX_MAX_ATTEMPTS - 1)
+    mock_tgbot.side_effect = requests.ConnectionError
+    assert outbox.deliver(message.pk) is None
+    message.refresh_from_db()
+    assert message.status == OutboxStatus.FAILED
+
+    # A check answered without a status is not retried
+    mock_payment_status.return_value.api.return_value = {'result': 'error'}
+    payment_message = OutboxMessage.objects.create(order=order, kind=OutboxKind.PAYMENT_CHECK)
+    assert outbox.deliver(payment_message.pk) is None
+    payment_message.refresh_from_db()
+    assert (payment_message.status, payment_message.attempts) == (OutboxStatus.FAILED, 1)
+    assert not order.payment_data.exists()
+
+
+def test_relay_stalled_outbox_messages(order, mock_tgbot, celery_eager):
+    message = OutboxMessage.objects.create(order=order, kind=OutboxKind.NOTIFICATION)
+    assert relay_stalled_outbox_messages() == 0
+
+    OutboxMessage.objects.filter(pk=message.pk).update(available_at=timezone.now() - timedelta(minutes=5))
+    assert relay_stalled_outbox_messages() == 1
+    mock_tgbot.assert_called_once()
+    assert OutboxMessage.objects.get(pk=message.pk).status == OutboxStatus.SENT
+
+
+def test_outbox_message_unique_per_kind(order):
+    OutboxMessage.objects.create(order=order, kind=OutboxKind.NOTIFICATION)
+    with pytest.raises(IntegrityError), transaction.atomic():
+        OutboxMessage.objects.create(order=order, kind=OutboxKind.NOTIFICATION)
@@ -1,8 +1,9 @@
 import pytest
 from rest_framework.exceptions import ValidationError
 
+from core.renderers import ORJSONRenderer
 from order import models
-from order.serializers import OrderListCreateSerializer
+from order.serializers import OrderDetailSerializer, OrderItemSerializer, OrderListCreateSerializer
 from tests.test_accounts.factories import gen_phone_number
 
 
@@ -154,3 +155,50 @@ def test_missing_required_no_user_and_not_first_name_and_last_name(db, request_a
     )
     with pytest.raises(ValidationError) as exc:
         serialized_data.is_valid(raise_exception=True)
+
+
+@pytest.mark.django_db
+def test_order_item_serializer_compiled(order, order_item_factory, django_assert_num_queries):
+    """ Test the compiled read path renders the same bytes as the regular one """
+
+    order_item_factory.create_batch(3, order=order)
+    expected = OrderItemSerializer(list(order.items.all()), many=True).data
+    with django_assert_num_queries(1):
+        data = OrderDetailSerializer(order).data['items']
+    assert ORJSONRenderer().render(data) == ORJSONRenderer().render(expected)
+
+
+def validate_items(items, request):
+    serializer = OrderListCreateSerializer(data={**order_data_with_payment_card(), 'items': items},
+                                           context={'request': request})
+    serializer.is_valid()
+    return serializer
+
+
+def test_order_items_validated_in_one_query(db, request_anonymous_user, products, django_assert_num_queries):
+    items = [{'product': product.id, 'quantity': 1} for product in products]
+    with django_assert_num_queries(1):
+        serializer = validate_items(items * 3, request_anonymous_user)
+    assert not serializer.errors
+    # The lines of the same product are merged
+    validated = serializer.validated_data['items']
+    assert [(item['product'], item['quantity']) for item in validated] == [(product, 3) for product in products]
+
+
+def test_order_items_invalid_products(db, request_anonymous_user, products):
+    products[0].is_published = False
+    products[0].save()
+    items = [{'product': products[0].id}, {'product': 0}, {'product': 'x'}, {'product': products[1].id}]
+    serializer = validate_items(items, request_anonymous_user)
+    errors = [item['product'][0].code if item else None for item in serializer.errors['items']]
+    assert errors == ['unpublished', 'does_not_exist', 'incorrect_type', None]
+
+
+def test_order_items_merged_quantity_fits_the_column(db, request_anonymous_user, products):
+    # The largest value of the quantity column
+    max_quantity = 2147483647
+    items = [{'product': products[0].id, 'quantity': max_quantity}, {'product': products[0].id, 'quantity': 1}]
+    serializer = validate_items(items, request_anonymous_user)
+    error, = serializer.errors['items']['non_field_errors']
+    assert error.code == 'max_quantity'
+    assert not validate_items(items[:1], request_anonymous_user).errors
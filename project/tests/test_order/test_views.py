@@ -97,7 +97,28 @@ def test_order_detail(api_client_authenticated, user_active, order_factory, orde
 
 
 @pytest.mark.django_db
-def test_pay_callback_view_signature_match(mocker, api_client, order_factory):
+def test_order_views_queries(api_client_authenticated, user_active, order_factory, order_item_factory,
+                             django_assert_num_queries):
+    orders = order_factory.create_batch(3, customer=user_active)
+    for order in orders:
+        order_item_factory.create_batch(2, order=order)
+
+    # The token, the orders, without the customer or the write-only items
+    with django_assert_num_queries(2):
+        response = api_client_authenticated.get('/order/')
+    assert response.status_code == 200
+    assert len(response.data) == 3
+
+    # The token, the order and its item rows
+    with django_assert_num_queries(3):
+        response = api_client_authenticated.get(f'/order/{orders[0].id}')
+    assert response.status_code == 200
+    assert len(response.data['items']) == 2
+
+
+@pytest.mark.django_db
+def test_pay_callback_view_signature_match(mocker, api_client, order_factory, celery_eager,
+                                           django_capture_on_commit_callbacks):
     order = order_factory.create(id=123)
     mocker.patch.object(Callback, 'callback', return_value={'order_id': order.id, 'status': 'success'})
 
@@ -106,10 +127,18 @@ def test_pay_callback_view_signature_match(mocker, api_client, order_factory):
         'signature': 'valid_signature'
     }
 
-    response = api_client.post('/order/paycallback', data=request_data, format='json')
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post('/order/paycallback', data=request_data, format='json')
     order.refresh_from_db()
     assert response.status_code == 204
     assert order.payment_status == 'success'
+    assert order.paid
+
+    # Repeated callbacks of the order are recorded too
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post('/order/paycallback', data=request_data, format='json')
+    assert response.status_code == 204
+    assert list(order.payment_data.values_list('status', flat=True)) == ['success', 'success']
 
 
 @pytest.mark.django_db
@@ -36,6 +36,18 @@ TEST_DIR = 'test_data'
 COUNT_PRODUCTS = 50
 
 
+@pytest.fixture(autouse=True)
+def search_without_trigram(settings):
+    # pg_trgm is installed by migrations, which the tests do not run
+    settings.STORE_SEARCH_TRIGRAM = False
+
+
+@pytest.fixture
+def celery_eager(monkeypatch):
+    from core.celery import app
+    monkeypatch.setattr(app.conf, 'task_always_eager', True)
+
+
 @pytest.fixture
 def category(category_factory):
     return category_factory.create(name='notebook')
@@ -0,0 +1,139 @@
+import csv
+import gzip
+import io
+from datetime import timedelta
+from xml.etree import ElementTree
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from store.feeds import CsvFeed, GoogleMerchantFeed, YmlFeed, get_last_feed_time
+from store.models import FeedExport, Product, ProductImage
+
+pytestmark = pytest.mark.django_db
+
+GOOGLE_NAMESPACE = '{http://base.google.com/ns/1.0}'
+
+
+def build_url(path):
+    return f'https://example.com{path}'
+
+
+@pytest.fixture
+def feed_products(product_factory, product_option_value_factory, category):
+    products = product_factory.create_batch(3, category=category)
+    product_option_value_factory(product=products[0])
+    Product.objects.filter(pk=products[0].pk).update(image='images/main.jpg')
+    ProductImage.objects.bulk_create([
+        ProductImage(product=products[0], image='images/first.jpg'),
+        ProductImage(product=products[0], image='images/second.jpg'),
+    ])
+    Product.objects.filter(pk=products[2].pk).update(is_published=False)
+    return products
+
+
+def test_yml_feed(feed_products, django_assert_num_queries):
+    # The categories, then the products, their options and their images in one chunk
+    with django_assert_num_queries(4):
+        content = ''.join(YmlFeed(build_url).stream())
+    shop = ElementTree.fromstring(content).find('shop')
+    offers = shop.find('offers').findall('offer')
+    assert [int(offer.get('id')) for offer in offers] == [feed_products[0].id, feed_products[1].id]
+    assert shop.find('categories/category').text == feed_products[0].category.name
+
+    offer = offers[0]
+    assert [picture.text for picture in offer.findall('picture')] == [
+        'https://example.com/media/images/main.jpg',
+        'https://example.com/media/images/first.jpg',
+        'https://example.com/media/images/second.jpg',
+    ]
+    option_value = feed_products[0].options_values.get()
+    param, = offer.findall('param')
+    assert (param.get('name'), param.text) == (option_value.option.name, option_value.value.name)
+    assert offer.find('name').text == feed_products[0].name
+    assert offer.find('url').text.endswith(f'/product/{feed_products[0].slug}')
+
+
+def test_google_merchant_feed(feed_products):
+    content = ''.join(GoogleMerchantFeed(build_url).stream())
+    items = ElementTree.fromstring(content).find('channel').findall('item')
+    assert len(items) == 2
+    item = items[0]
+    assert item.find(f'{GOOGLE_NAMESPACE}id').text == str(feed_products[0].id)
+    assert item.find(f'{GOOGLE_NAMESPACE}image_link').text == 'https://example.com/media/images/main.jpg'
+    assert len(item.findall(f'{GOOGLE_NAMESPACE}additional_image_link')) == 2
+    assert item.find(f'{GOOGLE_NAMESPACE}price').text == f'{feed_products[0].price} UAH'
+
+
+def test_csv_feed_incremental(feed_products):
+    since = timezone.now()
+    Product.objects.filter(pk__in=[feed_products[1].pk, feed_products[2].pk]).touch()
+
+    rows = list(csv.DictReader(io.StringIO(''.join(CsvFeed(build_url, since).stream()))))
+    # Unpublished products changed since are listed as unavailable
+    assert [(int(row['id']), row['available']) for row in rows] == [
+        (feed_products[1].id, '1'), (feed_products[2].id, '0')
+    ]
+    assert not list(CsvFeed(build_url, timezone.now()).stream())[1:-1]
+
+
+def test_export_feed_command(feed_products, tmp_path, settings):
+    settings.STORE_FEED_OVERLAP = 0
+    output = tmp_path / 'feed.xml.gz'
+    call_command('export_feed', 'yml', str(output), stdout=io.StringIO())
+    with gzip.open(output, 'rt', encoding='utf-8') as file:
+        assert len(ElementTree.parse(file).getroot().find('shop/offers')) == 2
+    assert get_last_feed_time('yml') is not None
+
+    Product.objects.filter(pk=feed_products[1].pk).update(updated_at=timezone.now() + timedelta(minutes=1))
+    call_command('export_feed', 'yml', str(output), '--incremental', stdout=io.StringIO())
+    with gzip.open(output, 'rt', encoding='utf-8') as file:
+        offers = ElementTree.parse(file).getroot().find('shop/offers')
+    assert [int(offer.get('id')) for offer in offers] == [feed_products[1].id]
+
+    # With an overlap the products changed shortly before the previous feed are listed again
+    settings.STORE_FEED_OVERLAP = 60
+    call_command('export_feed', 'yml', str(output), stdout=io.StringIO())
+    call_command('export_feed', 'yml', str(output), '--incremental', stdout=io.StringIO())
+    with gzip.open(output, 'rt', encoding='utf-8') as file:
+        assert len(ElementTree.parse(file).getroot().find('shop/offers')) == 3
+
+
+def test_export_feed_command_since(feed_products, tmp_path, settings):
+    settings.STORE_FEED_OVERLAP = 60
+    output = tmp_path / 'feed.csv'
+    since = timezone.now()
+    Product.objects.filter(pk=feed_products[0].pk).touch()
+    call_command('export_feed', 'csv', str(output), '--since', since.isoformat(), stdout=io.StringIO())
+    with open(output, encoding='utf-8') as file:
+        assert [int(row['id']) for row in csv.DictReader(file)] == [feed_products[0].id]
+    # The watermark is kept in the database, the next incremental feed reaches back before the start of this one
+    # for the products stamped by transactions that were not committed yet
+    last_time = get_last_feed_time('csv')
+    assert since - timedelta(seconds=60) < last_time <= timezone.now() - timedelta(seconds=60)
+    assert FeedExport.objects.get(feed='csv').exported_at == last_time
+
+    with pytest.raises(CommandError):
+        call_command('export_feed', 'csv', str(output), '--since', 'yesterday')
+
+
+def test_feed_view(api_client_auth_admin, feed_products):
+    response = api_client_auth_admin.get('/store/feeds/csv')
+    assert response.status_code == 200
+    assert response.streaming
+    assert response['Content-Disposition'] == 'attachment; filename="csv.csv"'
+    rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+    assert rows[0]['image_link'] == 'http://testserver/media/images/main.jpg'
+    assert len(rows) == 2
+
+    since = (timezone.now() + timedelta(minutes=1)).isoformat()
+    response = api_client_auth_admin.get('/store/feeds/yml', {'since': since})
+    assert len(ElementTree.fromstring(b''.join(response.streaming_content)).find('shop/offers')) == 0
+
+    assert api_client_auth_admin.get('/store/feeds/unknown').status_code == 404
+    assert api_client_auth_admin.get('/store/feeds/yml', {'since': 'yesterday'}).status_code == 400
+
+
+def test_feed_view_staff_only(api_client_authenticated):
+    assert api_client_authenticated.get('/store/feeds/yml').status_code == 403
@@ -0,0 +1,144 @@
+import pytest
+from django.db import transaction
+
+from store.facets import FACET_INDEX_VERSION_KEY, facet_index
+from store.filters import (
+    count_values,
+    filter_by_ids,
+    filter_by_price,
+    filter_by_values,
+    filter_by_values_sql,
+    order_by_price,
+    parse_value_ids,
+)
+from store.models import Product, ProductOptionValue, Value
+from store.search import search_products
+from store.versions import bump_version
+
+pytestmark = pytest.mark.django_db
+
+
+def test_filter_by_price_uses_selling_price(product_factory, category):
+    discounted = product_factory.create(price=300, discount_price=50, category=category)
+    regular = product_factory.create(price=150, discount_price=None, category=category)
+
+    queryset = filter_by_price(Product.objects.all(), price_min=100, price_max=200)
+    assert list(queryset) == [regular]
+
+    queryset = filter_by_price(Product.objects.all(), price_max=60)
+    assert list(queryset) == [discounted]
+
+
+@pytest.mark.parametrize('order_price', ['price', '-price'])
+def test_order_by_price(products, order_price):
+    queryset = order_by_price(Product.objects.all(), [order_price])
+    prices = [product.discount_price or product.price for product in queryset]
+    assert prices == sorted(prices, reverse=order_price == '-price')
+
+
+@pytest.fixture
+def selected_values(product_filter, values_dict):
+    values = [values_dict['Display size'][1], values_dict['Color'][0], values_dict['Color'][1]]
+    return ','.join(str(value.id) for value in values)
+
+
+def test_filter_by_values_facet_index_matches_sql(settings, products, selected_values):
+    settings.STORE_FACET_INDEX = True
+    facet_products = filter_by_values(Product.objects.all(), selected_values)
+
+    settings.STORE_FACET_INDEX = False
+    sql_products = filter_by_values(Product.objects.all(), selected_values)
+
+    assert sql_products.count() == len(set(sql_products.values_list('id', flat=True)))
+    assert set(facet_products) == set(sql_products)
+
+
+def test_filter_by_ids(products):
+    ids = [product.id for product in products[:3]]
+    assert set(filter_by_ids(Product.objects.all(), ids).values_list('id', flat=True)) == set(ids)
+    assert not filter_by_ids(Product.objects.all(), []).exists()
+
+
+def test_facet_index_follows_product_option_values(settings, product, options_dict, values_dict,
+                                                   django_capture_on_commit_callbacks):
+    settings.STORE_FACET_INDEX = True
+    value = values_dict['Color'][2]
+    assert product not in filter_by_values(Product.objects.all(), str(value.id))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product_option_value = ProductOptionValue.objects.create(
+            product=product, option=options_dict['Color'], value=value
+        )
+    assert list(filter_by_values(Product.objects.all(), str(value.id))) == [product]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product_option_value.delete()
+    assert product not in filter_by_values(Product.objects.all(), str(value.id))
+
+
+def test_facet_index_ignores_rolled_back_changes(product, options_dict, values_dict,
+                                                django_capture_on_commit_callbacks):
+    value = values_dict['Color'][2]
+    facet_index.build()
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with pytest.raises(RuntimeError), transaction.atomic():
+            ProductOptionValue.objects.create(product=product, option=options_dict['Color'], value=value)
+            raise RuntimeError
+    assert not callbacks
+    assert product.id not in facet_index.match([value.id])
+
+
+def test_facet_index_rebuilds_after_external_change(product, options_dict, values_dict):
+    value = values_dict['Ram size'][0]
+    facet_index.build()
+    ProductOptionValue.objects.bulk_create([
+        ProductOptionValue(product=product, option=options_dict['Ram size'], value=value)
+    ])
+    assert product.id not in facet_index.match([value.id])
+
+    bump_version(FACET_INDEX_VERSION_KEY)
+    assert product.id in facet_index.match([value.id])
+
+
+@pytest.mark.parametrize('facet_index_enabled', [True, False])
+def test_count_values(settings, category, product_filter, values_dict, selected_values, facet_index_enabled):
+    settings.STORE_FACET_INDEX = facet_index_enabled
+    queryset = Product.objects.filter(category=category)
+    value_ids = [value.id for values in values_dict.values() for value in values]
+    selected_value_ids = parse_value_ids(selected_values)
+
+    counts = count_values(queryset, value_ids, selected_value_ids)
+
+    for value_id in value_ids:
+        option_id = Value.objects.get(id=value_id).option_id
+        # The value's own option selection is replaced by the value itself
+        other_values = [v for v in selected_value_ids if Value.objects.get(id=v).option_id != option_id]
+        expected = filter_by_values_sql(queryset, [*other_values, value_id])
+        assert counts[value_id] == expected.count()
+
+
+def test_search_products(product_factory, category):
+    laptop = product_factory.create(name='Gaming Laptop', description='Fast machine', category=category)
+    phone = product_factory.create(name='Phone', description='A phone to carry with a laptop', category=category)
+    product_factory.create(name='Tablet', description='Big screen', category=category)
+
+    # Partial words match as prefixes, the name ranks above the description
+    queryset = search_products(Product.objects.all(), 'lapt').order_by('-search_rank')
+    assert list(queryset) == [laptop, phone]
+
+    # Every word has to match
+    assert list(search_products(Product.objects.all(), 'gaming laptop')) == [laptop]
+
+
+def test_search_vector_follows_updates(product_factory, category):
+    product = product_factory.create(name='Keyboard', category=category)
+    assert list(search_products(Product.objects.all(), 'keyboard')) == [product]
+
+    Product.objects.filter(pk=product.pk).update(name='Mouse')
+    assert list(search_products(Product.objects.all(), 'mouse')) == [product]
+
+    product.refresh_from_db()
+    product.name = 'Trackpad'
+    product.save(update_fields=['name'])
+    assert list(search_products(Product.objects.all(), 'trackpad')) == [product]
+    assert not search_products(Product.objects.all(), 'mouse').exists()
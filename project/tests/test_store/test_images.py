@@ -0,0 +1,66 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from store.images import create_renditions, format_srcset, get_rendition_widths
+from store.models import Product
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def photo_file():
+    file = BytesIO()
+    exif = Image.Exif()
+    exif[0x010f] = 'Camera maker'
+    Image.new('RGB', size=(700, 350), color='red').save(file, 'jpeg', exif=exif)
+    return ContentFile(file.getvalue(), name='photo.jpg')
+
+
+def test_get_rendition_widths():
+    assert get_rendition_widths(50) == [50]
+    assert get_rendition_widths(700) == [320, 640, 700]
+    assert get_rendition_widths(4000) == [320, 640, 1024, 1600]
+
+
+def test_create_renditions(product, photo_file, use_test_dir):
+    product.image = photo_file
+    product.save()
+
+    renditions = create_renditions(Product._meta.label, product.pk, 'image')
+    product.refresh_from_db()
+    assert product.image_renditions == renditions
+    assert renditions['source'] == product.image.name
+    assert (renditions['width'], renditions['height']) == (700, 350)
+    assert {(variant['format'], variant['width'], variant['height']) for variant in renditions['variants']} == {
+        (image_format, width, width // 2) for image_format in ('webp', 'jpeg') for width in (320, 640, 700)
+    }
+    for variant in renditions['variants']:
+        with default_storage.open(variant['name']) as file:
+            image = Image.open(file)
+            assert image.format == variant['format'].upper()
+            assert not image.getexif()
+
+    srcset = format_srcset(renditions, str)
+    assert srcset['srcset']['webp'].endswith('700w')
+    assert srcset['srcset']['webp'].count(',') == 2
+
+
+def test_product_image_srcset_on_demand(api_client, product, photo_file, use_test_dir, celery_eager,
+                                        django_capture_on_commit_callbacks):
+    """ Test missing renditions are created in the background and then listed """
+
+    url = f'/store/categories/{product.category.slug}/products'
+    Product.objects.filter(pk=product.pk).update(image=default_storage.save('images/photo.jpg', photo_file))
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.get(url)
+    assert response.data['results'][0]['image_srcset'] is None
+
+    response = api_client.get(url)
+    srcset = response.data['results'][0]['image_srcset']
+    assert srcset['width'] == 700
+    assert set(srcset['srcset']) == {'webp', 'jpeg'}
+    assert srcset['srcset']['jpeg'].startswith('http://testserver/')
@@ -1,6 +1,12 @@
 import pytest
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
+from django.db.models import F
+
+from store.categories import get_category_versions
+from store.favorites import get_favorites_ranking_version
+from store.models import Favorite, Product, ProductQuerySet
+from store.tasks import reconcile_favorites_counts
 
 pytestmark = pytest.mark.django_db
 
@@ -71,3 +77,108 @@ def test_price_more_than_discount_price(product_factory, category):
     instance = product_factory.build(price=10, discount_price=15, category=category)
     with pytest.raises(IntegrityError):
         instance.save()
+
+
+def test_effective_price_on_save(product_factory, category):
+    # The effective price is the discount price when there is one, otherwise the price
+    product = product_factory.create(price=100, discount_price=80, category=category)
+    assert product.effective_price == 80
+
+    product.discount_price = None
+    product.save(update_fields=['discount_price'])
+    product.refresh_from_db()
+    assert product.effective_price == 100
+
+
+def test_effective_price_on_queryset_update(product_factory, category):
+    product = product_factory.create(price=100, discount_price=None, category=category)
+
+    Product.objects.filter(pk=product.pk).update(discount_price=70)
+    product.refresh_from_db()
+    assert product.effective_price == 70
+
+    Product.objects.filter(pk=product.pk).update(price=F('price') * 2, discount_price=None)
+    product.refresh_from_db()
+    assert product.effective_price == 200
+
+
+def test_effective_price_on_bulk_operations(product_factory, category):
+    products = Product.objects.bulk_create([
+        product_factory.build(price=50, discount_price=40, slug='bulk-1', category=category),
+        product_factory.build(price=60, discount_price=None, slug='bulk-2', category=category),
+    ])
+    assert [p.effective_price for p in Product.objects.filter(slug__startswith='bulk-').order_by('slug')] == [40, 60]
+
+    for product in products:
+        product.discount_price = 30
+    Product.objects.bulk_update(products, ['discount_price'])
+    assert set(Product.objects.filter(slug__startswith='bulk-').values_list('effective_price', flat=True)) == {30}
+
+
+def test_favorites_count(product_factory, favorite_factory, user_factory):
+    product, other = product_factory.create_batch(2)
+    users = user_factory.create_batch(3)
+    favorites = [favorite_factory(product=product, user=user) for user in users]
+    Favorite.objects.add(users[0], [other.slug, product.slug])
+    assert list(Product.objects.order_by('id').values_list('favorites_count', flat=True)) == [3, 1]
+
+    favorites[1].delete()
+    Favorite.objects.remove(users[0], [product.slug, other.slug])
+    assert list(Product.objects.order_by('id').values_list('favorites_count', flat=True)) == [1, 0]
+
+
+def test_reconcile_favorites_counts(product_factory, favorite_factory):
+    product, other, unchanged = product_factory.create_batch(3)
+    favorite_factory.create_batch(2, product=product)
+    Product.objects.filter(pk=product.pk).update_counters(favorites_count=0)
+    Product.objects.filter(pk=other.pk).update_counters(favorites_count=5)
+    version = get_favorites_ranking_version()
+
+    assert reconcile_favorites_counts() == 2
+    assert list(Product.objects.order_by('id').values_list('favorites_count', flat=True)) == [2, 0, 0]
+    assert get_favorites_ranking_version() != version
+    assert reconcile_favorites_counts() == 0
+
+
+def test_bulk_writes_bump_category_versions_after_commit(product, django_capture_on_commit_callbacks):
+    versions = get_category_versions([product.category_id])
+    with django_capture_on_commit_callbacks() as callbacks:
+        Product.objects.filter(pk=product.pk).update(price=F('price') + 1)
+    assert get_category_versions([product.category_id]) == versions
+
+    for callback in callbacks:
+        callback()
+    assert get_category_versions([product.category_id]) != versions
+
+
+def test_bulk_update_rebuilds_documents_in_chunks(mocker, product_factory, celery_eager,
+                                                  django_capture_on_commit_callbacks):
+    products = product_factory.create_batch(3)
+    mocker.patch('store.documents.PRODUCT_DOCUMENTS_CHUNK_SIZE', 2)
+    rebuild = mocker.patch('store.tasks.rebuild_product_documents.delay')
+    with django_capture_on_commit_callbacks(execute=True):
+        Product.objects.filter(pk__in=[product.pk for product in products]).touch()
+    assert [call.args for call in rebuild.call_args_list] == [([products[0].pk, products[1].pk],), ([products[2].pk],)]
+
+    # Updates stamping the rows with an expression pass the ids
+    rebuild.reset_mock()
+    with django_capture_on_commit_callbacks(execute=True):
+        Product.objects.filter(pk=products[0].pk).update(updated_at=F('created_at'))
+    rebuild.assert_called_once_with([products[0].pk])
+
+
+def test_related_changes_touch_products_once_on_commit(mocker, product, product_option_value_factory,
+                                                       product_image_factory, django_capture_on_commit_callbacks):
+    touch = mocker.spy(ProductQuerySet, 'touch')
+    with django_capture_on_commit_callbacks(execute=True):
+        product_option_value_factory.create_batch(3, product=product)
+        product_image_factory.create_batch(2, product=product)
+        assert touch.call_count == 0
+    touch.assert_called_once()
+    assert list(touch.call_args.args[0].values_list('pk', flat=True)) == [product.pk]
+
+    # The rows deleted with their product do not touch it
+    touch.reset_mock()
+    with django_capture_on_commit_callbacks(execute=True):
+        product.delete()
+    touch.assert_not_called()
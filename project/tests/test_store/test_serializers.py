@@ -3,6 +3,7 @@ from decimal import Decimal
 import pytest
 from rest_framework import exceptions
 
+from core.renderers import ORJSONRenderer
 from store import models
 from store import serializers
 from store.views import get_filtered_options
@@ -58,6 +59,26 @@ def test_product_list_serializer(products, request_anonymous_user):
     assert data[0]['favorite'] is False
 
 
+@pytest.mark.parametrize('request_user', ['request_anonymous_user', 'request_user_active'])
+def test_product_list_serializer_compiled(products, user_active, request_user, request):
+    """ Test the compiled read path renders the same bytes as the regular one """
+
+    context = {'request': request.getfixturevalue(request_user)}
+    models.Favorite.objects.create(user=user_active, product=products[1])
+    renditions = {'source': 'images/a.jpg', 'width': 400, 'height': 200, 'variants': [
+        {'name': 'renditions/a_320.webp', 'format': 'webp', 'width': 320, 'height': 160},
+    ]}
+    models.Product.objects.filter(pk=products[0].pk).update(image='images/a.jpg', image_renditions=renditions)
+    models.Product.objects.filter(pk=products[2].pk).update(image='images/b.jpg')
+    queryset = models.Product.objects.order_by('id')
+
+    expected = serializers.ProductListSerializer(list(queryset), many=True, context=context).data
+    data = serializers.ProductListSerializer(queryset, many=True, context=context).data
+    assert ORJSONRenderer().render(data) == ORJSONRenderer().render(expected)
+    assert data[0]['image_srcset']['srcset']['webp'].endswith('320w')
+    assert data[1]['favorite'] is (request_user == 'request_user_active')
+
+
 def test_product_detail_serializer(request_anonymous_user, product_option_value):
     product = models.ProductOptionValue.objects.first().product
     data = serializers.ProductDetailSerializer(product, context={'request': request_anonymous_user}).data
@@ -1,13 +1,22 @@
+import json
+from base64 import urlsafe_b64encode
+from datetime import timedelta
 from decimal import Decimal
 from math import floor, ceil
 
+import factory
 import pytest
+from django.db import IntegrityError, transaction
 from django.db.models import Case, When
 from django.db.models import DecimalField
+from rest_framework.test import APIClient
 
 from store import serializers
+from store.categories import category_resolver
+from store.conditional import get_user_stamp
 from store.filters import filter_by_values, filter_by_price, filter_by_name, order_by_price
-from store.models import Value, Product
+from store.models import Category, Favorite, Value, Product
+from store.pagination import KeysetPagination
 from tests.test_store.conftest import COUNT_PRODUCTS
 
 pytestmark = pytest.mark.django_db
@@ -20,20 +29,122 @@ def test_get_categories(api_client, category_tree):
     response = api_client.get(url)
     expected_data = serializers.CategoriesSerializer(category_tree, many=True).data
     assert response.status_code == 200
-    assert len(response.data) == len(category_tree)
-    assert response.data == expected_data
+    assert len(response.json()) == len(category_tree)
+    assert response.json() == expected_data
+
+
+def test_get_categories_cache(api_client, category_tree, django_assert_num_queries,
+                              django_capture_on_commit_callbacks):
+    """ Test CategoriesListView serves the cached tree until a category changes """
+
+    url = '/store/categories'
+    api_client.get(url)
+    with django_assert_num_queries(0):
+        cached_response = api_client.get(url)
+    assert cached_response.json()[0]['children'][0]['slug'] == 'category_b'
+
+    # Hidden categories are left out together with their descendants
+    category = Category.objects.get(slug='category_b')
+    category.hide = True
+    with django_capture_on_commit_callbacks() as callbacks:
+        category.save()
+    # The cached tree stays until the change is committed
+    assert api_client.get(url).json()[0]['children'][0]['slug'] == 'category_b'
+    for callback in callbacks:
+        callback()
+    response = api_client.get(url)
+    assert response.json()[0]['children'] == []
+
+    # Moving a category is a change of the tree too
+    with django_capture_on_commit_callbacks(execute=True):
+        Category.objects.get(slug='category_c').move_to(Category.objects.get(slug='category_d'))
+    response = api_client.get(url)
+    assert response.json()[1]['children'][0]['slug'] == 'category_c'
+
+
+def test_category_resolver(category_tree, django_assert_num_queries, django_capture_on_commit_callbacks):
+    """ Test category scopes are resolved once and re-resolved after the tree changes """
+
+    scope = category_resolver.resolve('category_b')
+    ids = set(Category.objects.get(slug='category_b').get_descendants(include_self=True).values_list('id', flat=True))
+    assert set(scope.descendant_ids) == ids
+    assert category_resolver.resolve('unknown') is None
+    with django_assert_num_queries(0):
+        assert category_resolver.resolve('category_b') is scope
+    # Unknown slugs are looked up every time rather than kept
+    with django_assert_num_queries(1):
+        assert category_resolver.resolve('unknown') is None
+    assert 'unknown' not in category_resolver._scopes
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Category.objects.get(slug='category_d').move_to(Category.objects.get(slug='category_c'))
+    scope = category_resolver.resolve('category_b')
+    assert set(scope.descendant_ids) == ids | {Category.objects.get(slug='category_d').id}
+
+
+def test_get_products_by_unknown_category(api_client, products):
+    response = api_client.get('/store/categories/unknown/products')
+    assert response.status_code == 200
+    assert response.json()['results'] == []
 
 
 def test_get_products_by_category(api_client, category, products, request_user_active):
     """ Test ProductListView list method """
 
     url = f'/store/categories/{category.slug}/products'
-    response = api_client.get(url)
+    response = api_client.get(url, {'limit': COUNT_PRODUCTS})
     expected_json = serializers.ProductListSerializer(products, context={'request': request_user_active},
                                                       many=True).data
     assert response.status_code == 200
-    assert len(response.data) == COUNT_PRODUCTS
-    assert response.data == expected_json
+    assert len(response.data['results']) == COUNT_PRODUCTS
+    assert response.data['results'] == expected_json
+    assert response.data['next'] is None
+
+
+@pytest.mark.parametrize('order_price', ['-price', 'price', None])
+def test_get_products_by_category_pages(api_client, category, products, order_price):
+    """ Test ProductListView cursor pagination walks every product once, forwards and backwards """
+
+    url = f'/store/categories/{category.slug}/products'
+    params = {'limit': 7, 'count': 'approx'}
+    if order_price:
+        params['o'] = order_price
+    response = api_client.get(url, params)
+    assert response.data['previous'] is None
+    assert isinstance(response.data['count'], int)
+
+    pages = [response.data]
+    while pages[-1]['next']:
+        pages.append(api_client.get(pages[-1]['next']).data)
+    forward_ids = [product['id'] for page in pages for product in page['results']]
+    assert sorted(forward_ids) == sorted(product.id for product in products)
+    assert all(len(page['results']) == 7 for page in pages[:-1])
+    if order_price:
+        assert_prices_sorted([product for page in pages for product in page['results']], order_price)
+
+    backward_pages = [pages[-1]]
+    while backward_pages[-1]['previous']:
+        backward_pages.append(api_client.get(backward_pages[-1]['previous']).data)
+    backward_ids = [product['id'] for page in reversed(backward_pages) for product in page['results']]
+    assert backward_ids == forward_ids
+
+
+def test_get_products_by_category_invalid_cursor(api_client, category, products):
+    url = f'/store/categories/{category.slug}/products'
+    response = api_client.get(url, {'cursor': 'invalid'})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize('ordering, position', [
+    (None, ['abc']), (None, [{}]), (None, [None]), ('price', ['abc', {}, 1]), ('price', ['1.00', 'yesterday', 1]),
+])
+def test_get_products_by_category_crafted_cursor(api_client, category, products, ordering, position):
+    """ Test cursor positions the ordering fields can not take are rejected """
+
+    url = f'/store/categories/{category.slug}/products'
+    cursor = urlsafe_b64encode(json.dumps({'p': position}).encode()).decode()
+    response = api_client.get(url, {'cursor': cursor, **({'o': ordering} if ordering else {})})
+    assert response.status_code == 404
 
 
 def test_get_product_detail(api_client, product, request_anonymous_user):
@@ -58,6 +169,338 @@ def test_favorite_product_detail(api_client_authenticated, favorite_product, req
     assert response.data == expected_json
 
 
+def test_get_products_sparse_fields(api_client_authenticated, category, products, favorite_product,
+                                   django_assert_num_queries):
+    """ Test ProductListView returns only the selected fields, without loading the favorites """
+
+    url = f'/store/categories/{category.slug}/products'
+    response = api_client_authenticated.get(url, {'limit': 5})
+    assert 'favorite' in response.data['results'][0]
+    assert 'images' not in response.data['results'][0]
+
+    # The token and the products, the favorites are not loaded
+    with django_assert_num_queries(2):
+        response = api_client_authenticated.get(url, {'limit': 5, 'fields': 'id,slug,price,image'})
+    assert response.status_code == 200
+    assert all(list(product) == ['id', 'image', 'slug', 'price'] for product in response.data['results'])
+
+    response = api_client_authenticated.get(url, {'limit': 5, 'omit': 'favorite,image_srcset'})
+    assert all('favorite' not in product and 'image_srcset' not in product for product in response.data['results'])
+    assert all('name' in product for product in response.data['results'])
+
+    response = api_client_authenticated.get(url, {'limit': 5, 'fields': 'id,unknown'})
+    assert response.status_code == 400
+    assert response.data == {'fields': ['Unknown field: unknown']}
+
+
+def test_get_products_optional_images(api_client, category, products, product_image_factory, image_file, use_test_dir,
+                                      request_anonymous_user):
+    """ Test the images of the products are only listed when requested, the same as the regular path renders them """
+
+    product_image_factory(product=products[0], image=image_file)
+    product_image_factory(product=products[0], image=None)
+    url = f'/store/categories/{category.slug}/products'
+    response = api_client.get(url, {'limit': COUNT_PRODUCTS, 'fields': 'id,images'})
+    request_anonymous_user.GET = request_anonymous_user.GET.copy()
+    request_anonymous_user.GET['fields'] = 'id,images'
+    expected_json = serializers.ProductListSerializer(products, context={'request': request_anonymous_user},
+                                                      many=True).data
+    assert response.status_code == 200
+    assert response.data['results'] == expected_json
+    images = {product['id']: product['images'] for product in response.data['results']}
+    assert len(images[products[0].id]) == 1
+    assert images[products[0].id][0].startswith('http://testserver/')
+
+
+def test_get_product_detail_sparse_fields(api_client_authenticated, favorite_product, django_assert_num_queries):
+    """ Test ProductDetailView trims the document to the selected fields """
+
+    url = f'/store/product/{favorite_product.slug}'
+    response = api_client_authenticated.get(url, {'fields': 'price,favorite'})
+    assert response.data == {'price': str(favorite_product.price), 'favorite': True}
+
+    # The token and the updated_at lookup of the conditional GET, not the favorite
+    with django_assert_num_queries(2):
+        response = api_client_authenticated.get(url, {'fields': 'price'})
+    assert response.data == {'price': str(favorite_product.price)}
+
+    response = api_client_authenticated.get(url, {'omit': 'options,images,images_srcset'})
+    assert set(response.data) == {'name', 'image', 'image_srcset', 'price', 'description', 'favorite'}
+
+    assert api_client_authenticated.get(url, {'omit': 'unknown'}).status_code == 400
+
+
+def test_get_products_batch(api_client_authenticated, products, favorite_product, request_user_active,
+                            celery_eager, django_assert_num_queries, django_capture_on_commit_callbacks):
+    """ Test ProductBatchView keeps the order of the slugs, marks those not found and serves the stored documents """
+
+    url = '/store/products/batch'
+    slugs = [products[3].slug, 'unknown', favorite_product.slug, products[0].slug, products[3].slug]
+    expected = {
+        product.slug: serializers.ProductListSerializer(product, context={'request': request_user_active}).data
+        for product in (products[0], products[3], favorite_product)
+    }
+
+    # The token and the products, the favorites of the user were cached building the expected data
+    with django_assert_num_queries(2), django_capture_on_commit_callbacks() as callbacks:
+        response = api_client_authenticated.post(url, {'slugs': slugs}, format='json')
+    assert response.status_code == 200
+    assert [item['slug'] for item in response.data['results']] == slugs
+    assert [item['product'] and item['product']['slug'] for item in response.data['results']] == [
+        products[3].slug, None, favorite_product.slug, products[0].slug, products[3].slug
+    ]
+    assert response.data['results'][2]['product'] == expected[favorite_product.slug]
+    assert response.data['results'][0]['product'] == expected[products[3].slug]
+
+    # The documents of the products are rebuilt, then served without reading the products
+    for callback in callbacks:
+        callback()
+    found = [item for item in response.data['results'] if item['product']]
+    with django_assert_num_queries(1):
+        data = api_client_authenticated.post(url, {'slugs': [item['slug'] for item in found]}, format='json').data
+    assert data['results'] == found
+    # Slugs not found are looked up again
+    with django_assert_num_queries(2):
+        assert api_client_authenticated.post(url, {'slugs': slugs}, format='json').data == response.data
+
+    response = api_client_authenticated.post(f'{url}?fields=slug,favorite', {'slugs': slugs[:3]}, format='json')
+    assert [item['product'] for item in response.data['results']] == [
+        {'slug': products[3].slug, 'favorite': False}, None, {'slug': favorite_product.slug, 'favorite': True}
+    ]
+
+
+def test_get_products_batch_by_ids(api_client, products, django_assert_num_queries):
+    url = '/store/products/batch'
+    ids = [products[5].id, products[1].id, products[-1].id + 1, products[5].id]
+    with django_assert_num_queries(1):
+        response = api_client.post(url, {'ids': ids}, format='json')
+    assert [item['id'] for item in response.data['results']] == ids
+    assert [item['product'] and item['product']['id'] for item in response.data['results']] == [
+        products[5].id, products[1].id, None, products[5].id
+    ]
+    assert response.data['results'][1]['product']['favorite'] is False
+
+
+@pytest.mark.parametrize('data', [{}, {'ids': [1], 'slugs': ['a']}, {'ids': []}, {'slugs': ['a'] * 301}])
+def test_get_products_batch_invalid(api_client, data):
+    response = api_client.post('/store/products/batch', data, format='json')
+    assert response.status_code == 400
+
+
+def test_product_documents_follow_bulk_updates(api_client, product, celery_eager,
+                                               django_capture_on_commit_callbacks):
+    """ Test the documents of products changed by queryset updates are rebuilt """
+
+    url = f'/store/product/{product.slug}'
+    api_client.get(url)
+    with django_capture_on_commit_callbacks(execute=True):
+        Product.objects.filter(pk=product.pk).update(price=Decimal('12.50'), discount_price=None)
+    assert api_client.get(url).data['price'] == '12.50'
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Product.objects.filter(pk=product.pk).update(slug='updated-slug')
+    assert api_client.get(url).status_code == 404
+    response = api_client.post('/store/products/batch', {'slugs': ['updated-slug']}, format='json')
+    assert response.data['results'][0]['product']['price'] == '12.50'
+
+
+def test_get_product_detail_document(request, api_client, celery_eager, django_assert_num_queries,
+                                    django_capture_on_commit_callbacks):
+    """ Test ProductDetailView serves the stored document, rebuilt when it is older than the product """
+
+    # The changes of the related rows touch the products once committed, as the later ones do
+    with django_capture_on_commit_callbacks(execute=True):
+        request.getfixturevalue('product_option_value')
+    product = Product.objects.first()
+    url = f'/store/product/{product.slug}'
+    response = api_client.get(url)
+    # Only the updated_at lookup of the conditional GET
+    with django_assert_num_queries(1):
+        assert api_client.get(url).data == response.data
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.name = 'Renamed product'
+        product.save()
+    assert api_client.get(url).data['name'] == 'Renamed product'
+
+    # A document whose rebuild is still queued or was lost is rebuilt on the spot, under the ETag of its body
+    etag = api_client.get(url)['ETag']
+    with django_capture_on_commit_callbacks():
+        Product.objects.filter(pk=product.pk).update(name='Not rebuilt yet')
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert (response.status_code, response.data['name']) == (200, 'Not rebuilt yet')
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+
+    value = product.options_values.first().value
+    with django_capture_on_commit_callbacks(execute=True):
+        value.name = 'Renamed value'
+        value.save()
+    values = [value['name'] for option in api_client.get(url).data['options'] for value in option['values']]
+    assert 'Renamed value' in values
+
+    old_url = url
+    with django_capture_on_commit_callbacks(execute=True):
+        product.slug = 'renamed-product'
+        product.save()
+    assert api_client.get(old_url).status_code == 404
+    assert api_client.get('/store/product/renamed-product').status_code == 200
+
+
+@pytest.mark.parametrize(
+    'url',
+    ['/store/categories', '/store/categories/notebook/products', '/store/categories/notebook/filter',
+     '/store/products/search?s=Laptop', '/store/product/{slug}']
+)
+def test_conditional_get(api_client, product_option_value, url, django_assert_num_queries,
+                         django_capture_on_commit_callbacks):
+    """ Test the read endpoints answer a matching If-None-Match with 304 until the data changes """
+
+    product = Product.objects.filter(name__startswith='Laptop').first()
+    url = url.format(slug=product.slug)
+    response = api_client.get(url)
+    etag = response['ETag']
+    assert response.status_code == 200
+    with django_assert_num_queries(1 if url.startswith('/store/product/') else 0):
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+    assert not response.content
+
+    product.price += 1
+    with django_capture_on_commit_callbacks(execute=True):
+        product.save()
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == (304 if url == '/store/categories' else 200)
+
+
+def test_conditional_get_product_last_modified(api_client, product):
+    url = f'/store/product/{product.slug}'
+    last_modified = api_client.get(url)['Last-Modified']
+    assert api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 304
+
+    Product.objects.filter(pk=product.pk).update(updated_at=product.updated_at + timedelta(minutes=1))
+    assert api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 200
+
+
+def test_conditional_get_favorites(api_client_authenticated, product, user_active,
+                                   django_capture_on_commit_callbacks):
+    """ Test the ETag follows the favorites of the user, as the responses carry the favorite flag """
+
+    url = f'/store/categories/{product.category.slug}/products'
+    etag = api_client_authenticated.get(url)['ETag']
+    with django_capture_on_commit_callbacks(execute=True):
+        product.favorites.create(user=user_active)
+    response = api_client_authenticated.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data['results'][0]['favorite'] is True
+
+
+def test_get_products_anonymous_cache(api_client, category, category_factory, product_factory,
+                                     product_option_value, django_assert_num_queries,
+                                     django_capture_on_commit_callbacks):
+    """ Test anonymous product lists are cached by the canonical query until the category's products change """
+
+    other_category = category_factory.create()
+    values = Value.objects.filter(products_values__product__category=category).distinct()[:2]
+    value_ids = [value.id for value in values]
+    url = f'/store/categories/{category.slug}/products'
+    query = {'value': f'{value_ids[1]},{value_ids[0]}', 'price_min': '1.0', 'limit': '2'}
+    response = api_client.get(url, query)
+
+    equivalent = {'value': f'{value_ids[0]},{value_ids[1]}, {value_ids[0]}', 'price_min': '1', 'limit': '2',
+                  'utm_source': 'mail'}
+    with django_assert_num_queries(0):
+        cached_response = api_client.get(url, equivalent)
+    assert cached_response.data['results'] == response.data['results']
+    if response.data['next']:
+        assert 'utm_source=mail' in cached_response.data['next']
+
+    # Products of other categories leave the entry in place
+    product_factory.create(category=other_category)
+    with django_assert_num_queries(0):
+        api_client.get(url, equivalent)
+
+    product = Product.objects.get(pk=response.data['results'][0]['id'])
+    product.name = 'Renamed product'
+    with django_capture_on_commit_callbacks() as callbacks:
+        product.save()
+    # Until the change is committed the entry is left as it is, nor is it refilled under a new version
+    with django_assert_num_queries(0):
+        assert api_client.get(url, equivalent).data['results'][0]['name'] != 'Renamed product'
+    for callback in callbacks:
+        callback()
+    response = api_client.get(url, equivalent)
+    assert response.data['results'][0]['name'] == 'Renamed product'
+
+
+def test_get_products_anonymous_cache_page_size(api_client, category, products):
+    """ Test the page size is part of the cache key as the paginator reads it """
+
+    url = f'/store/categories/{category.slug}/products'
+    assert len(api_client.get(url, {'limit': '2.0'}).data['results']) == KeysetPagination.page_size
+    assert len(api_client.get(url, {'limit': '2'}).data['results']) == 2
+    assert len(api_client.get(url, {'limit': '1e1'}).data['results']) == KeysetPagination.page_size
+
+
+def test_get_products_anonymous_cache_fields(api_client, category, products, django_assert_num_queries):
+    """ Test the field selection is part of the cache key, in any order """
+
+    url = f'/store/categories/{category.slug}/products'
+    response = api_client.get(url, {'fields': 'slug,id'})
+    assert list(response.data['results'][0]) == ['id', 'slug']
+    with django_assert_num_queries(0):
+        assert api_client.get(url, {'fields': 'id, slug,'}).data['results'] == response.data['results']
+    assert 'name' in api_client.get(url, {'fields': 'id,name'}).data['results'][0]
+
+
+def test_get_products_shared_cache(api_client_authenticated, category, products, favorite_product,
+                                   django_assert_num_queries):
+    """ Test lists without the favorite flag are shared by every user, with the ETag of anonymous requests """
+
+    url = f'/store/categories/{category.slug}/products'
+    response = APIClient().get(url, {'omit': 'favorite'})
+    assert 'favorite' not in response.data['results'][0]
+    assert 'public' in response['Cache-Control'] and 'no-cache' in response['Cache-Control']
+    assert response['Vary'] == 'Accept'
+
+    with django_assert_num_queries(1):
+        # Only the token lookup
+        shared_response = api_client_authenticated.get(url, {'omit': 'favorite'})
+    assert shared_response.data['results'] == response.data['results']
+    assert shared_response['ETag'] == response['ETag']
+    response = api_client_authenticated.get(url, {'omit': 'favorite'}, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+
+    personalized = api_client_authenticated.get(url)
+    assert personalized['ETag'] != response['ETag']
+    assert 'Cookie' in personalized['Vary'] and 'Cache-Control' not in personalized
+
+
+def test_get_products_most_wished(api_client, category, products, favorite_factory, user_active,
+                                  django_assert_num_queries, django_capture_on_commit_callbacks):
+    """ Test o=-favorites lists the most wished products first and follows the favorite counts """
+
+    url = f'/store/categories/{category.slug}/products'
+    favorite_factory.create_batch(3, product=products[2])
+    favorite_factory(product=products[4])
+    response = api_client.get(url, {'o': '-favorites'})
+    ids = [product['id'] for product in response.data['results']]
+    assert ids[:2] == [products[2].id, products[4].id]
+
+    etag = api_client.get(url)['ETag']
+    with django_capture_on_commit_callbacks(execute=True):
+        Favorite.objects.add(user_active, [products[5].slug])
+    # Only the lists ordered by the counts change
+    with django_assert_num_queries(0):
+        assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    assert api_client.get(url, {'o': '-favorites'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Favorite.objects.add(user_active, [products[4].slug])
+    ids = [product['id'] for product in api_client.get(url, {'o': '-favorites'}).data['results']]
+    assert ids[:3] == [products[2].id, products[4].id, products[5].id]
+
+
 @pytest.mark.parametrize(
     'client, expected_status',
     [
@@ -123,6 +566,104 @@ def test_favorite_product(product, api_client_authenticated, favorite_product):
     assert response.data == {'detail': 'User deleted product'}
 
 
+def test_favorite_product_single_statement(product, favorite_product, user_active, api_client_authenticated,
+                                           django_assert_num_queries, django_capture_on_commit_callbacks):
+    """ Test adding and removing a favorite take one statement and the count update besides the token lookup """
+
+    # The savepoint and its release are those of the test transaction
+    stamp = get_user_stamp(user_active)
+    with django_capture_on_commit_callbacks(execute=True), django_assert_num_queries(5):
+        response = api_client_authenticated.post(f'/store/product/{product.slug}/favorite')
+    assert response.status_code == 200
+    assert get_user_stamp(user_active) != stamp
+
+    stamp = get_user_stamp(user_active)
+    response = api_client_authenticated.post(f'/store/product/{product.slug}/favorite')
+    assert response.status_code == 400
+    assert Favorite.objects.filter(user=user_active, product=product).count() == 1
+    assert get_user_stamp(user_active) == stamp
+
+    with django_assert_num_queries(5):
+        response = api_client_authenticated.delete(f'/store/product/{product.slug}/favorite')
+    assert response.status_code == 200
+    assert not Favorite.objects.filter(user=user_active, product=product).exists()
+    assert Favorite.objects.filter(user=user_active, product=favorite_product).exists()
+
+
+def test_favorite_unique(favorite_product, user_active):
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Favorite.objects.create(user=user_active, product=favorite_product)
+
+
+def test_favorite_products_bulk(products, favorite_product, user_active, api_client_authenticated,
+                                django_assert_num_queries):
+    """ Test FavoriteProductBulkView adds and removes many products at once """
+
+    url = '/store/favorites/bulk'
+    add = [product.slug for product in products[:5]] + [favorite_product.slug, 'unknown']
+    # The token, the insert, the count update and the savepoints of the view and the statement
+    with django_assert_num_queries(7):
+        response = api_client_authenticated.post(url, {'add': add}, format='json')
+    assert response.status_code == 200
+    assert response.data == {'added': 5, 'removed': 0}
+    assert set(user_active.products_favorites.values_list('product_id', flat=True)) == {
+        product.id for product in [*products[:5], favorite_product]
+    }
+
+    response = api_client_authenticated.post(
+        url, {'add': [products[5].slug], 'remove': [products[0].slug, favorite_product.slug]}, format='json'
+    )
+    assert response.data == {'added': 1, 'removed': 2}
+    assert set(user_active.products_favorites.values_list('product_id', flat=True)) == {
+        product.id for product in products[1:6]
+    }
+
+
+@pytest.mark.parametrize('data', [{}, {'add': []}, {'add': ['a'], 'remove': ['a']}, {'add': ['a'] * 301}])
+def test_favorite_products_bulk_invalid(api_client_authenticated, data):
+    response = api_client_authenticated.post('/store/favorites/bulk', data, format='json')
+    assert response.status_code == 400
+
+
+def test_favorite_products_bulk_anonymous(api_client):
+    assert api_client.post('/store/favorites/bulk', {'add': ['a']}, format='json').status_code == 401
+
+
+def test_favorite_products_state(products, favorite_product, user_active, api_client_authenticated,
+                                 django_assert_num_queries, django_capture_on_commit_callbacks):
+    """ Test FavoriteProductStateView serves the cached favorites of the user, rebuilt when they change """
+
+    url = '/store/favorites'
+    ids = f'{products[0].id},{favorite_product.id},{products[-1].id + 1}'
+    response = api_client_authenticated.get(url, {'ids': ids})
+    assert response.data == {'ids': [favorite_product.id]}
+    assert api_client_authenticated.get(url).data == {'ids': [favorite_product.id]}
+    # Only the token lookup
+    with django_assert_num_queries(1):
+        assert api_client_authenticated.get(url, {'ids': ids}, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+    with django_assert_num_queries(1):
+        assert api_client_authenticated.get(url, {'ids': ids}).data == response.data
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        Favorite.objects.add(user_active, [products[0].slug])
+    # The cached favorites are served until the write is committed
+    assert api_client_authenticated.get(url, {'ids': ids}, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+    for callback in callbacks:
+        callback()
+    response = api_client_authenticated.get(url, {'ids': ids}, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 200
+    assert response.data == {'ids': sorted([products[0].id, favorite_product.id])}
+
+
+@pytest.mark.parametrize('ids', ['a', ','.join(map(str, range(1, 302)))])
+def test_favorite_products_state_invalid(api_client_authenticated, ids):
+    assert api_client_authenticated.get('/store/favorites', {'ids': ids}).status_code == 400
+
+
+def test_favorite_products_state_anonymous(api_client):
+    assert api_client.get('/store/favorites').status_code == 401
+
+
 def test_get_filters_products_by_category(category, product_filter, api_client_authenticated):
     """ Test ProductFilterListView list method """
 
@@ -132,6 +673,22 @@ def test_get_filters_products_by_category(category, product_filter, api_client_a
     assert 'price_min' in response.data
     assert 'price_max' in response.data
     assert 'options' in response.data
+    assert all('count' in value for option in response.data['options'] for value in option['values'])
+
+
+def test_get_filters_facet_counts(category, product_filter, api_client):
+    """ Test ProductFilterListView value counts follow the product list filters """
+
+    price_min_query, price_max_query = get_min_max_actual_prices(category)
+    value = Value.objects.filter(products_values__product__category=category).first()
+    query_params = {'price_min': price_min_query, 'price_max': price_max_query}
+
+    response = api_client.get(f'/store/categories/{category.slug}/filter', query_params)
+    counts = {v['id']: v['count'] for option in response.data['options'] for v in option['values']}
+
+    queryset = filter_by_price(Product.objects.filter(category=category), price_min_query, price_max_query)
+    assert response.status_code == 200
+    assert counts[value.id] == filter_by_values(queryset, str(value.id)).count()
 
 
 @pytest.mark.parametrize('order_price', ['-price', 'price', ])
@@ -153,9 +710,9 @@ def test_get_products_by_category_with_filter_product(api_client, category, prod
         'price_max': price_max_query
     }
 
-    url = f'/store/categories/{category.slug}/products?{query_params}'
-    response = api_client.get(url, query_params)
-    data = response.data
+    url = f'/store/categories/{category.slug}/products'
+    response = api_client.get(url, {**query_params, 'limit': COUNT_PRODUCTS})
+    data = response.data['results']
 
     queryset = get_filtered_products(category, order_price, search_query, values_str, price_min_query,
                                      price_max_query)
@@ -173,6 +730,34 @@ def test_get_products_by_category_with_filter_product(api_client, category, prod
     assert_response_prices_within_range(data, price_max_query, price_min_query)
 
 
+def test_search_products(api_client, products, product_factory):
+    """ Test ProductSearchView list method """
+
+    hidden = product_factory.create(name='Laptop hidden', is_published=False)
+    response = api_client.get('/store/products/search', {'s': 'laptop', 'limit': COUNT_PRODUCTS})
+    laptops = [product for product in products if product.name.startswith('Laptop')]
+    assert response.status_code == 200
+    assert {product['id'] for product in response.data['results']} == {product.id for product in laptops}
+    assert hidden.id not in {product['id'] for product in response.data['results']}
+
+    response = api_client.get('/store/products/search')
+    assert response.data['results'] == []
+
+
+def test_search_products_pages_on_tied_ranks(api_client, category, product_factory):
+    """ Test the search pages walk every product once when their ranks tie """
+
+    products = product_factory.create_batch(5, name=factory.Sequence(lambda n: f'Laptop {n}'),
+                                            description='Fast machine', category=category)
+    response = api_client.get('/store/products/search', {'s': 'laptop', 'limit': 2})
+    pages = [response.data]
+    # Bounded, repeated rows would page forever
+    while pages[-1]['next'] and len(pages) <= len(products):
+        pages.append(api_client.get(pages[-1]['next']).data)
+    ids = [product['id'] for page in pages for product in page['results']]
+    assert sorted(ids) == sorted(product.id for product in products)
+
+
 def get_actual_prices(category):
     return (
         Product.objects.filter(category=category)